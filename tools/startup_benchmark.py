@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Measure the startup time of the tripleoclient commands.
+
+For every command registered in the ``openstack.tripleoclient.v2`` entry
+point group, the import time of its module and the latency of
+``openstack <command> --help`` are measured in fresh interpreters. The
+import time only accounts for what the module adds on top of the modules
+the openstack client always loads.
+
+The script exits with a non-zero code when a measure crosses the absolute
+thresholds, or regressed by more than the tolerance compared to a baseline
+written by a previous run with ``--output``::
+
+    tools/startup_benchmark.py --output startup.json
+    tools/startup_benchmark.py --baseline startup.json
+"""
+
+import argparse
+import collections
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from six.moves import configparser
+
+
+GROUP = 'openstack.tripleoclient.v2'
+
+# Modules loaded by the openstack client before any command module.
+PRELOADED = ('osc_lib.command.command', 'osc_lib.utils')
+
+IMPORT_SCRIPT = """
+import sys
+import time
+for name in sys.argv[2:]:
+    __import__(name)
+start = time.time()
+__import__(sys.argv[1])
+print(time.time() - start)
+"""
+
+
+def get_commands(setup_cfg):
+    """Return the command names and modules of the entry point group.
+
+    The installed entry points are used, or the ones of the setup.cfg of
+    the source tree when the package isn't installed.
+    """
+
+    commands = collections.OrderedDict()
+    try:
+        import pkg_resources
+        for entry_point in pkg_resources.iter_entry_points(GROUP):
+            commands[entry_point.name] = entry_point.module_name
+    except ImportError:
+        pass
+    if commands:
+        return commands
+
+    config = configparser.ConfigParser()
+    config.read(setup_cfg)
+    for line in config.get('entry_points', GROUP).splitlines():
+        if '=' not in line:
+            continue
+        name, target = [i.strip() for i in line.split('=', 1)]
+        commands[name] = target.split(':')[0]
+    return commands
+
+
+def _best_of(repeat, func):
+    return min(func() for _ in range(repeat))
+
+
+def measure_import(module, repeat):
+    def _run():
+        out = subprocess.check_output(
+            [sys.executable, '-c', IMPORT_SCRIPT, module] + list(PRELOADED))
+        return float(out.decode('utf-8').strip().splitlines()[-1])
+    return _best_of(repeat, _run)
+
+
+def measure_help(command, repeat):
+    argv = ['openstack'] + command.split('_') + ['--help']
+
+    def _run():
+        start = time.time()
+        subprocess.check_call(argv, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+        return time.time() - start
+    return _best_of(repeat, _run)
+
+
+def check(results, baseline, max_import, max_help, tolerance):
+    """Return the list of threshold violations and regressions."""
+
+    failures = []
+    for kind, limit in (('import', max_import), ('help', max_help)):
+        for name, value in results[kind].items():
+            if limit and value > limit:
+                failures.append('{} {}: {:.3f}s > {:.3f}s'.format(
+                    kind, name, value, limit))
+            previous = baseline.get(kind, {}).get(name)
+            if previous and value > previous * (1 + tolerance):
+                failures.append(
+                    '{} {}: {:.3f}s, was {:.3f}s (+{:.0f}%)'.format(
+                        kind, name, value, previous,
+                        (value / previous - 1) * 100))
+    return failures
+
+
+def main(argv=None):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filter', default='.*',
+                        help='Only measure the commands matching this '
+                             'regular expression.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per measure, the fastest one is kept.')
+    parser.add_argument('--skip-help', action='store_true',
+                        help='Only measure the import time of the modules.')
+    parser.add_argument('--max-import', type=float, default=0.5,
+                        help='Maximum import time of a command module in '
+                             'seconds, 0 to disable.')
+    parser.add_argument('--max-help', type=float, default=3.0,
+                        help='Maximum --help latency of a command in '
+                             'seconds, 0 to disable.')
+    parser.add_argument('--baseline',
+                        help='Results of a previous run to compare with.')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown compared to the baseline, '
+                             'as a ratio.')
+    parser.add_argument('--output', help='Write the results to this file.')
+    parser.add_argument('--setup-cfg',
+                        default=os.path.join(root, 'setup.cfg'),
+                        help='setup.cfg to read the commands from when '
+                             'the package is not installed.')
+    args = parser.parse_args(argv)
+
+    pattern = re.compile(args.filter)
+    commands = collections.OrderedDict(
+        (k, v) for k, v in get_commands(args.setup_cfg).items()
+        if pattern.search(k))
+    results = {'import': collections.OrderedDict(),
+               'help': collections.OrderedDict()}
+
+    errors = []
+    measures = [('import', module, measure_import)
+                for module in sorted(set(commands.values()))]
+    if not args.skip_help:
+        measures.extend(('help', name, measure_help) for name in commands)
+    for kind, name, measure in measures:
+        try:
+            results[kind][name] = measure(name, args.repeat)
+        except subprocess.CalledProcessError:
+            errors.append('{} {}: command failed'.format(kind, name))
+            continue
+        print('{:<6} {:<55} {:.3f}s'.format(kind, name, results[kind][name]))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failures = errors + check(results, baseline, args.max_import,
+                              args.max_help, args.tolerance)
+    for failure in failures:
+        print('FAILED: ' + failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -18,9 +18,8 @@ import logging
 from osc_lib.command import command
 from osc_lib import exceptions as oscexc
 
-from tripleo_common.utils import config
-
 from tripleoclient import exceptions
+from tripleoclient import profiling
 from tripleoclient import utils
 
 
@@ -28,10 +27,23 @@ class Command(command.Command):
 
     log = logging.getLogger(__name__ + ".Command")
 
+    def __init__(self, app, app_args, cmd_name=None):
+        super(Command, self).__init__(app, app_args, cmd_name=cmd_name)
+        client_manager = getattr(app, 'client_manager', None)
+        if client_manager is not None and utils.token_cache_enabled():
+            utils.cache_client_manager_auth(client_manager)
+
     def run(self, parsed_args):
         utils.store_cli_param(self.cmd_name, parsed_args)
+        if utils.token_cache_enabled():
+            auth = getattr(getattr(self.app, 'client_manager', None),
+                           'auth', None)
+            if getattr(auth, 'auth_ref', None):
+                utils.save_auth_state(auth)
         try:
-            super(Command, self).run(parsed_args)
+            with profiling.profile_command(
+                    self.cmd_name, profiling.get_profile_dir(self.app)):
+                super(Command, self).run(parsed_args)
         except (oscexc.CommandError, exceptions.Base):
             raise
         except Exception:
@@ -55,6 +67,7 @@ class Command(command.Command):
         """
 
         if no_workflow:
+            from tripleo_common.utils import config
             key = utils.get_key(stack=stack)
             stack_config = config.Config(orchestration)
             with utils.TempDirs(chdir=False) as tmp:
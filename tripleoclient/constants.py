@@ -28,6 +28,8 @@ MINION_CONF_PATH = os.path.join(MINION_OUTPUT_DIR, "minion.conf")
 MINION_LOG_FILE = "install-minion.log"
 UNDERCLOUD_ROLES_FILE = "roles_data_undercloud.yaml"
 STANDALONE_EPHEMERAL_STACK_VSTATE = '/var/lib/tripleo-heat-installer'
+STANDALONE_EPHEMERAL_HEAT_STATE = os.path.join(
+    STANDALONE_EPHEMERAL_STACK_VSTATE, 'heat-state')
 UNDERCLOUD_LOG_FILE = "install-undercloud.log"
 OVERCLOUD_NETWORKS_FILE = "network_data.yaml"
 STANDALONE_NETWORKS_FILE = "/dev/null"
@@ -52,6 +54,48 @@ USER_PARAMETERS = 'user-environments/tripleoclient-parameters.yaml'
 # This directory may contain additional environments to use during deploy
 DEFAULT_ENV_DIRECTORY = os.path.join(os.environ.get('HOME', '~/'),
                                      '.tripleo', 'environments')
+# Outputs, parameters and environment of deployed stacks, cached per stack
+# version so that consecutive commands don't download them again.
+STACK_METADATA_CACHE_DIR = os.path.join(os.environ.get('HOME', '~/'),
+                                        '.tripleo', 'stack-cache')
+# Processed environment files, keyed on their content
+ENV_CACHE_DIR = os.path.join(os.environ.get('HOME', '~/'),
+                             '.tripleo', 'env-cache')
+# Templates rendered from jinja, keyed on the content of the templates tree
+RENDER_CACHE_DIR = os.path.join(os.environ.get('HOME', '~/'),
+                                '.tripleo', 'render-cache')
+RENDER_CACHE_ENTRIES = 5
+# Compression of the deployment artifacts tarball: the file extension, the
+# multi-threaded compressors tried in order and the tarfile fallback.
+ARTIFACT_COMPRESSION = {
+    'bzip2': ('tar.bzip2', [['lbzip2'], ['pbzip2']], 'bz2'),
+    'gzip': ('tar.gz', [['pigz']], 'gz'),
+    'zstd': ('tar.zst', [['zstd', '-T0', '-q']], None),
+}
+DEFAULT_ARTIFACT_COMPRESSION = 'bzip2'
+# Content addressed store of the deployment artifacts
+ARTIFACT_STORE_DIR = os.path.join(os.environ.get('HOME', '~/'),
+                                  '.tripleo', 'artifact-store')
+# Heat uid/gid and database schema snapshots of ephemeral Heat images
+HEAT_LAUNCHER_CACHE_DIR = os.path.join(os.environ.get('HOME', '~/'),
+                                       '.tripleo', 'heat-launcher')
+# Keystone tokens and service catalogs reused across CLI invocations when
+# OS_TRIPLEOCLIENT_TOKEN_CACHE is enabled
+TOKEN_CACHE_DIR = os.path.join(os.environ.get('HOME', '~/'),
+                               '.tripleo', 'token-cache')
+# Cached tokens expiring within this many seconds are not reused
+TOKEN_CACHE_MARGIN = 300
+# md5 and sha256 checksums of files, keyed on their path, device, inode,
+# size and modification time
+CHECKSUM_CACHE_DIR = os.path.join(os.environ.get('HOME', '~/'),
+                                  '.tripleo', 'checksum-cache')
+# Files modified less than this many seconds ago are not cached, they could
+# change again without their modification time changing.
+CHECKSUM_CACHE_MIN_AGE = 2
+# Records of the qcow2 images converted to raw for upload, keyed on the
+# path of the raw image
+IMAGE_CONVERT_CACHE_DIR = os.path.join(os.environ.get('HOME', '~/'),
+                                       '.tripleo', 'image-convert-cache')
 DEPLOYED_SERVER_ENVIRONMENT = 'environments/deployed-server-environment.yaml'
 TRIPLEO_PUPPET_MODULES = "/usr/share/openstack-puppet/modules/"
 PUPPET_MODULES = "/etc/puppet/modules/"
@@ -61,6 +105,10 @@ STACK_TIMEOUT = 240
 
 IRONIC_HTTP_BOOT_BIND_MOUNT = '/var/lib/ironic/httpboot'
 IRONIC_LOCAL_IMAGE_PATH = '/var/lib/ironic/images'
+# Images uploaded at the same time by overcloud image upload, and the size
+# of the chunks they are streamed in
+IMAGE_UPLOAD_CONCURRENCY = 4
+IMAGE_UPLOAD_CHUNK_SIZE = 1048576
 
 # The default minor update ansible playbooks generated from heat stack output
 MINOR_UPDATE_PLAYBOOKS = ['update_steps_playbook.yaml']
@@ -0,0 +1,298 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Serve openstack commands from a warm process over a UNIX socket.
+
+``tripleoclient-daemon`` imports the openstack client, the tripleoclient
+commands and their dependencies once, then forks a child per request so
+each command runs in a fresh copy of the warm process. ``tripleoclient-run``
+is the client: it forwards its arguments, environment, working directory
+and standard streams to the daemon, and falls back to running
+``openstack`` directly when no daemon is listening.
+
+Only the standard library is imported at module level, so the client
+starts as fast as the interpreter.
+"""
+
+import argparse
+import array
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import sys
+import time
+
+
+LOG = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = 1
+
+DEFAULT_SOCKET = os.path.join(os.environ.get('HOME', '~/'), '.tripleo',
+                              'tripleoclient.sock')
+
+# Entry point groups whose commands are imported by the daemon on start.
+WARM_ENTRY_POINTS = ('openstack.tripleoclient.v2',)
+
+_FDS = array.array('i', [0, 1, 2])
+
+# Signals the client forwards to the process running its command.
+FORWARDED_SIGNALS = (signal.SIGINT, signal.SIGTERM, signal.SIGHUP)
+
+
+def _send(conn, message, fds=None):
+    data = json.dumps(message).encode('utf-8') + b'\n'
+    if fds is None:
+        conn.sendall(data)
+        return
+    sent = conn.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                                  fds)])
+    conn.sendall(data[sent:])
+
+
+class _Reader(object):
+    """Read newline delimited JSON messages from a socket."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.buffer = b''
+        self.fds = []
+
+    def _recv(self):
+        data, ancdata, flags, addr = self.conn.recvmsg(
+            65536, socket.CMSG_SPACE(len(_FDS) * _FDS.itemsize))
+        for level, kind, cmsg_data in ancdata:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                fds = array.array('i')
+                fds.frombytes(cmsg_data[:len(cmsg_data) -
+                                        (len(cmsg_data) % fds.itemsize)])
+                self.fds.extend(fds)
+        return data
+
+    def read(self):
+        while b'\n' not in self.buffer:
+            data = self._recv()
+            if not data:
+                return None
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return json.loads(line.decode('utf-8'))
+
+
+def _peer_uid(conn):
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                            struct.calcsize('3i'))
+    return struct.unpack('3i', creds)[1]
+
+
+def warm_up(groups=WARM_ENTRY_POINTS):
+    """Import the openstack client and the commands served by the daemon.
+
+    :param groups: Entry point groups of the commands to import.
+    :type groups: Tuple
+
+    :returns: The openstack client shell module.
+    """
+
+    import pkg_resources
+
+    from openstackclient import shell
+
+    for group in groups:
+        for entry_point in pkg_resources.iter_entry_points(group):
+            try:
+                entry_point.resolve()
+            except Exception as e:
+                LOG.warning('Unable to import %s: %s', entry_point, e)
+    return shell
+
+
+def _run_request(conn, shell):
+    """Run the command of a request in the current (forked) process."""
+
+    reader = _Reader(conn)
+    request = reader.read()
+    fds = reader.fds
+    if (not request or request.get('version') != PROTOCOL_VERSION or
+            len(fds) != len(_FDS)):
+        LOG.error('Invalid request')
+        return 1
+
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    os.chdir(request['cwd'])
+    os.environ.clear()
+    os.environ.update(request['env'])
+    # The openstack shell sets up its own logging for the command.
+    logging.getLogger().handlers = []
+    _send(conn, {'pid': os.getpid()})
+
+    try:
+        rc = shell.main(request['argv'])
+    except SystemExit as e:
+        # Like the interpreter: no code is a success, anything else than an
+        # integer is a failure.
+        if e.code is None:
+            rc = 0
+        elif isinstance(e.code, int):
+            rc = e.code
+        else:
+            rc = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    _send(conn, {'rc': rc})
+    return rc
+
+
+def _reap():
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except OSError:
+            return
+        if not pid:
+            return
+
+
+def serve(socket_path=DEFAULT_SOCKET, idle_timeout=None):
+    """Serve commands until idle for idle_timeout seconds.
+
+    :param socket_path: Path of the UNIX socket to listen on.
+    :type socket_path: String
+
+    :param idle_timeout: Seconds without request before exiting, never
+                         exit when not set.
+    :type idle_timeout: Integer
+    """
+
+    shell = warm_up()
+
+    socket_dir = os.path.dirname(socket_path)
+    if not os.path.isdir(socket_dir):
+        os.makedirs(socket_dir, mode=0o700)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(old_umask)
+    server.listen(16)
+    server.settimeout(1)
+    LOG.info('Serving openstack commands on %s', socket_path)
+
+    last_request = time.time()
+    try:
+        while True:
+            _reap()
+            try:
+                conn, addr = server.accept()
+            except socket.timeout:
+                if idle_timeout and time.time() - last_request > idle_timeout:
+                    LOG.info('Idle for %s seconds, exiting', idle_timeout)
+                    return
+                continue
+            last_request = time.time()
+            conn.settimeout(None)
+            if _peer_uid(conn) != os.getuid():
+                LOG.warning('Rejecting request from another user')
+                conn.close()
+                continue
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                server.close()
+                rc = 1
+                try:
+                    rc = _run_request(conn, shell)
+                finally:
+                    os._exit(rc if isinstance(rc, int) else 1)
+            conn.close()
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def run(argv, socket_path=DEFAULT_SOCKET):
+    """Run an openstack command through the daemon.
+
+    :param argv: Arguments of the openstack command.
+    :type argv: List
+
+    :param socket_path: Path of the UNIX socket of the daemon.
+    :type socket_path: String
+
+    :returns: Exit code of the command, or None when no daemon is
+              listening.
+    """
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except (IOError, OSError):
+        conn.close()
+        return None
+
+    with conn:
+        _send(conn, {'version': PROTOCOL_VERSION,
+                     'argv': list(argv),
+                     'cwd': os.getcwd(),
+                     'env': dict(os.environ)}, fds=_FDS)
+        reader = _Reader(conn)
+        started = reader.read()
+        if not started:
+            return 1
+
+        def forward(signum, frame):
+            os.kill(started['pid'], signum)
+
+        for signum in FORWARDED_SIGNALS:
+            signal.signal(signum, forward)
+        result = reader.read()
+        return result['rc'] if result else 1
+
+
+def client_main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    rc = run(argv, os.environ.get('TRIPLEOCLIENT_SOCKET', DEFAULT_SOCKET))
+    if rc is None:
+        os.execvp('openstack', ['openstack'] + list(argv))
+    return rc
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serve openstack commands from a warm process. Run '
+                    'the commands with tripleoclient-run.')
+    parser.add_argument(
+        '--socket', default=os.environ.get('TRIPLEOCLIENT_SOCKET',
+                                           DEFAULT_SOCKET),
+        help='Path of the UNIX socket to listen on (Env: '
+             'TRIPLEOCLIENT_SOCKET, default: %(default)s).')
+    parser.add_argument(
+        '--idle-timeout', type=int, default=None,
+        help='Exit after this many seconds without request.')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    serve(args.socket, args.idle_timeout)
+    return 0
@@ -18,7 +18,6 @@ import json
 import logging
 import os
 import re
-import yaml
 
 from osc_lib.i18n import _
 
@@ -26,6 +25,7 @@ from tripleo_common import constants as tripleo_common_constants
 from tripleo_common.utils import swift as swiftutils
 from tripleoclient import constants
 from tripleoclient import utils as oooutils
+from tripleoclient import yaml_utils
 
 
 LOG = logging.getLogger(__name__ + ".utils")
@@ -40,7 +40,7 @@ def export_passwords(swift, stack, excludes=True):
         container=container,
         object_name=obj
     )
-    data = yaml.safe_load(content)
+    data = yaml_utils.safe_load(content)
     # The "passwords" key in plan-environment.yaml are generated passwords,
     # they are not necessarily the actual password values used during the
     # deployment.
@@ -101,7 +101,7 @@ def export_stack(heat, stack, should_filter=False,
     }
 
     data = {}
-    heat_stack = oooutils.get_stack(heat, stack)
+    heat_stack = oooutils.get_stack(heat, stack, resolve_outputs=False)
 
     for export_key, export_param in export_data.items():
         param = export_param["parameter"]
@@ -146,7 +146,7 @@ def export_storage_ips(stack, config_download_dir=constants.DEFAULT_WORK_DIR):
     file = os.path.join(config_download_dir, stack, inventory_file)
     with open(file, 'r') as ff:
         try:
-            inventory_data = yaml.safe_load(ff)
+            inventory_data = yaml_utils.safe_load(ff)
         except Exception as e:
             LOG.error(
                 _('Could not read file %s') % file)
@@ -174,7 +174,7 @@ def export_ceph(stack, cephx,
     file = os.path.join(config_download_dir, stack, ceph_ansible_all)
     with open(file, 'r') as ff:
         try:
-            ceph_data = yaml.safe_load(ff)
+            ceph_data = yaml_utils.safe_load(ff)
         except Exception as e:
             LOG.error(
                 _('Could not read file %s') % file)
@@ -19,14 +19,26 @@ import json
 import logging
 import os
 import pwd
+import shutil
 import signal
+import sqlite3
 import subprocess
 import tempfile
 
 from oslo_utils import timeutils
 
+from tripleoclient import constants
+
 log = logging.getLogger(__name__)
 
+# Format of the heat state saved between runs.
+HEAT_STATE_VERSION = 1
+HEAT_STATE_DB = 'heat.sqlite.db'
+HEAT_STATE_META = 'state.json'
+
+# Seconds a connection waits on a locked sqlite database before failing.
+SQLITE_BUSY_TIMEOUT = 60
+
 NEXT_DAY = (timeutils.utcnow() + datetime.timedelta(days=2)).isoformat()
 
 FAKE_TOKEN_RESPONSE = {
@@ -165,13 +177,157 @@ class HeatBaseLauncher(object):
         self.config_file = os.path.join(self.install_tmp, 'heat.conf')
         self.paste_file = os.path.join(self.install_tmp, 'api-paste.ini')
         self.token_file = os.path.join(self.install_tmp, 'token_file.json')
+        self.state_restored = False
+        self.state_current = False
         self._write_fake_keystone_token(self.api_port, self.token_file)
         self._write_heat_config()
-        uid = int(self.get_heat_uid())
-        gid = int(self.get_heat_gid())
-        os.chown(self.install_tmp, uid, gid)
-        os.chown(self.config_file, uid, gid)
-        os.chown(self.paste_file, uid, gid)
+        self.uid = int(self.get_heat_uid())
+        self.gid = int(self.get_heat_gid())
+        os.chown(self.install_tmp, self.uid, self.gid)
+        os.chown(self.config_file, self.uid, self.gid)
+        os.chown(self.paste_file, self.uid, self.gid)
+
+    def _cache_key(self):
+        """Identify the heat version for the cached launcher data.
+
+        Returns None when the heat version can't be identified, in which
+        case nothing is cached.
+        """
+        return None
+
+    def _cache_path(self, suffix):
+        return os.path.join(constants.HEAT_LAUNCHER_CACHE_DIR,
+                            '%s%s' % (self._cache_key(), suffix))
+
+    def _restore_db_snapshot(self):
+        """Seed the database from a schema snapshot of the same heat.
+
+        :returns: True when the database has been restored.
+        """
+        if not self._cache_key():
+            return False
+        snapshot = self._cache_path('.sqlite')
+        if not os.path.isfile(snapshot):
+            return False
+        db = '%s.db' % self.sql_db
+        shutil.copyfile(snapshot, db)
+        os.chown(db, self.uid, self.gid)
+        log.info('Restored heat database schema from %s' % snapshot)
+        return True
+
+    def _save_db_snapshot(self):
+        if not self._cache_key():
+            return
+        snapshot = self._cache_path('.sqlite')
+        try:
+            if not os.path.isdir(constants.HEAT_LAUNCHER_CACHE_DIR):
+                os.makedirs(constants.HEAT_LAUNCHER_CACHE_DIR, mode=0o700)
+            shutil.copyfile('%s.db' % self.sql_db, snapshot + '.tmp')
+            os.rename(snapshot + '.tmp', snapshot)
+        except (IOError, OSError) as e:
+            log.warning('Unable to save heat database snapshot: %s' % e)
+
+    def _enable_db_wal(self):
+        """Switch the heat database to write-ahead logging.
+
+        With WAL readers don't block the writer (and the other way around),
+        which avoids the "database is locked" errors and stalls the default
+        rollback journal causes when the API and the engine green threads
+        hit the database concurrently. The journal mode is persistent, so
+        it is also kept in the schema snapshot.
+        """
+        db = '%s.db' % self.sql_db
+        try:
+            conn = sqlite3.connect(db, timeout=SQLITE_BUSY_TIMEOUT)
+            try:
+                mode = conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            log.warning('Unable to enable WAL on %s: %s' % (db, e))
+            return
+        if mode.lower() != 'wal':
+            log.warning('Unable to enable WAL on %s, journal mode is %s' %
+                        (db, mode))
+            return
+        for path in (db, db + '-wal', db + '-shm'):
+            if os.path.exists(path):
+                os.chown(path, self.uid, self.gid)
+
+    def restore_state(self, state_dir):
+        """Seed the database with the heat state saved by a previous run.
+
+        This has to be called before heat_db_sync. A state saved by a
+        different heat is still restored, heat_db_sync then upgrades its
+        schema.
+
+        :param state_dir: Directory the state has been saved into.
+        :type state_dir: String
+
+        :returns: True when the state has been restored.
+        """
+        meta_file = os.path.join(state_dir, HEAT_STATE_META)
+        state_db = os.path.join(state_dir, HEAT_STATE_DB)
+        try:
+            with open(meta_file, 'r') as f:
+                meta = json.load(f)
+        except (IOError, OSError, ValueError):
+            log.info('No heat state to restore from %s' % state_dir)
+            return False
+        if (meta.get('version') != HEAT_STATE_VERSION or
+                not os.path.isfile(state_db)):
+            log.warning('Ignoring unusable heat state in %s' % state_dir)
+            return False
+
+        db = '%s.db' % self.sql_db
+        shutil.copyfile(state_db, db)
+        os.chown(db, self.uid, self.gid)
+        self.state_restored = True
+        self.state_current = bool(self._cache_key() and
+                                  meta.get('heat') == self._cache_key())
+        log.info('Restored heat state saved on %s from %s' %
+                 (meta.get('saved'), state_dir))
+        return True
+
+    def save_state(self, state_dir):
+        """Save the heat state so the next run can restore it.
+
+        Heat must be stopped so the database is consistent.
+
+        :param state_dir: Directory to save the state into.
+        :type state_dir: String
+
+        :returns: True when the state has been saved.
+        """
+        db = '%s.db' % self.sql_db
+        if not os.path.isfile(db):
+            return False
+        state_db = os.path.join(state_dir, HEAT_STATE_DB)
+        meta_file = os.path.join(state_dir, HEAT_STATE_META)
+        try:
+            if not os.path.isdir(state_dir):
+                os.makedirs(state_dir, mode=0o700)
+            # Fold the write-ahead log back into the database file.
+            conn = sqlite3.connect(db, timeout=SQLITE_BUSY_TIMEOUT)
+            try:
+                conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            finally:
+                conn.close()
+            shutil.copyfile(db, state_db + '.tmp')
+            os.chmod(state_db + '.tmp', 0o600)
+            os.rename(state_db + '.tmp', state_db)
+            with open(meta_file + '.tmp', 'w') as f:
+                json.dump({'version': HEAT_STATE_VERSION,
+                           'heat': self._cache_key(),
+                           'saved': datetime.datetime.utcnow().isoformat()},
+                          f)
+            os.rename(meta_file + '.tmp', meta_file)
+        except (IOError, OSError, sqlite3.Error) as e:
+            log.warning('Unable to save heat state to %s: %s' %
+                        (state_dir, e))
+            return False
+        log.info('Saved heat state to %s' % state_dir)
+        return True
 
     def _write_heat_config(self):
         # TODO(ksambor) It will be nice to have possibilities to configure heat
@@ -203,7 +359,7 @@ bind_host = 127.0.0.1
 bind_port = %(api_port)s
 
 [database]
-connection = sqlite:///%(sqlite_db)s.db
+connection = sqlite:///%(sqlite_db)s.db?timeout=%(busy_timeout)s
 
 [paste_deploy]
 flavor = noauth
@@ -215,7 +371,8 @@ policy_file = %(policy_file)s
 [yaql]
 memory_quota=900000
 limit_iterators=9000
-        ''' % {'sqlite_db': self.sql_db, 'log_file': self.log_file,
+        ''' % {'sqlite_db': self.sql_db, 'busy_timeout': SQLITE_BUSY_TIMEOUT,
+               'log_file': self.log_file,
                'api_port': self.api_port, 'policy_file': self.policy_file,
                'token_file': self.token_file}
         with open(self.config_file, 'w') as temp_file:
@@ -250,11 +407,47 @@ class HeatContainerLauncher(HeatBaseLauncher):
     def __init__(self, api_port, container_image, user='heat',
                  heat_dir='/var/log/heat-launcher'):
         self.container_image = container_image
+        self.user = user
+        self._heat_ids = None
         self._fetch_container_image()
+        self.image_id = self._inspect_image('{{.Id}}')
         super(HeatContainerLauncher, self).__init__(api_port, container_image,
                                                     user, heat_dir)
 
+    def _cache_key(self):
+        return self.image_id
+
+    def _inspect_image(self, fmt):
+        cmd = ['podman', 'image', 'inspect', '--format', fmt,
+               self.container_image]
+        log.debug(' '.join(cmd))
+        try:
+            return subprocess.check_output(
+                cmd, stderr=subprocess.PIPE,
+                universal_newlines=True).strip() or None
+        except (subprocess.CalledProcessError, OSError):
+            return None
+
+    def _local_image_is_current(self):
+        local_digest = self._inspect_image('{{.Digest}}')
+        if not local_digest or not shutil.which('skopeo'):
+            return False
+        cmd = ['skopeo', 'inspect', '--format', '{{.Digest}}',
+               'docker://%s' % self.container_image]
+        log.debug(' '.join(cmd))
+        try:
+            remote_digest = subprocess.check_output(
+                cmd, stderr=subprocess.PIPE,
+                universal_newlines=True).strip()
+        except (subprocess.CalledProcessError, OSError):
+            return False
+        return local_digest == remote_digest
+
     def _fetch_container_image(self):
+        if self._local_image_is_current():
+            log.info('Container image %s is up to date, skipping pull' %
+                     self.container_image)
+            return
         # force pull of latest container image
         cmd = ['podman', 'pull', self.container_image]
         log.debug(' '.join(cmd))
@@ -285,6 +478,10 @@ class HeatContainerLauncher(HeatBaseLauncher):
         os.execvp('podman', cmd)
 
     def heat_db_sync(self):
+        if self.state_current or (not self.state_restored and
+                                  self._restore_db_snapshot()):
+            self._enable_db_wal()
+            return
 
         cmd = [
             'podman', 'run', '--rm',
@@ -297,34 +494,56 @@ class HeatContainerLauncher(HeatBaseLauncher):
             'heat-manage', 'db_sync']
         log.debug(' '.join(cmd))
         subprocess.check_call(cmd)
+        self._enable_db_wal()
+        if not self.state_restored:
+            self._save_db_snapshot()
+
+    def _get_heat_ids(self):
+        """Return the heat (uid, gid) of the image.
+
+        Both are looked up with a single container run and cached per
+        image ID.
+        """
+        if self._heat_ids:
+            return self._heat_ids
+        cache = self._cache_path('-%s.json' % self.user)
+        if self.image_id and os.path.isfile(cache):
+            with open(cache, 'r') as f:
+                self._heat_ids = tuple(json.load(f))
+            return self._heat_ids
 
-    def get_heat_uid(self):
         cmd = [
             'podman', 'run', '--rm',
             self.container_image,
-            'getent', 'passwd', self.user
+            'sh', '-c',
+            'getent passwd "$1" || echo; getent group "$1" || echo',
+            'getent', self.user
         ]
         log.debug(' '.join(cmd))
         p = subprocess.Popen(cmd, stdout=subprocess.PIPE,
                              universal_newlines=True)
-        result = p.communicate()[0]
-        if result:
-            return result.split(':')[2]
-        raise Exception('Could not find heat uid')
+        result = p.communicate()[0].splitlines() + ['', '']
+        if not result[0]:
+            raise Exception('Could not find heat uid')
+        if not result[1]:
+            raise Exception('Could not find heat gid')
+        self._heat_ids = (result[0].split(':')[2], result[1].split(':')[2])
+        if self.image_id:
+            try:
+                if not os.path.isdir(constants.HEAT_LAUNCHER_CACHE_DIR):
+                    os.makedirs(constants.HEAT_LAUNCHER_CACHE_DIR,
+                                mode=0o700)
+                with open(cache, 'w') as f:
+                    json.dump(self._heat_ids, f)
+            except (IOError, OSError) as e:
+                log.warning('Unable to cache heat uid and gid: %s' % e)
+        return self._heat_ids
+
+    def get_heat_uid(self):
+        return self._get_heat_ids()[0]
 
     def get_heat_gid(self):
-        cmd = [
-            'podman', 'run', '--rm',
-            self.container_image,
-            'getent', 'group', self.user
-        ]
-        log.debug(' '.join(cmd))
-        p = subprocess.Popen(cmd, stdout=subprocess.PIPE,
-                             universal_newlines=True)
-        result = p.communicate()[0]
-        if result:
-            return result.split(':')[2]
-        raise Exception('Could not find heat gid')
+        return self._get_heat_ids()[1]
 
     def kill_heat(self, pid):
         cmd = ['podman', 'stop', 'heat_all']
@@ -346,6 +565,7 @@ class HeatNativeLauncher(HeatBaseLauncher):
     def heat_db_sync(self):
         subprocess.check_call(['heat-manage', '--config-file',
                                self.config_file, 'db_sync'])
+        self._enable_db_wal()
 
     def get_heat_uid(self):
         return pwd.getpwnam(self.user).pw_uid
@@ -18,7 +18,6 @@
 import logging
 
 from osc_lib import utils
-from swiftclient import client as swift_client
 
 LOG = logging.getLogger(__name__)
 
@@ -56,6 +55,14 @@ def build_option_parser(parser):
         help='TripleO Client API version, default=' +
              DEFAULT_TRIPLEOCLIENT_API_VERSION +
              ' (Env: OS_TRIPLEOCLIENT_API_VERSION)')
+    parser.add_argument(
+        '--os-tripleoclient-profile',
+        metavar='<directory>',
+        default=utils.env('OS_TRIPLEOCLIENT_PROFILE'),
+        help='Profile TripleO commands with cProfile and record the time '
+             'spent in their main phases. The statistics and the phase '
+             'timings are written to this directory '
+             '(Env: OS_TRIPLEOCLIENT_PROFILE)')
     return parser
 
 
@@ -189,5 +196,6 @@ class ClientWrapper(object):
             'preauthtoken': token
         }
 
+        from swiftclient import client as swift_client
         self._object_store = swift_client.Connection(**kwargs)
         return self._object_store
@@ -0,0 +1,498 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import collections
+import contextlib
+import cProfile
+import datetime
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+
+import six
+
+
+LOG = logging.getLogger(__name__ + ".profiling")
+
+ANSIBLE_PROFILE_FILE = '{}-ansible-profile.jsonl'
+
+# ansible-runner events which mark the end of a task on a given host.
+TASK_END_EVENTS = {
+    'runner_on_ok': False,
+    'runner_on_skipped': False,
+    'runner_on_failed': True,
+    'runner_on_unreachable': True,
+}
+
+
+def get_ansible_profile_path(stack, output_dir):
+    """Return the path of the ansible profile timeline for a stack.
+
+    The timeline is stored next to the config-download directory of the
+    stack.
+
+    :param stack: Stack name.
+    :type stack: String
+
+    :param output_dir: Config download output directory.
+    :type output_dir: String
+
+    :returns: String
+    """
+
+    return os.path.join(output_dir, ANSIBLE_PROFILE_FILE.format(stack))
+
+
+def rotate_ansible_profile(path):
+    """Start a new ansible profile timeline for a config-download run.
+
+    The timeline of the previous run is kept as ``<path>.1``, replacing
+    the one of the run before, so the reports only cover the latest run.
+
+    :param path: Path of the JSONL timeline file.
+    :type path: String
+    """
+
+    if os.path.exists(path):
+        os.rename(path, path + '.1')
+
+
+def _event_time(event):
+    """Return the creation time of an ansible-runner event as epoch."""
+
+    created = event.get('created')
+    if created:
+        # NOTE: isoformat() omits the microseconds when they are zero.
+        for fmt in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
+            try:
+                stamp = datetime.datetime.strptime(created, fmt)
+            except ValueError:
+                continue
+            epoch = datetime.datetime(1970, 1, 1)
+            return (stamp - epoch).total_seconds()
+        LOG.debug('Unable to parse event time: {}'.format(created))
+    return time.time()
+
+
+class AnsibleProfiler(object):
+    """Record per task and per host timing from ansible-runner events."""
+
+    def __init__(self, path, playbook=None):
+        """Collect the timeline of a playbook execution.
+
+        Records are appended to a JSONL file so that multiple playbooks
+        executed against the same stack end up in a single timeline. The
+        file is rotated by rotate_ansible_profile when a run starts.
+
+        :param path: Path of the JSONL timeline file.
+        :type path: String
+
+        :param playbook: Playbook being profiled.
+        :type playbook: String
+        """
+
+        self.path = path
+        self.playbook = playbook
+        self.records = list()
+        self._started = dict()
+
+    def event_handler(self, event):
+        """Consume an ansible-runner event.
+
+        :param event: ansible-runner job event.
+        :type event: Dictionary
+
+        :returns: Boolean, always True so the event is still stored by
+                  ansible-runner.
+        """
+
+        event_name = event.get('event')
+        event_data = event.get('event_data', dict())
+        key = (event_data.get('task_uuid'), event_data.get('host'))
+        if event_name == 'runner_on_start':
+            self._started[key] = _event_time(event)
+        elif event_name in TASK_END_EVENTS:
+            end = _event_time(event)
+            start = self._started.pop(key, end)
+            res = event_data.get('res') or dict()
+            self.records.append({
+                'playbook': self.playbook,
+                'play': event_data.get('play'),
+                'task': event_data.get('task'),
+                'host': event_data.get('host'),
+                'start': start,
+                'end': end,
+                'changed': bool(res.get('changed', False)),
+                'failed': TASK_END_EVENTS[event_name],
+            })
+        return True
+
+    def write(self):
+        """Append the collected records to the timeline file."""
+
+        if not self.records:
+            return
+        with open(self.path, 'a') as f:
+            for record in self.records:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+        LOG.info(
+            'Ansible profile of {} tasks written to {}'.format(
+                len(self.records),
+                self.path
+            )
+        )
+        self.records = list()
+
+
+def load_ansible_profile(path):
+    """Load the records of an ansible profile timeline.
+
+    :param path: Path of the JSONL timeline file.
+    :type path: String
+
+    :returns: List
+    """
+
+    records = list()
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+def slowest_tasks(records, limit=10):
+    """Return the slowest tasks of a timeline.
+
+    Task durations are the wall time between the first host starting
+    and the last host finishing the task.
+
+    :param records: Timeline records.
+    :type records: List
+
+    :param limit: Number of tasks to return.
+    :type limit: Integer
+
+    :returns: List of (play, task, duration, hosts) tuples.
+    """
+
+    tasks = collections.OrderedDict()
+    for record in records:
+        key = (record.get('play'), record.get('task'))
+        start, end, hosts = tasks.get(key, (record['start'],
+                                            record['end'], 0))
+        tasks[key] = (min(start, record['start']),
+                      max(end, record['end']),
+                      hosts + 1)
+    result = [(k[0], k[1], v[1] - v[0], v[2]) for k, v in tasks.items()]
+    return sorted(result, key=lambda i: i[2], reverse=True)[:limit]
+
+
+def slowest_hosts(records, limit=10):
+    """Return the hosts which spent the most time running tasks.
+
+    :param records: Timeline records.
+    :type records: List
+
+    :param limit: Number of hosts to return.
+    :type limit: Integer
+
+    :returns: List of (host, busy time, tasks, changed, failed) tuples.
+    """
+
+    hosts = dict()
+    for record in records:
+        busy, tasks, changed, failed = hosts.get(record.get('host'),
+                                                 (0.0, 0, 0, 0))
+        hosts[record.get('host')] = (
+            busy + record['end'] - record['start'],
+            tasks + 1,
+            changed + int(record.get('changed', False)),
+            failed + int(record.get('failed', False))
+        )
+    result = [(k,) + v for k, v in hosts.items()]
+    return sorted(result, key=lambda i: i[1], reverse=True)[:limit]
+
+
+def step_critical_path(records):
+    """Return the per step wall time and the host on its critical path.
+
+    Each play of a deployment playbook is a step. The critical host of a
+    step is the host with the largest accumulated task time within it.
+
+    :param records: Timeline records.
+    :type records: List
+
+    :returns: List of (play, wall time, critical host, host time) tuples
+              in execution order.
+    """
+
+    steps = collections.OrderedDict()
+    for record in records:
+        step = steps.setdefault(
+            record.get('play'),
+            {'start': record['start'], 'end': record['end'],
+             'hosts': collections.defaultdict(float)})
+        step['start'] = min(step['start'], record['start'])
+        step['end'] = max(step['end'], record['end'])
+        step['hosts'][record.get('host')] += record['end'] - record['start']
+
+    result = list()
+    for play, step in steps.items():
+        host, host_time = max(step['hosts'].items(), key=lambda i: i[1])
+        result.append((play, step['end'] - step['start'], host, host_time))
+    return result
+
+
+# Phases recorded by the `phase` context manager, reported by
+# `profile_command` and the deploy trace.
+_PHASES = list()
+_PHASE_STATE = threading.local()
+
+DEPLOY_TRACE_FILE = 'deploy-trace.json'
+
+
+def _open_phases():
+    if not hasattr(_PHASE_STATE, 'stack'):
+        _PHASE_STATE.stack = list()
+    return _PHASE_STATE.stack
+
+
+@contextlib.contextmanager
+def phase(name, **attributes):
+    """Record the wall time and outcome of a phase of a command.
+
+    Phases can be nested and are recorded whether or not the command is
+    profiled, which only costs two calls to time.time(). A phase is
+    failed when it's left by an exception. Attributes, such as the
+    number of files processed or hosts targeted, are stored with it.
+
+    >>> with profiling.phase('environment processing', files=3):
+    ...     process_environments()
+
+    It can also decorate a function, which can then set attributes with
+    `annotate`:
+
+    >>> @profiling.phase('template rendering')
+    ... def render_templates():
+    ...     profiling.annotate(templates=12)
+
+    :param name: Phase name.
+    :type name: String
+
+    :returns: The span of the phase, a dictionary.
+    """
+
+    stack = _open_phases()
+    span = {
+        'phase': name,
+        'start': time.time(),
+        'depth': len(stack),
+        'outcome': 'success',
+        'attributes': dict(attributes)
+    }
+    stack.append(span)
+    try:
+        yield span
+    except BaseException:
+        span['outcome'] = 'failed'
+        raise
+    finally:
+        stack.pop()
+        span['end'] = time.time()
+        span['duration'] = span['end'] - span['start']
+        _PHASES.append(span)
+        LOG.debug('Phase {} took {:.1f} seconds'.format(
+            name, span['duration']))
+
+
+def annotate(**attributes):
+    """Set attributes of the innermost phase of the current thread."""
+
+    stack = _open_phases()
+    if stack:
+        stack[-1]['attributes'].update(attributes)
+
+
+def get_phases(since=None):
+    """Return the recorded phases, by start time.
+
+    :param since: Only return the phases started at or after this time.
+    :type since: Float
+
+    :returns: List
+    """
+
+    return sorted([i for i in _PHASES if since is None or
+                   i['start'] >= since], key=lambda i: i['start'])
+
+
+def reset_phases():
+    """Forget the recorded phases."""
+
+    del _PHASES[:]
+
+
+def get_deploy_trace_path(stack, output_dir):
+    """Return the path of the deploy trace of a stack.
+
+    The trace is stored in the config-download directory of the stack.
+
+    :param stack: Stack name.
+    :type stack: String
+
+    :param output_dir: Config download output directory.
+    :type output_dir: String
+
+    :returns: String
+    """
+
+    return os.path.join(output_dir, stack, DEPLOY_TRACE_FILE)
+
+
+def write_deploy_trace(path, phases, **info):
+    """Write the phases of a deployment to a JSON file.
+
+    :param path: Path of the trace file.
+    :type path: String
+
+    :param phases: Phases of the deployment, as returned by `get_phases`.
+    :type phases: List
+
+    :param info: Details of the deployment stored with the phases, e.g.
+                 the stack name and the deployment status.
+    :type info: Dictionary
+    """
+
+    trace = dict(info)
+    if phases:
+        trace['start'] = min(i['start'] for i in phases)
+        trace['end'] = max(i['end'] for i in phases)
+        trace['duration'] = trace['end'] - trace['start']
+    trace['phases'] = phases
+    trace_dir = os.path.dirname(path)
+    if trace_dir and not os.path.isdir(trace_dir):
+        os.makedirs(trace_dir)
+    with open(path, 'w') as f:
+        json.dump(trace, f, indent=2, sort_keys=True)
+    LOG.info('Deploy trace of {} phases written to {}'.format(
+        len(phases), path))
+
+
+def phase_summary(phases):
+    """Return the rows of a summary table of phases.
+
+    :param phases: Phases, as returned by `get_phases`.
+    :type phases: List
+
+    :returns: List of (phase, duration, outcome, attributes) tuples, the
+              phase names being indented by their depth.
+    """
+
+    if not phases:
+        return []
+    base = min(i['depth'] for i in phases)
+    rows = list()
+    for item in phases:
+        rows.append((
+            '  ' * (item['depth'] - base) + item['phase'],
+            '{:.1f}s'.format(item['duration']),
+            item['outcome'],
+            ', '.join('{}={}'.format(k, v) for k, v in
+                      sorted(item['attributes'].items()))
+        ))
+    return rows
+
+
+def get_profile_dir(app):
+    """Return the directory of the --os-tripleoclient-profile option.
+
+    :param app: The openstack client application.
+    :type app: Object
+
+    :returns: String or None
+    """
+
+    profile_dir = getattr(getattr(app, 'options', None),
+                          'os_tripleoclient_profile', None)
+    if isinstance(profile_dir, six.string_types) and profile_dir:
+        return profile_dir
+    return None
+
+
+def _write_profile(profiler, phases, prefix):
+    profiler.dump_stats(prefix + '.pstats')
+    with open(prefix + '.txt', 'w') as f:
+        stats = pstats.Stats(prefix + '.pstats', stream=f)
+        stats.sort_stats('cumulative').print_stats(50)
+    with open(prefix + '-phases.json', 'w') as f:
+        json.dump(phases, f, indent=2, sort_keys=True)
+
+
+@contextlib.contextmanager
+def profile_command(name, profile_dir):
+    """Profile a command with cProfile and report its phases.
+
+    Three files named after the command and its start time are written to
+    profile_dir:
+
+    * ``.pstats``, the cProfile statistics, which can be loaded with the
+      pstats module or converted to a flame graph with flameprof.
+    * ``.txt``, the 50 functions with the highest cumulative time.
+    * ``-phases.json``, the wall time of the phases of the command.
+
+    Nothing is done when profile_dir isn't set.
+
+    :param name: Command name.
+    :type name: String
+
+    :param profile_dir: Directory to write the profile into.
+    :type profile_dir: String
+    """
+
+    if not profile_dir:
+        yield
+        return
+
+    reset_phases()
+    prefix = os.path.join(profile_dir, '{}-{}'.format(
+        name.replace(' ', '-'),
+        datetime.datetime.now().strftime('%Y%m%d%H%M%S')))
+    profiler = cProfile.Profile()
+    start = time.time()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        duration = time.time() - start
+        phases = get_phases()
+        for item in phases:
+            LOG.info('{}{:<40} {:>8.1f}s'.format(
+                '  ' * item['depth'], item['phase'], item['duration']))
+        LOG.info('{:<40} {:>8.1f}s'.format(name, duration))
+        try:
+            if not os.path.isdir(profile_dir):
+                os.makedirs(profile_dir)
+            _write_profile(profiler, phases, prefix)
+            LOG.info('Profile of {} written to {}.pstats'.format(
+                name, prefix))
+        except (IOError, OSError) as e:
+            LOG.warning('Unable to write the profile of {}: {}'.format(
+                name, e))
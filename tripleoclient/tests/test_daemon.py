@@ -0,0 +1,116 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import array
+import mock
+import os
+import shutil
+import socket
+import tempfile
+from unittest import TestCase
+
+from tripleoclient import daemon
+
+
+class TestDaemon(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.server, self.client = socket.socketpair(socket.AF_UNIX,
+                                                     socket.SOCK_STREAM)
+        self.addCleanup(self.server.close)
+        self.addCleanup(self.client.close)
+
+    def test_run_no_daemon(self):
+        self.assertIsNone(
+            daemon.run(['--help'], os.path.join(self.tmp_dir, 'missing')))
+
+    @mock.patch('os.execvp')
+    @mock.patch('tripleoclient.daemon.run', return_value=None)
+    def test_client_main_fallback(self, mock_run, mock_execvp):
+        daemon.client_main(['tripleo', 'container', 'image', 'prepare'])
+        mock_execvp.assert_called_once_with(
+            'openstack',
+            ['openstack', 'tripleo', 'container', 'image', 'prepare'])
+
+    def test_send_read_fds(self):
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+        daemon._send(self.client, {'argv': ['a']},
+                     fds=array.array('i', [read_fd, write_fd, write_fd]))
+        daemon._send(self.client, {'rc': 0})
+
+        reader = daemon._Reader(self.server)
+        self.assertEqual({'argv': ['a']}, reader.read())
+        self.assertEqual({'rc': 0}, reader.read())
+        self.assertEqual(3, len(reader.fds))
+        for fd in reader.fds:
+            os.close(fd)
+
+    def test_read_closed(self):
+        self.client.close()
+        self.assertIsNone(daemon._Reader(self.server).read())
+
+    def test_peer_uid(self):
+        self.assertEqual(os.getuid(), daemon._peer_uid(self.server))
+
+    def test_run_request_invalid(self):
+        daemon._send(self.client, {'version': 0})
+        shell = mock.Mock()
+        self.assertEqual(1, daemon._run_request(self.server, shell))
+        shell.main.assert_not_called()
+
+    @mock.patch('os.environ', {})
+    @mock.patch('os.chdir')
+    @mock.patch('os.close')
+    @mock.patch('os.dup2')
+    def test_run_request(self, mock_dup2, mock_close, mock_chdir):
+        daemon._send(self.client, {'version': daemon.PROTOCOL_VERSION,
+                                   'argv': ['stack', 'list'],
+                                   'cwd': self.tmp_dir,
+                                   'env': {'OS_CLOUD': 'undercloud'}},
+                     fds=array.array('i', [0, 1, 2]))
+        shell = mock.Mock()
+        shell.main.return_value = 3
+        self.assertEqual(3, daemon._run_request(self.server, shell))
+        shell.main.assert_called_once_with(['stack', 'list'])
+        mock_chdir.assert_called_once_with(self.tmp_dir)
+        self.assertEqual(3, mock_dup2.call_count)
+        self.assertEqual({'OS_CLOUD': 'undercloud'}, os.environ)
+
+        reader = daemon._Reader(self.client)
+        self.assertEqual({'pid': os.getpid()}, reader.read())
+        self.assertEqual({'rc': 3}, reader.read())
+
+    @mock.patch('os.environ', {})
+    @mock.patch('os.chdir')
+    @mock.patch('os.close')
+    @mock.patch('os.dup2')
+    def test_run_request_exit(self, mock_dup2, mock_close, mock_chdir):
+        for code, rc in ((None, 0), (4, 4), ('error', 1)):
+            daemon._send(self.client, {'version': daemon.PROTOCOL_VERSION,
+                                       'argv': ['stack', 'list'],
+                                       'cwd': self.tmp_dir,
+                                       'env': {}},
+                         fds=array.array('i', [0, 1, 2]))
+            shell = mock.Mock()
+            shell.main.side_effect = SystemExit(code)
+            self.assertEqual(rc, daemon._run_request(self.server, shell))
+
+            reader = daemon._Reader(self.client)
+            self.assertEqual({'pid': os.getpid()}, reader.read())
+            self.assertEqual({'rc': rc}, reader.read())
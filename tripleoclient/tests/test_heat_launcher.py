@@ -0,0 +1,187 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import mock
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+from unittest import TestCase
+
+from tripleoclient import heat_launcher
+
+
+class TestHeatContainerLauncher(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        patcher = mock.patch(
+            'tripleoclient.constants.HEAT_LAUNCHER_CACHE_DIR',
+            os.path.join(self.tmp_dir, 'cache'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _launcher(self):
+        launcher = heat_launcher.HeatContainerLauncher.__new__(
+            heat_launcher.HeatContainerLauncher)
+        launcher.container_image = 'heat-all:latest'
+        launcher.user = 'heat'
+        launcher.image_id = 'abcdef'
+        launcher._heat_ids = None
+        launcher.sql_db = os.path.join(self.tmp_dir, 'heat.sqlite')
+        launcher.config_file = os.path.join(self.tmp_dir, 'heat.conf')
+        launcher.install_tmp = self.tmp_dir
+        launcher.uid = os.getuid()
+        launcher.gid = os.getgid()
+        launcher.state_restored = False
+        launcher.state_current = False
+        return launcher
+
+    @mock.patch('subprocess.Popen')
+    def test_get_heat_ids(self, mock_popen):
+        mock_popen.return_value.communicate.return_value = (
+            'heat:x:187:187::/var/lib/heat:/sbin/nologin\n'
+            'heat:x:188:\n', None)
+        launcher = self._launcher()
+        self.assertEqual('187', launcher.get_heat_uid())
+        self.assertEqual('188', launcher.get_heat_gid())
+        mock_popen.assert_called_once()
+
+        # uid and gid are cached per image
+        mock_popen.reset_mock()
+        launcher = self._launcher()
+        self.assertEqual('187', launcher.get_heat_uid())
+        self.assertEqual('188', launcher.get_heat_gid())
+        mock_popen.assert_not_called()
+
+    @mock.patch('subprocess.Popen')
+    def test_get_heat_ids_missing_group(self, mock_popen):
+        mock_popen.return_value.communicate.return_value = (
+            'heat:x:187:187::/var/lib/heat:/sbin/nologin\n\n', None)
+        self.assertRaises(Exception, self._launcher().get_heat_gid)
+
+    @mock.patch('shutil.which', return_value='/usr/bin/skopeo')
+    @mock.patch('subprocess.check_output', return_value='sha256:1234\n')
+    def test_fetch_container_image_current(self, mock_output, mock_which):
+        self._launcher()._fetch_container_image()
+        self.assertEqual(2, mock_output.call_count)
+        self.assertNotIn(
+            mock.call(['podman', 'pull', 'heat-all:latest']),
+            mock_output.mock_calls)
+
+    @mock.patch('shutil.which', return_value='/usr/bin/skopeo')
+    @mock.patch('subprocess.check_output',
+                side_effect=['sha256:1234\n', 'sha256:5678\n', ''])
+    def test_fetch_container_image_outdated(self, mock_output, mock_which):
+        self._launcher()._fetch_container_image()
+        mock_output.assert_called_with(['podman', 'pull', 'heat-all:latest'])
+
+    @mock.patch('subprocess.check_output',
+                side_effect=subprocess.CalledProcessError(1, 'podman'))
+    def test_fetch_container_image_missing(self, mock_output):
+        self.assertRaises(Exception,
+                          self._launcher()._fetch_container_image)
+
+    @mock.patch('subprocess.check_call')
+    def test_heat_db_sync_snapshot(self, mock_check_call):
+        launcher = self._launcher()
+
+        def db_sync(cmd):
+            with open(launcher.sql_db + '.db', 'w') as f:
+                f.write('schema')
+
+        mock_check_call.side_effect = db_sync
+        mock_wal = mock.patch.object(launcher, '_enable_db_wal').start()
+        self.addCleanup(mock.patch.stopall)
+        launcher.heat_db_sync()
+        mock_check_call.assert_called_once()
+
+        os.unlink(launcher.sql_db + '.db')
+        mock_check_call.reset_mock()
+        launcher.heat_db_sync()
+        mock_check_call.assert_not_called()
+        with open(launcher.sql_db + '.db') as f:
+            self.assertEqual('schema', f.read())
+        self.assertEqual(2, mock_wal.call_count)
+
+    def test_enable_db_wal(self):
+        launcher = self._launcher()
+        db = launcher.sql_db + '.db'
+        sqlite3.connect(db).close()
+        launcher._enable_db_wal()
+        conn = sqlite3.connect(db)
+        self.addCleanup(conn.close)
+        self.assertEqual(
+            'wal', conn.execute('PRAGMA journal_mode').fetchone()[0])
+
+    def test_write_heat_config_busy_timeout(self):
+        launcher = self._launcher()
+        launcher.log_file = os.path.join(self.tmp_dir, 'heat.log')
+        launcher.paste_file = os.path.join(self.tmp_dir, 'api-paste.ini')
+        launcher.token_file = os.path.join(self.tmp_dir, 'token.json')
+        launcher.policy_file = 'noauth_policy.json'
+        launcher.api_port = 8006
+        launcher._write_heat_config()
+        with open(launcher.config_file) as f:
+            self.assertIn(
+                'connection = sqlite:///%s.db?timeout=%s' % (
+                    launcher.sql_db, heat_launcher.SQLITE_BUSY_TIMEOUT),
+                f.read())
+
+    def test_save_restore_state(self):
+        launcher = self._launcher()
+        conn = sqlite3.connect(launcher.sql_db + '.db')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE stack (name TEXT)')
+        conn.execute("INSERT INTO stack VALUES ('undercloud')")
+        conn.commit()
+        conn.close()
+        state_dir = os.path.join(self.tmp_dir, 'state', 'undercloud')
+        self.assertTrue(launcher.save_state(state_dir))
+        self.assertEqual(0o700, os.stat(state_dir).st_mode & 0o777)
+
+        os.unlink(launcher.sql_db + '.db')
+        launcher = self._launcher()
+        self.assertTrue(launcher.restore_state(state_dir))
+        self.assertTrue(launcher.state_restored)
+        self.assertTrue(launcher.state_current)
+        conn = sqlite3.connect(launcher.sql_db + '.db')
+        self.addCleanup(conn.close)
+        self.assertEqual(
+            [('undercloud',)], conn.execute('SELECT * FROM stack').fetchall())
+
+    @mock.patch('subprocess.check_call')
+    def test_heat_db_sync_state_outdated(self, mock_check_call):
+        launcher = self._launcher()
+        sqlite3.connect(launcher.sql_db + '.db').close()
+        state_dir = os.path.join(self.tmp_dir, 'state')
+        self.assertTrue(launcher.save_state(state_dir))
+
+        launcher = self._launcher()
+        launcher.image_id = 'fedcba'
+        self.assertTrue(launcher.restore_state(state_dir))
+        self.assertFalse(launcher.state_current)
+        launcher.heat_db_sync()
+        mock_check_call.assert_called_once()
+        # the schema snapshot is only saved from a fresh database
+        self.assertFalse(os.path.exists(launcher._cache_path('.sqlite')))
+
+    def test_restore_state_missing(self):
+        launcher = self._launcher()
+        self.assertFalse(
+            launcher.restore_state(os.path.join(self.tmp_dir, 'missing')))
+        self.assertFalse(launcher.state_restored)
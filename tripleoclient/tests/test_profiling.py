@@ -0,0 +1,214 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import json
+import mock
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from tripleoclient import profiling
+
+
+def _event(name, task_uuid, host, created, task='task', play='play',
+           changed=False):
+    return {
+        'event': name,
+        'created': created,
+        'event_data': {
+            'task_uuid': task_uuid,
+            'task': task,
+            'play': play,
+            'host': host,
+            'res': {'changed': changed},
+        }
+    }
+
+
+class TestAnsibleProfiler(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'overcloud-ansible-profile.jsonl')
+
+    def test_get_ansible_profile_path(self):
+        self.assertEqual(
+            '/foo/overcloud-ansible-profile.jsonl',
+            profiling.get_ansible_profile_path('overcloud', '/foo'))
+
+    def test_rotate_ansible_profile(self):
+        profiling.rotate_ansible_profile(self.path)
+        self.assertFalse(os.path.exists(self.path))
+
+        for run in ('first', 'second'):
+            with open(self.path, 'w') as f:
+                f.write(run)
+            profiling.rotate_ansible_profile(self.path)
+            self.assertFalse(os.path.exists(self.path))
+            with open(self.path + '.1') as f:
+                self.assertEqual(run, f.read())
+
+    def test_event_handler(self):
+        profiler = profiling.AnsibleProfiler(self.path, 'deploy.yaml')
+        events = [
+            _event('runner_on_start', 't1', 'ctrl-0',
+                   '2020-01-01T00:00:00.000000'),
+            _event('runner_on_start', 't1', 'cmp-0',
+                   '2020-01-01T00:00:00.500000'),
+            _event('runner_on_ok', 't1', 'ctrl-0',
+                   '2020-01-01T00:00:02', changed=True),
+            _event('runner_on_failed', 't1', 'cmp-0',
+                   '2020-01-01T00:00:01.500000'),
+            _event('playbook_on_task_start', 't2', None,
+                   '2020-01-01T00:00:03'),
+        ]
+        for event in events:
+            self.assertTrue(profiler.event_handler(event))
+        self.assertEqual(2, len(profiler.records))
+        self.assertEqual(2.0, profiler.records[0]['end'] -
+                         profiler.records[0]['start'])
+        self.assertTrue(profiler.records[0]['changed'])
+        self.assertFalse(profiler.records[0]['failed'])
+        self.assertTrue(profiler.records[1]['failed'])
+
+        profiler.write()
+        profiler.write()
+        records = profiling.load_ansible_profile(self.path)
+        self.assertEqual(2, len(records))
+        self.assertEqual('deploy.yaml', records[0]['playbook'])
+
+
+class TestAnsibleProfileReport(TestCase):
+    def setUp(self):
+        self.records = [
+            {'play': 'step1', 'task': 'a', 'host': 'ctrl-0',
+             'start': 0.0, 'end': 4.0, 'changed': True, 'failed': False},
+            {'play': 'step1', 'task': 'a', 'host': 'cmp-0',
+             'start': 1.0, 'end': 2.0, 'changed': False, 'failed': False},
+            {'play': 'step1', 'task': 'b', 'host': 'cmp-0',
+             'start': 4.0, 'end': 5.0, 'changed': False, 'failed': True},
+            {'play': 'step2', 'task': 'c', 'host': 'cmp-0',
+             'start': 5.0, 'end': 11.0, 'changed': False, 'failed': False},
+        ]
+
+    def test_slowest_tasks(self):
+        self.assertEqual(
+            [('step2', 'c', 6.0, 1), ('step1', 'a', 4.0, 2)],
+            profiling.slowest_tasks(self.records, limit=2))
+
+    def test_slowest_hosts(self):
+        self.assertEqual(
+            [('cmp-0', 8.0, 3, 0, 1), ('ctrl-0', 4.0, 1, 1, 0)],
+            profiling.slowest_hosts(self.records))
+
+    def test_step_critical_path(self):
+        self.assertEqual(
+            [('step1', 5.0, 'ctrl-0', 4.0), ('step2', 6.0, 'cmp-0', 6.0)],
+            profiling.step_critical_path(self.records))
+
+
+class TestCommandProfile(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        profiling.reset_phases()
+        self.addCleanup(profiling.reset_phases)
+
+    def test_phase(self):
+        with profiling.phase('deploy'):
+            with profiling.phase('environment processing'):
+                pass
+
+        @profiling.phase('playbook')
+        def run():
+            return 'ok'
+
+        self.assertEqual('ok', run())
+        phases = profiling.get_phases()
+        self.assertEqual(['deploy', 'environment processing', 'playbook'],
+                         [i['phase'] for i in phases])
+        self.assertEqual([0, 1, 0], [i['depth'] for i in phases])
+        for item in phases:
+            self.assertGreaterEqual(item['duration'], 0)
+
+    def test_phase_outcome_attributes(self):
+        @profiling.phase('enable ssh admin')
+        def enable(hosts):
+            profiling.annotate(hosts=len(hosts))
+            raise RuntimeError()
+
+        with profiling.phase('deploy', stack='overcloud') as span:
+            self.assertRaises(RuntimeError, enable, ['a', 'b'])
+        self.assertEqual({'stack': 'overcloud'}, span['attributes'])
+        phases = profiling.get_phases()
+        self.assertEqual(
+            [('deploy', 'success', {'stack': 'overcloud'}),
+             ('enable ssh admin', 'failed', {'hosts': 2})],
+            [(i['phase'], i['outcome'], i['attributes']) for i in phases])
+        self.assertEqual([phases[1]],
+                         profiling.get_phases(since=phases[1]['start']))
+        self.assertEqual(
+            [('deploy', '0.0s', 'success', 'stack=overcloud'),
+             ('  enable ssh admin', '0.0s', 'failed', 'hosts=2')],
+            profiling.phase_summary(phases))
+
+    def test_write_deploy_trace(self):
+        with profiling.phase('deploy templates', files=3):
+            pass
+        path = profiling.get_deploy_trace_path('overcloud', self.tmp_dir)
+        profiling.write_deploy_trace(path, profiling.get_phases(),
+                                     stack='overcloud',
+                                     status='DEPLOY_SUCCESS')
+        self.assertEqual(
+            os.path.join(self.tmp_dir, 'overcloud', 'deploy-trace.json'),
+            path)
+        with open(path) as f:
+            trace = json.load(f)
+        self.assertEqual('overcloud', trace['stack'])
+        self.assertEqual('DEPLOY_SUCCESS', trace['status'])
+        self.assertEqual(['deploy templates'],
+                         [i['phase'] for i in trace['phases']])
+        self.assertEqual({'files': 3}, trace['phases'][0]['attributes'])
+        self.assertGreaterEqual(trace['duration'], 0)
+
+    def test_get_profile_dir(self):
+        app = mock.Mock()
+        app.options.os_tripleoclient_profile = self.tmp_dir
+        self.assertEqual(self.tmp_dir, profiling.get_profile_dir(app))
+        app.options.os_tripleoclient_profile = None
+        self.assertIsNone(profiling.get_profile_dir(app))
+        self.assertIsNone(profiling.get_profile_dir(mock.Mock()))
+
+    def test_profile_command(self):
+        profile_dir = os.path.join(self.tmp_dir, 'profile')
+        with profiling.profile_command('overcloud deploy', profile_dir):
+            with profiling.phase('config download'):
+                sum(range(100))
+        files = sorted(os.listdir(profile_dir))
+        self.assertEqual(3, len(files))
+        self.assertTrue(files[0].startswith('overcloud-deploy-'))
+        self.assertTrue(files[0].endswith('-phases.json'))
+        self.assertTrue(files[1].endswith('.pstats'))
+        self.assertTrue(files[2].endswith('.txt'))
+        with open(os.path.join(profile_dir, files[0])) as f:
+            self.assertEqual(['config download'],
+                             [i['phase'] for i in json.load(f)])
+
+    def test_profile_command_disabled(self):
+        with mock.patch('cProfile.Profile') as mock_profile:
+            with profiling.profile_command('overcloud deploy', None):
+                pass
+        mock_profile.assert_not_called()
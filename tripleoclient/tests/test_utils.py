@@ -17,14 +17,19 @@
 import ansible_runner
 import argparse
 import datetime
+import errno
+import json
 import logging
 import mock
 import os
 import os.path
 import shutil
+import six
 import socket
 import subprocess
+import tarfile
 import tempfile
+import time
 
 import sys
 
@@ -36,6 +41,7 @@ from testscenarios import TestWithScenarios
 from unittest import TestCase
 import yaml
 
+from tripleoclient import command
 from tripleoclient import exceptions
 from tripleoclient import utils
 
@@ -252,6 +258,151 @@ class TestRunAnsiblePlaybook(TestCase):
         )
 
 
+class TestAnsibleSession(TestCase):
+    def setUp(self):
+        self.orig_workdir = utils.constants.DEFAULT_WORK_DIR
+        utils.constants.DEFAULT_WORK_DIR = utils.TempDirs().dir
+        self.addCleanup(shutil.rmtree, utils.constants.DEFAULT_WORK_DIR,
+                        ignore_errors=True)
+
+    def tearDown(self):
+        utils.constants.DEFAULT_WORK_DIR = self.orig_workdir
+
+    @mock.patch('tripleoclient.utils._ansible_fact_cache',
+                return_value='/tmp/fact_cache')
+    @mock.patch('tripleoclient.utils._write_default_ansible_cfg',
+                return_value='/tmp/ansible.cfg')
+    @mock.patch('tripleoclient.utils._ansible_base_env',
+                return_value={'ANSIBLE_LIBRARY': '/foo'})
+    @mock.patch('os.path.exists', return_value=True)
+    @mock.patch.object(
+        Runner,
+        'run',
+        return_value=fakes.fake_ansible_runner_run_return()
+    )
+    @mock.patch('ansible_runner.runner_config.RunnerConfig')
+    def test_session_reuse(self, mock_config, mock_run, mock_exists,
+                           mock_base_env, mock_cfg, mock_fact_cache):
+        mock_config.return_value.env = dict()
+        with utils.AnsibleSession() as session:
+            for playbook in ('one.yaml', 'two.yaml', 'three.yaml'):
+                utils.run_ansible_playbook(
+                    playbook=playbook,
+                    inventory='localhost,',
+                    workdir=session.workdir,
+                    session=session
+                )
+            artifact_dirs = set(
+                i[1]['artifact_dir'] for i in mock_config.call_args_list)
+            self.assertEqual(set([session.artifact_dir]), artifact_dirs)
+            self.assertTrue(os.path.isdir(session.artifact_dir))
+        self.assertFalse(os.path.isdir(session.workdir))
+        self.assertEqual(3, mock_run.call_count)
+        mock_base_env.assert_called_once()
+        mock_cfg.assert_called_once_with(plan='overcloud')
+        mock_fact_cache.assert_called_once()
+
+    def test_session_base_env_copy(self):
+        with utils.AnsibleSession() as session:
+            env = session.base_env(workdir=session.workdir, cwd='/tmp')
+            env['ANSIBLE_FORKS'] = 1
+            self.assertNotIn(
+                'ANSIBLE_FORKS',
+                session.base_env(workdir=session.workdir, cwd='/tmp'))
+
+    def test_session_reset_runner_env(self):
+        with utils.AnsibleSession() as session:
+            runner_env = os.path.join(session.workdir, 'env')
+            utils.makedirs(runner_env)
+            extravars = os.path.join(runner_env, 'extravars')
+            with open(extravars, 'w') as f:
+                f.write('foo: bar\n')
+            session.runner_files.add(extravars)
+            session.reset_runner_env()
+            self.assertFalse(os.path.exists(extravars))
+            self.assertEqual(set(), session.runner_files)
+
+
+class TestAnsiblePlaybookScheduler(TestCase):
+    def setUp(self):
+        cfg_patch = mock.patch(
+            'tripleoclient.utils._write_default_ansible_cfg',
+            return_value='/tmp/ansible.cfg')
+        self.mock_cfg = cfg_patch.start()
+        self.addCleanup(cfg_patch.stop)
+        self.log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_dir)
+
+    def test_unknown_requirement(self):
+        scheduler = utils.AnsiblePlaybookScheduler()
+        scheduler.add('one', 'one.yaml', 'localhost,', requires=['two'])
+        self.assertRaises(exceptions.InvalidConfiguration, scheduler.run)
+
+    def test_duplicate_job(self):
+        scheduler = utils.AnsiblePlaybookScheduler()
+        scheduler.add('one', 'one.yaml', 'localhost,')
+        self.assertRaises(exceptions.InvalidConfiguration,
+                          scheduler.add, 'one', 'one.yaml', 'localhost,')
+
+    def test_circular_requirement(self):
+        scheduler = utils.AnsiblePlaybookScheduler()
+        scheduler.add('one', 'one.yaml', 'localhost,', requires=['two'])
+        scheduler.add('two', 'two.yaml', 'localhost,', requires=['one'])
+        self.assertRaises(exceptions.InvalidConfiguration, scheduler.run)
+
+    @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
+    def test_run_order(self, mock_run):
+        order = []
+        mock_run.side_effect = lambda **kwargs: order.append(
+            kwargs['playbook'])
+        scheduler = utils.AnsiblePlaybookScheduler(max_workers=2,
+                                                   log_dir=self.log_dir)
+        scheduler.add('provide', 'provide.yaml', 'localhost,',
+                      requires=['introspect', 'upload'])
+        scheduler.add('introspect', 'introspect.yaml', 'localhost,')
+        scheduler.add('upload', 'upload.yaml', 'localhost,')
+        results = scheduler.run()
+
+        self.assertEqual(['provide', 'introspect', 'upload'],
+                         list(results.keys()))
+        self.assertEqual('provide.yaml', order[-1])
+        self.assertEqual(
+            set(['SUCCESS']), set(i['status'] for i in results.values()))
+        workdirs = set()
+        for call in mock_run.call_args_list:
+            self.assertTrue(call[1]['parallel_run'])
+            self.assertTrue(call[1]['quiet'])
+            self.assertEqual('/tmp/ansible.cfg', call[1]['ansible_cfg'])
+            self.assertEqual(
+                os.path.join(
+                    self.log_dir,
+                    '{}.log'.format(call[1]['playbook'][:-len('.yaml')])),
+                call[1]['extra_env_variables']['ANSIBLE_LOG_PATH'])
+            workdirs.add(call[1]['workdir'])
+        self.assertEqual(3, len(workdirs))
+
+    @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
+    def test_run_failure_skips_dependents(self, mock_run):
+        def _run(**kwargs):
+            if kwargs['playbook'] == 'introspect.yaml':
+                raise RuntimeError('Ansible execution failed')
+        mock_run.side_effect = _run
+        scheduler = utils.AnsiblePlaybookScheduler()
+        scheduler.add('introspect', 'introspect.yaml', 'localhost,')
+        scheduler.add('upload', 'upload.yaml', 'localhost,')
+        scheduler.add('provide', 'provide.yaml', 'localhost,',
+                      requires=['introspect'])
+        scheduler.add('report', 'report.yaml', 'localhost,',
+                      requires=['provide'])
+        self.assertRaises(RuntimeError, scheduler.run)
+
+        results = scheduler.run(raise_on_failure=False)
+        self.assertEqual('FAILED', results['introspect']['status'])
+        self.assertEqual('SUCCESS', results['upload']['status'])
+        self.assertEqual('SKIPPED', results['provide']['status'])
+        self.assertEqual('SKIPPED', results['report']['status'])
+
+
 class TestRunCommandAndLog(TestCase):
     def setUp(self):
         self.mock_logger = mock.Mock(spec=logging.Logger)
@@ -355,18 +506,18 @@ class TestWaitForStackUtil(TestCase):
         e.event_time = event_time
         return e
 
-    @mock.patch("heatclient.common.event_utils.get_events")
-    def test_wait_for_stack_ready(self, mock_el):
+    def test_wait_for_stack_ready(self):
         stack = mock.Mock()
         stack.stack_name = 'stack'
         stack.stack_status = "CREATE_COMPLETE"
         self.mock_orchestration.stacks.get.return_value = stack
+        self.mock_orchestration.events.list.return_value = []
 
         complete = utils.wait_for_stack_ready(self.mock_orchestration, 'stack')
         self.assertTrue(complete)
 
     @mock.patch("time.sleep")
-    @mock.patch("heatclient.common.event_utils.poll_for_events")
+    @mock.patch("tripleoclient.utils.StackEventWatcher.wait")
     @mock.patch("tripleoclient.utils.get_stack")
     def test_wait_for_stack_ready_retry(self, mock_get_stack, mock_poll,
                                         mock_time):
@@ -382,7 +533,7 @@ class TestWaitForStackUtil(TestCase):
         self.assertTrue(complete)
 
     @mock.patch("time.sleep")
-    @mock.patch("heatclient.common.event_utils.poll_for_events")
+    @mock.patch("tripleoclient.utils.StackEventWatcher.wait")
     @mock.patch("tripleoclient.utils.get_stack")
     def test_wait_for_stack_ready_retry_fail(self, mock_get_stack, mock_poll,
                                              mock_time):
@@ -398,7 +549,7 @@ class TestWaitForStackUtil(TestCase):
                           self.mock_orchestration, 'stack')
 
     @mock.patch("time.sleep")
-    @mock.patch("heatclient.common.event_utils.poll_for_events")
+    @mock.patch("tripleoclient.utils.StackEventWatcher.wait")
     @mock.patch("tripleoclient.utils.get_stack")
     def test_wait_for_stack_ready_server_fail(self, mock_get_stack, mock_poll,
                                               mock_time):
@@ -420,21 +571,21 @@ class TestWaitForStackUtil(TestCase):
 
         self.assertFalse(complete)
 
-    @mock.patch("heatclient.common.event_utils.get_events")
-    def test_wait_for_stack_ready_failed(self, mock_el):
+    def test_wait_for_stack_ready_failed(self):
         stack = mock.Mock()
         stack.stack_name = 'stack'
         stack.stack_status = "CREATE_FAILED"
         self.mock_orchestration.stacks.get.return_value = stack
+        self.mock_orchestration.events.list.return_value = []
 
         complete = utils.wait_for_stack_ready(self.mock_orchestration, 'stack')
 
         self.assertFalse(complete)
 
-    @mock.patch("heatclient.common.event_utils.poll_for_events")
-    def test_wait_for_stack_in_progress(self, mock_poll_for_events):
+    @mock.patch("tripleoclient.utils.StackEventWatcher.wait")
+    def test_wait_for_stack_in_progress(self, mock_wait):
 
-        mock_poll_for_events.return_value = ("CREATE_IN_PROGRESS", "MESSAGE")
+        mock_wait.return_value = ("CREATE_IN_PROGRESS", "MESSAGE")
 
         stack = mock.Mock()
         stack.stack_name = 'stack'
@@ -673,6 +824,183 @@ class TestWaitForStackUtil(TestCase):
         self.assertRaises(ValueError, utils.file_checksum, '/dev/zero')
 
 
+class TestFileChecksums(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        patcher = mock.patch('tripleoclient.constants.CHECKSUM_CACHE_DIR',
+                             os.path.join(self.tmp_dir, 'cache'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.path = os.path.join(self.tmp_dir, 'overcloud-full.qcow2')
+        self._write(b'foo', 1000)
+
+    def _write(self, content, mtime):
+        with open(self.path, 'wb') as f:
+            f.write(content)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_checksums_cached(self):
+        expected = {
+            'md5': 'acbd18db4cc2f85cedef654fccc4a4d8',
+            'sha256': '2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a'
+                      '5e886266e7ae'}
+        self.assertEqual(expected, utils.file_checksums(self.path))
+        with mock.patch('tripleoclient.utils._hash_file') as mock_hash:
+            self.assertEqual(expected, utils.file_checksums(self.path))
+            self.assertEqual(expected['sha256'],
+                             utils.file_checksum(self.path, 'sha256'))
+        mock_hash.assert_not_called()
+
+    def test_checksums_invalidated(self):
+        utils.file_checksums(self.path)
+        self._write(b'bar', 2000)
+        self.assertEqual('37b51d194a7513e45b56f6524f2d51f2',
+                         utils.file_checksum(self.path))
+
+    def test_checksums_recent_file_not_cached(self):
+        self._write(b'foo', time.time())
+        utils.file_checksums(self.path)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'cache')))
+
+
+class TestStackEventWatcher(TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.stack = mock.Mock()
+        self.stack.stack_name = 'overcloud'
+        self.stack.id = 'stack-id'
+        self.out = six.StringIO()
+        sleep_patch = mock.patch('time.sleep')
+        self.mock_sleep = sleep_patch.start()
+        self.addCleanup(sleep_patch.stop)
+
+    def event(self, id, resource_name, status, stack_id='stack-id',
+              phys_id='', root=True):
+        e = mock.Mock()
+        e.id = id
+        e.resource_name = resource_name
+        e.resource_status = status
+        e.resource_status_reason = 'state changed'
+        e.physical_resource_id = phys_id
+        e.event_time = '2020-01-01T00:00:%02d' % len(id)
+        e.links = [{'rel': 'stack', 'href': 'http://heat/stacks/x/%s' %
+                    stack_id}]
+        if root:
+            e.links.append({'rel': 'root_stack', 'href': 'http://heat'})
+        return e
+
+    def test_nested_api_single_cursor(self):
+        self.client.events.list.side_effect = [
+            [self.event('1', 'Controller', 'CREATE_IN_PROGRESS'),
+             self.event('2', 'Server', 'CREATE_COMPLETE',
+                        stack_id='nested-id')],
+            [],
+            [self.event('3', 'Controller', 'CREATE_COMPLETE'),
+             self.event('4', 'overcloud', 'CREATE_COMPLETE',
+                        phys_id='stack-id')],
+        ]
+        watcher = utils.StackEventWatcher(self.client, self.stack,
+                                          action='CREATE', marker='0',
+                                          out=self.out)
+        status, msg = watcher.wait()
+
+        self.assertEqual('CREATE_COMPLETE', status)
+        self.assertTrue(watcher.nested_api)
+        self.assertEqual([
+            mock.call(stack_id='overcloud/stack-id', sort_dir='asc',
+                      marker='0', nested_depth=2),
+            mock.call(stack_id='overcloud/stack-id', sort_dir='asc',
+                      marker='2', nested_depth=2),
+            mock.call(stack_id='overcloud/stack-id', sort_dir='asc',
+                      marker='2', nested_depth=2),
+        ], self.client.events.list.call_args_list)
+        self.client.resources.list.assert_not_called()
+        self.assertEqual(set(['Controller']), watcher.completed)
+        self.assertEqual([mock.call(5), mock.call(10)],
+                         self.mock_sleep.call_args_list)
+        self.assertIn('[Controller]: CREATE_IN_PROGRESS',
+                      self.out.getvalue())
+
+    def test_per_stack_cursors(self):
+        nested = mock.Mock()
+        nested.links = [{'rel': 'nested',
+                         'href': 'http://heat/stacks/nested/nested-id'}]
+        self.client.resources.list.return_value = [nested]
+        events = {
+            'overcloud/stack-id': [
+                [self.event('1', 'Controller', 'CREATE_IN_PROGRESS',
+                            root=False)],
+                [],
+                [self.event('33', 'overcloud', 'CREATE_FAILED',
+                            phys_id='stack-id', root=False)],
+            ],
+            'nested/nested-id': [
+                [self.event('22', 'Server', 'CREATE_FAILED',
+                            stack_id='nested-id', root=False)],
+                [],
+            ],
+        }
+
+        def _list(stack_id, **kwargs):
+            if 'nested_depth' in kwargs:
+                return events[stack_id][0]
+            return events[stack_id].pop(0)
+
+        self.client.events.list.side_effect = _list
+        watcher = utils.StackEventWatcher(self.client, self.stack,
+                                          action='CREATE', out=self.out)
+        status, msg = watcher.wait()
+
+        self.assertEqual('CREATE_FAILED', status)
+        self.assertFalse(watcher.nested_api)
+        self.assertEqual({'overcloud/stack-id': ('33', 0),
+                          'nested/nested-id': ('22', 1)},
+                         watcher.markers)
+        self.client.resources.list.assert_has_calls([
+            mock.call(stack_id='overcloud/stack-id'),
+            mock.call(stack_id='nested/nested-id')])
+
+    def test_stack_get_fallback(self):
+        self.client.events.list.return_value = []
+        self.client.stacks.get.return_value.stack_status = 'UPDATE_COMPLETE'
+        watcher = utils.StackEventWatcher(self.client, self.stack,
+                                          action='UPDATE', out=self.out)
+        status, msg = watcher.wait()
+
+        self.assertEqual('UPDATE_COMPLETE', status)
+        self.client.stacks.get.assert_called_once_with(
+            'overcloud/stack-id', resolve_outputs=False)
+        self.assertEqual([mock.call(10)], self.mock_sleep.call_args_list)
+
+    def test_poll_period(self):
+        watcher = utils.StackEventWatcher(self.client, self.stack,
+                                          max_poll_period=30)
+        self.assertEqual(10, watcher._next_period(False))
+        self.assertEqual(20, watcher._next_period(False))
+        self.assertEqual(30, watcher._next_period(False))
+        self.assertEqual(30, watcher._next_period(False))
+        self.assertEqual(5, watcher._next_period(True))
+        watcher.completed.add('Controller')
+        self.assertEqual(1, watcher._next_period(False))
+        watcher.in_progress.add('Compute')
+        self.assertEqual(5, watcher._next_period(True))
+
+    @mock.patch("heatclient.common.event_utils.get_events")
+    def test_get_stack_event_marker(self, mock_get_events):
+        mock_get_events.return_value = [mock.Mock(id='marker')]
+        self.assertEqual(
+            'marker',
+            utils.get_stack_event_marker(self.client, 'overcloud'))
+        mock_get_events.assert_called_once_with(
+            self.client, stack_id='overcloud',
+            event_args={'sort_dir': 'desc', 'limit': 1})
+        mock_get_events.return_value = []
+        self.assertIsNone(
+            utils.get_stack_event_marker(self.client, 'overcloud'))
+
+
 class TestEnsureRunAsNormalUser(TestCase):
 
     @mock.patch('os.geteuid')
@@ -751,6 +1079,119 @@ class TestGetEndpointMap(TestCase):
                          {'KeystonePublic': {'uri': 'http://foo:8000/'}})
 
 
+class TestStackMetadata(TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        patcher = mock.patch(
+            'tripleoclient.constants.STACK_METADATA_CACHE_DIR',
+            self.cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(utils._STACK_METADATA.clear)
+
+    def _stack(self, status='CREATE_COMPLETE',
+               updated_time='2020-01-02T00:00:00Z'):
+        stack = mock.MagicMock(id='stack-id', stack_status=status,
+                               updated_time=updated_time,
+                               creation_time='2020-01-01T00:00:00Z')
+        stack.to_dict.return_value = {
+            'outputs': [{'output_key': 'EndpointMap',
+                         'output_value': {'foo': 'bar'}},
+                        {'output_key': 'KeystoneURL',
+                         'output_value': 'http://foo:5000'}],
+            'parameters': {'AdminPassword': 'secret'}
+        }
+        stack.environment.return_value = {
+            'parameter_defaults': {'AdminPassword': 'secret'}}
+        return stack
+
+    def test_outputs_indexed_once(self):
+        stack = self._stack()
+        self.assertEqual('http://foo:5000',
+                         utils.get_overcloud_endpoint(stack))
+        self.assertEqual({'foo': 'bar'}, utils.get_endpoint_map(stack))
+        self.assertEqual('http://foo:5000',
+                         utils.get_service_ips(stack)['KeystoneURL'])
+        stack.to_dict.assert_called_once_with()
+
+    def test_persisted_metadata(self):
+        stack = self._stack()
+        self.assertEqual(
+            {'AdminPassword': 'secret'},
+            utils.get_stack_environment(stack)['parameter_defaults'])
+        utils.get_stack_output_item(stack, 'EndpointMap')
+        path = os.path.join(self.cache_dir, 'stack-id.json')
+        self.assertEqual(0o600, os.stat(path).st_mode & 0o777)
+        self.assertEqual(0o700, os.stat(self.cache_dir).st_mode & 0o777)
+
+        # A new command against the same stack version reads the cache
+        utils._STACK_METADATA.clear()
+        new_stack = self._stack()
+        self.assertEqual({'foo': 'bar'}, utils.get_endpoint_map(new_stack))
+        self.assertEqual(
+            {'AdminPassword': 'secret'},
+            utils.get_stack_metadata(new_stack).parameters)
+        utils.get_stack_environment(new_stack)
+        new_stack.to_dict.assert_not_called()
+        new_stack.environment.assert_not_called()
+
+    def test_updated_stack_invalidates_cache(self):
+        stack = self._stack()
+        utils.get_endpoint_map(stack)
+        utils._STACK_METADATA.clear()
+        new_stack = self._stack(updated_time='2020-01-03T00:00:00Z')
+        utils.get_endpoint_map(new_stack)
+        new_stack.to_dict.assert_called_once_with()
+
+    def test_in_progress_stack_not_cached(self):
+        stack = self._stack(status='UPDATE_IN_PROGRESS')
+        utils.get_endpoint_map(stack)
+        utils.get_endpoint_map(stack)
+        self.assertEqual(2, stack.to_dict.call_count)
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    def test_unresolved_outputs_fetched(self):
+        stack = self._stack()
+        stack_dict = stack.to_dict.return_value
+        stack.to_dict.side_effect = [{'parameters': {}}, stack_dict]
+        self.assertEqual({'foo': 'bar'}, utils.get_endpoint_map(stack))
+        stack.get.assert_called_once_with()
+
+    def test_unresolved_outputs_fetched_failed_stack(self):
+        for status in ('UPDATE_FAILED', 'UPDATE_IN_PROGRESS'):
+            utils._STACK_METADATA.clear()
+            stack = self._stack(status=status)
+            stack_dict = stack.to_dict.return_value
+            stack.to_dict.side_effect = [{'parameters': {}}, stack_dict]
+            self.assertEqual({'foo': 'bar'}, utils.get_endpoint_map(stack))
+            stack.get.assert_called_once_with()
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    def test_get_rc_params_cached_environment(self):
+        stack = self._stack()
+        client = mock.Mock()
+        client.stacks.get.return_value = stack
+        params = utils.get_rc_params(client, 'overcloud')
+        self.assertEqual('secret', params['password'])
+        client.stacks.get.assert_called_once_with(
+            'overcloud', resolve_outputs=False)
+        client.stacks.environment.assert_not_called()
+        utils.get_rc_params(client, 'overcloud')
+        stack.environment.assert_called_once_with()
+
+    def test_get_rc_params_no_stack_version(self):
+        client = mock.Mock()
+        client.stacks.environment.return_value = {
+            'parameter_defaults': {'AdminPassword': 'secret',
+                                   'KeystoneRegion': 'regionOne'}}
+        params = utils.get_rc_params(client, 'overcloud')
+        self.assertEqual({'password': 'secret', 'region': 'regionOne'},
+                         params)
+        client.stacks.environment.assert_called_once_with('overcloud')
+
+
 class TestNodeGetCapabilities(TestCase):
     def test_with_capabilities(self):
         node = mock.Mock(properties={'capabilities': 'x:y,foo:bar'})
@@ -1249,8 +1690,8 @@ class ProcessMultipleEnvironments(TestCase):
                 'parse', autospec=True, return_value=dict())
     @mock.patch('heatclient.common.template_format.'
                 'parse', autospec=True, return_value=dict())
-    @mock.patch('yaml.safe_dump', autospec=True)
-    @mock.patch('yaml.safe_load', autospec=True)
+    @mock.patch('tripleoclient.yaml_utils.safe_dump', autospec=True)
+    @mock.patch('tripleoclient.yaml_utils.safe_load', autospec=True)
     @mock.patch('six.moves.builtins.open')
     @mock.patch('tempfile.NamedTemporaryFile', autospec=True)
     def test_rewrite_env_files(self,
@@ -1295,6 +1736,297 @@ class ProcessMultipleEnvironments(TestCase):
                                         default_flow_style=False)])
 
 
+class TestCopyTemplatesTree(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.source = os.path.join(self.tmp_dir, 'source')
+        os.makedirs(os.path.join(self.source, 'puppet'))
+        with open(os.path.join(self.source, 'puppet', 'foo.yaml'), 'w') as f:
+            f.write('foo')
+        os.symlink('puppet/foo.yaml', os.path.join(self.source, 'foo.yaml'))
+        self.destination = os.path.join(self.tmp_dir, 'destination')
+
+    def _assert_copied(self):
+        with open(os.path.join(self.destination, 'foo.yaml')) as f:
+            self.assertEqual('foo', f.read())
+        self.assertEqual(
+            'puppet/foo.yaml',
+            os.readlink(os.path.join(self.destination, 'foo.yaml')))
+
+    def test_copy_templates_tree(self):
+        utils.copy_templates_tree(self.source, self.destination)
+        self._assert_copied()
+        # Writes to the working directory don't reach the source
+        with open(os.path.join(self.destination, 'puppet', 'foo.yaml'),
+                  'w') as f:
+            f.write('bar')
+        with open(os.path.join(self.source, 'puppet', 'foo.yaml')) as f:
+            self.assertEqual('foo', f.read())
+
+    @mock.patch('fcntl.ioctl',
+                side_effect=OSError(errno.EOPNOTSUPP, 'not supported'))
+    def test_copy_templates_tree_fallback(self, mock_ioctl):
+        self.assertFalse(
+            utils.copy_templates_tree(self.source, self.destination))
+        self._assert_copied()
+        mock_ioctl.assert_called_once()
+
+    @mock.patch('fcntl.ioctl', side_effect=OSError(errno.EIO, 'error'))
+    def test_copy_templates_tree_error(self, mock_ioctl):
+        self.assertRaises(shutil.Error, utils.copy_templates_tree,
+                          self.source, self.destination)
+
+
+class TestArchiveDeployArtifacts(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        for name, value in (('CLOUD_HOME_DIR', self.tmp_dir),
+                            ('ARTIFACT_STORE_DIR',
+                             os.path.join(self.tmp_dir, 'store'))):
+            patcher = mock.patch('tripleoclient.constants.' + name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.tht_dir = os.path.join(self.tmp_dir, 'work', 'tht')
+        os.makedirs(os.path.join(self.tht_dir, 'puppet'))
+        with open(os.path.join(self.tht_dir, 'puppet', 'foo.yaml'),
+                  'w') as f:
+            f.write('foo')
+        os.symlink('puppet/foo.yaml', os.path.join(self.tht_dir, 'foo.yaml'))
+        self.log = mock.Mock()
+
+    def _members(self, tar_filename, mode):
+        with tarfile.open(tar_filename, mode) as tf:
+            return sorted(tf.getnames())
+
+    @mock.patch('shutil.which', return_value=None)
+    def test_archive_tarfile(self, mock_which):
+        tar_filename = utils.archive_deploy_artifacts(
+            self.log, 'overcloud', self.tht_dir)
+        self.assertTrue(tar_filename.endswith('.tar.bzip2'))
+        self.assertEqual(['foo.yaml', 'puppet', 'puppet/foo.yaml',
+                          self.tht_dir[1:]],
+                         self._members(tar_filename, 'r:bz2'))
+
+    @mock.patch('shutil.which', return_value=None)
+    def test_archive_zstd_unavailable(self, mock_which):
+        tar_filename = utils.archive_deploy_artifacts(
+            self.log, 'overcloud', self.tht_dir, compression='zstd')
+        self.assertTrue(tar_filename.endswith('.tar.gz'))
+        self.assertIn('puppet/foo.yaml',
+                      self._members(tar_filename, 'r:gz'))
+
+    @mock.patch('shutil.which', return_value='/usr/bin/gzip')
+    @mock.patch('tripleoclient.constants.ARTIFACT_COMPRESSION',
+                {'gzip': ('tar.gz', [['gzip']], 'gz')})
+    def test_archive_compressor(self, mock_which):
+        tar_filename = utils.archive_deploy_artifacts(
+            self.log, 'overcloud', self.tht_dir, compression='gzip')
+        self.assertIn('puppet/foo.yaml',
+                      self._members(tar_filename, 'r:gz'))
+
+    def test_archive_store(self):
+        manifest = utils.archive_deploy_artifacts(
+            self.log, 'overcloud', self.tht_dir, store=True)
+        self.assertTrue(manifest.endswith('.manifest.json'))
+        # Unchanged files are only stored once
+        shutil.copy(os.path.join(self.tht_dir, 'puppet', 'foo.yaml'),
+                    os.path.join(self.tht_dir, 'bar.yaml'))
+        utils.archive_deploy_artifacts(
+            self.log, 'overcloud', self.tht_dir, store=True)
+        objects = []
+        for root, dirs, files in os.walk(
+                os.path.join(self.tmp_dir, 'store', 'objects')):
+            objects.extend(files)
+        self.assertEqual(1, len(objects))
+
+        restored = os.path.join(self.tmp_dir, 'restored')
+        utils.restore_deploy_artifacts(manifest, restored)
+        with open(os.path.join(restored, 'foo.yaml')) as f:
+            self.assertEqual('foo', f.read())
+        self.assertTrue(os.path.islink(os.path.join(restored, 'foo.yaml')))
+
+
+class TestJinjaRenderFiles(TestCase):
+
+    PROCESS_TEMPLATES = (
+        'import os\n'
+        'for f in os.listdir(\'.\'):\n'
+        '    if f.endswith(\'.j2.yaml\'):\n'
+        '        with open(f) as src:\n'
+        '            with open(f.replace(\'.j2\', \'\'), \'w\') as dst:\n'
+        '                dst.write(src.read().replace(\'{{role}}\', '
+        '\'Controller\'))\n')
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        patcher = mock.patch('tripleoclient.constants.RENDER_CACHE_DIR',
+                             os.path.join(self.tmp_dir, 'cache'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.templates = os.path.join(self.tmp_dir, 'templates')
+        os.makedirs(os.path.join(self.templates, 'tools'))
+        with open(os.path.join(self.templates, 'tools',
+                               'process-templates.py'), 'w') as f:
+            f.write(self.PROCESS_TEMPLATES)
+        with open(os.path.join(self.templates, 'foo.j2.yaml'), 'w') as f:
+            f.write('role: {{role}}\n')
+        self.log = mock.Mock()
+
+    def _render(self, name):
+        tht_root = os.path.join(self.tmp_dir, name)
+        shutil.copytree(self.templates, tht_root)
+        with mock.patch('tripleoclient.utils.run_command_and_log',
+                        wraps=utils.run_command_and_log) as mock_run:
+            utils.jinja_render_files(self.log, self.templates, tht_root,
+                                     base_path=tht_root)
+        with open(os.path.join(tht_root, 'foo.yaml')) as f:
+            self.assertEqual('role: Controller\n', f.read())
+        return mock_run
+
+    def test_render_cached(self):
+        self._render('tht-1').assert_called_once()
+        self._render('tht-2').assert_not_called()
+
+    def test_render_changed_template(self):
+        self._render('tht-1').assert_called_once()
+        with open(os.path.join(self.templates, 'bar.yaml'), 'w') as f:
+            f.write('bar: baz\n')
+        self._render('tht-2').assert_called_once()
+
+    @mock.patch('tripleoclient.utils.run_command_and_log', return_value=1)
+    def test_render_failed(self, mock_run):
+        self.assertRaises(exceptions.DeploymentError,
+                          utils.jinja_render_files, self.log,
+                          self.templates, self.templates,
+                          base_path=self.templates)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'cache')))
+
+
+class TestEnvironmentCache(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        patcher = mock.patch('tripleoclient.constants.ENV_CACHE_DIR',
+                             self.cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tht_root = self._make_tht('tht-1')
+
+    def _make_tht(self, name):
+        tht_root = os.path.join(self.tmp_dir, name)
+        os.makedirs(os.path.join(tht_root, 'environments'))
+        with open(os.path.join(tht_root, 'foo.yaml'), 'w') as f:
+            f.write('heat_template_version: rocky\n')
+        with open(os.path.join(tht_root, 'environments', 'env.yaml'),
+                  'w') as f:
+            f.write('resource_registry:\n'
+                    '  OS::TripleO::Foo: ../foo.yaml\n'
+                    'parameter_defaults:\n'
+                    '  Bar: baz\n')
+        return tht_root
+
+    def _process(self, tht_root, tracker=None):
+        return utils.process_multiple_environments(
+            [os.path.join(tht_root, 'environments', 'env.yaml')],
+            tht_root, tht_root, env_files_tracker=tracker)
+
+    def test_cache_hit(self):
+        tracker = []
+        files, env = self._process(self.tht_root, tracker)
+        self.assertEqual({'Bar': 'baz'}, env['parameter_defaults'])
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+        self.assertEqual(
+            0o600,
+            os.stat(os.path.join(self.cache_dir,
+                                 os.listdir(self.cache_dir)[0])).st_mode &
+            0o777)
+
+        with mock.patch('heatclient.common.template_utils.'
+                        'process_environment_and_files') as mock_process:
+            new_tracker = []
+            self.assertEqual((files, env),
+                             self._process(self.tht_root, new_tracker))
+            mock_process.assert_not_called()
+        self.assertEqual(tracker, new_tracker)
+
+    def test_cache_relocated(self):
+        files, env = self._process(self.tht_root)
+        tht_root = self._make_tht('tht-2')
+        with mock.patch('heatclient.common.template_utils.'
+                        'process_environment_and_files') as mock_process:
+            new_files, new_env = self._process(tht_root)
+            mock_process.assert_not_called()
+        self.assertEqual(
+            'file://' + os.path.join(tht_root, 'foo.yaml'),
+            new_env['resource_registry']['OS::TripleO::Foo'])
+        self.assertEqual(
+            list(files.values()), list(new_files.values()))
+
+    def test_cache_referenced_file_changed(self):
+        self._process(self.tht_root)
+        with open(os.path.join(self.tht_root, 'foo.yaml'), 'w') as f:
+            f.write('heat_template_version: queens\n')
+        files, env = self._process(self.tht_root)
+        self.assertIn('queens', list(files.values())[0])
+
+    def test_cache_disabled(self):
+        utils.process_multiple_environments(
+            [os.path.join(self.tht_root, 'environments', 'env.yaml')],
+            self.tht_root, self.tht_root, use_cache=False)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+
+class TestPruneStackFiles(TestCase):
+
+    def test_prune_stack_files(self):
+        template = {'resources': {
+            'Foo': {'type': 'OS::TripleO::Foo'},
+            'Bar': {'type': 'file:///tht/bar.yaml'}}}
+        files = {
+            'file:///tht/bar.yaml': json.dumps({'resources': {
+                'Group': {'type': 'OS::Heat::ResourceGroup',
+                          'properties': {'resource_def': {
+                              'type': 'file:///tht/group.yaml'}}}}}),
+            'file:///tht/group.yaml': json.dumps({'resources': {
+                'Config': {'type': 'OS::Heat::SoftwareConfig',
+                           'properties': {
+                               'config': {'get_file':
+                                          'file:///tht/script.sh'}}}}}),
+            'file:///tht/script.sh': '#!/bin/bash',
+            'file:///tht/foo.yaml': '{}',
+            'file:///tht/foo-old.yaml': '{}',
+            'file:///tht/unused.sh': '#!/bin/bash',
+            'file:///tht/env-1.yaml': json.dumps({'resource_registry': {
+                'OS::TripleO::Foo': 'file:///tht/foo-old.yaml'}}),
+            'file:///tht/env-2.yaml': json.dumps({'resource_registry': {
+                'OS::TripleO::Foo': 'file:///tht/foo.yaml'}}),
+        }
+        env = {'resource_registry': {
+            'OS::TripleO::Foo': 'file:///tht/foo.yaml',
+            'OS::TripleO::Baz': 'OS::Heat::None'}}
+        pruned = utils.prune_stack_files(
+            template, files, env,
+            ['file:///tht/env-1.yaml', 'file:///tht/env-2.yaml'])
+        self.assertEqual(
+            sorted(['file:///tht/bar.yaml', 'file:///tht/group.yaml',
+                    'file:///tht/script.sh', 'file:///tht/foo.yaml',
+                    'file:///tht/env-1.yaml', 'file:///tht/env-2.yaml']),
+            sorted(pruned))
+        self.assertEqual(files['file:///tht/bar.yaml'],
+                         pruned['file:///tht/bar.yaml'])
+
+    def test_prune_stack_files_no_environment(self):
+        files = {'file:///tht/foo.yaml': '{}'}
+        self.assertEqual({}, utils.prune_stack_files({}, files))
+
+
 class GetTripleoAnsibleInventory(TestCase):
 
     def setUp(self):
@@ -1324,6 +2056,186 @@ class GetTripleoAnsibleInventory(TestCase):
             )
 
 
+class TestTokenCache(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.cache_dir = os.path.join(self.tmp_dir, 'token-cache')
+        patcher = mock.patch('tripleoclient.constants.TOKEN_CACHE_DIR',
+                             self.cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.auth = mock.Mock()
+        self.auth.get_cache_id.return_value = 'cache-id'
+        self.auth.get_auth_state.return_value = '{"auth_token": "t"}'
+        self.auth.auth_ref.will_expire_soon.return_value = False
+
+    def test_save_load(self):
+        utils.save_auth_state(self.auth)
+        self.assertEqual(0o700, os.stat(self.cache_dir).st_mode & 0o777)
+        cache_file = os.path.join(self.cache_dir, os.listdir(
+            self.cache_dir)[0])
+        self.assertEqual(0o600, os.stat(cache_file).st_mode & 0o777)
+
+        self.assertTrue(utils.load_auth_state(self.auth))
+        self.auth.set_auth_state.assert_called_once_with(
+            '{"auth_token": "t"}')
+        self.auth.auth_ref.will_expire_soon.assert_called_once_with(
+            stale_duration=300)
+
+    def test_load_expiring(self):
+        utils.save_auth_state(self.auth)
+        self.auth.auth_ref.will_expire_soon.return_value = True
+        self.assertFalse(utils.load_auth_state(self.auth))
+        self.auth.invalidate.assert_called_once_with()
+
+    def test_load_missing(self):
+        self.assertFalse(utils.load_auth_state(self.auth))
+        self.auth.set_auth_state.assert_not_called()
+
+    def test_no_cache_id(self):
+        self.auth.get_cache_id.return_value = None
+        utils.save_auth_state(self.auth)
+        self.assertFalse(os.path.exists(self.cache_dir))
+        self.assertFalse(utils.load_auth_state(self.auth))
+
+    @mock.patch.dict(os.environ, {'OS_TRIPLEOCLIENT_TOKEN_CACHE': 'true'})
+    @mock.patch.dict('tripleoclient.utils._CONNECTIONS', clear=True)
+    @mock.patch('openstack.connect')
+    def test_get_undercloud_connection(self, mock_connect):
+        mock_connect.return_value.session.auth = self.auth
+        utils.save_auth_state(self.auth)
+
+        conn = utils.get_undercloud_connection()
+        self.assertIs(conn, utils.get_undercloud_connection())
+        mock_connect.assert_called_once_with('undercloud')
+        self.auth.get_access.assert_not_called()
+
+    @mock.patch.dict(os.environ, {'OS_TRIPLEOCLIENT_TOKEN_CACHE': 'true'})
+    @mock.patch.dict('tripleoclient.utils._CONNECTIONS', clear=True)
+    @mock.patch('openstack.connect')
+    def test_get_undercloud_connection_authenticate(self, mock_connect):
+        mock_connect.return_value.session.auth = self.auth
+        utils.get_undercloud_connection()
+        self.auth.get_access.assert_called_once_with(
+            mock_connect.return_value.session)
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+
+    def test_cache_client_manager_auth(self):
+        utils.save_auth_state(self.auth)
+        self.auth.auth_ref = None
+        client_manager = mock.Mock(spec=['setup_auth', 'auth', '_auth_ref'],
+                                   auth=self.auth, _auth_ref=None)
+        setup_auth = client_manager.setup_auth
+        auth_ref = mock.Mock()
+        auth_ref.will_expire_soon.return_value = False
+
+        def _set_auth_state(state):
+            self.auth.auth_ref = auth_ref
+        self.auth.set_auth_state.side_effect = _set_auth_state
+
+        utils.cache_client_manager_auth(client_manager)
+        client_manager.setup_auth()
+        setup_auth.assert_called_once_with()
+        self.auth.set_auth_state.assert_called_once_with(
+            '{"auth_token": "t"}')
+        self.assertIs(auth_ref, client_manager._auth_ref)
+
+    def test_cache_client_manager_auth_missing(self):
+        self.auth.auth_ref = None
+        client_manager = mock.Mock(spec=['setup_auth', 'auth', '_auth_ref'],
+                                   auth=self.auth, _auth_ref=None)
+        utils.cache_client_manager_auth(client_manager)
+        client_manager.setup_auth()
+        self.assertIsNone(client_manager._auth_ref)
+
+    @mock.patch.dict(os.environ, {'OS_TRIPLEOCLIENT_TOKEN_CACHE': 'true'})
+    def test_command_caches_client_manager_auth(self):
+        class FakeCommand(command.Command):
+            def take_action(self, parsed_args):
+                pass
+
+        app = mock.Mock()
+        app.client_manager.auth = self.auth
+        setup_auth = app.client_manager.setup_auth
+        cmd = FakeCommand(app, None, cmd_name='fake')
+        self.assertIsNot(setup_auth, app.client_manager.setup_auth)
+
+        with mock.patch('tripleoclient.utils.store_cli_param'), \
+                mock.patch('tripleoclient.profiling.get_profile_dir',
+                           return_value=None):
+            cmd.run(mock.Mock())
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+
+
+class TestGenerateTripleoAnsibleInventory(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.inventory_file = os.path.join(self.tmp_dir, 'inventory.yaml')
+        for target, value in (
+                ('tripleoclient.constants.DEFAULT_WORK_DIR', self.tmp_dir),
+                ('tripleoclient.utils.get_key', mock.Mock(return_value='k')),
+                ('tripleoclient.utils.get_undercloud_connection',
+                 mock.Mock())):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('heatclient.client.Client')
+        self.hclient = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.stack = mock.Mock(id='123', updated_time=None,
+                               creation_time='2020-01-01T00:00:00Z',
+                               stack_status='CREATE_COMPLETE')
+        self.hclient.stacks.get.return_value = self.stack
+
+    def _generate(self):
+        utils.generate_tripleo_ansible_inventory(
+            self.inventory_file, stack='overcloud')
+        with open(self.inventory_file) as f:
+            return f.read()
+
+    @mock.patch('tripleo_common.inventory.TripleoInventory')
+    def test_generate_cached(self, mock_inventory):
+        def write(path):
+            with open(path, 'w') as f:
+                f.write('Compute: {}\n')
+        mock_inventory.return_value.write_static_inventory.side_effect = write
+
+        self.assertEqual('Compute: {}\n', self._generate())
+        mock_inventory.assert_called_once_with(
+            session=mock.ANY, hclient=self.hclient, plan_name='overcloud',
+            auth_url=mock.ANY, project_name=mock.ANY, username=mock.ANY,
+            cacert=mock.ANY, ansible_ssh_user='tripleo-admin',
+            undercloud_key_file='k', undercloud_connection='ssh')
+
+        os.unlink(self.inventory_file)
+        mock_inventory.reset_mock()
+        self.assertEqual('Compute: {}\n', self._generate())
+        mock_inventory.assert_not_called()
+
+        # an update of the stack invalidates the cached inventory
+        self.stack.updated_time = '2020-01-02T00:00:00Z'
+        self._generate()
+        mock_inventory.assert_called_once()
+
+    @mock.patch('tripleo_common.inventory.TripleoInventory')
+    def test_generate_stack_in_progress(self, mock_inventory):
+        self.stack.stack_status = 'UPDATE_IN_PROGRESS'
+        mock_inventory.return_value.write_static_inventory.side_effect = (
+            lambda path: open(path, 'w').close())
+        self._generate()
+        self._generate()
+        self.assertEqual(2, mock_inventory.call_count)
+
+    @mock.patch('tripleo_common.inventory.TripleoInventory')
+    def test_generate_failed(self, mock_inventory):
+        mock_inventory.side_effect = Exception('boom')
+        self.assertRaises(exceptions.InvalidConfiguration, self._generate)
+
+
 class TestNormalizeFilePath(TestCase):
 
     @mock.patch('os.path.isfile', return_value=True)
@@ -1509,7 +2421,7 @@ class TestWaitApiPortReady(TestCase):
     def test_throw_exception_at_max_retries(self, urlopen_mock, sleep_mock):
         with self.assertRaises(RuntimeError):
             utils.wait_api_port_ready(8080)
-        self.assertEqual(urlopen_mock.call_count, 30)
+        self.assertEqual(urlopen_mock.call_count, 29)
         self.assertEqual(sleep_mock.call_count, 30)
 
     @mock.patch(
@@ -1522,7 +2434,7 @@ class TestWaitApiPortReady(TestCase):
     @mock.patch('time.sleep')
     def test_recovers_from_exception(self, urlopen_mock, sleep_mock):
         self.assertFalse(utils.wait_api_port_ready(8080))
-        self.assertEqual(urlopen_mock.call_count, 4)
+        self.assertEqual(urlopen_mock.call_count, 3)
         self.assertEqual(sleep_mock.call_count, 4)
 
     @mock.patch(
@@ -1536,7 +2448,7 @@ class TestWaitApiPortReady(TestCase):
     def test_recovers_from_multiple_choices_error_code(self, urlopen_mock,
                                                        sleep_mock):
         self.assertTrue(utils.wait_api_port_ready(8080))
-        self.assertEqual(urlopen_mock.call_count, 3)
+        self.assertEqual(urlopen_mock.call_count, 2)
         self.assertEqual(sleep_mock.call_count, 3)
 
     @mock.patch('six.moves.urllib.request.urlopen', side_effect=NameError)
@@ -1544,7 +2456,7 @@ class TestWaitApiPortReady(TestCase):
     def test_dont_retry_at_unknown_exception(self, urlopen_mock, sleep_mock):
         with self.assertRaises(NameError):
             utils.wait_api_port_ready(8080)
-        self.assertEqual(urlopen_mock.call_count, 1)
+        self.assertEqual(urlopen_mock.call_count, 0)
         self.assertEqual(sleep_mock.call_count, 1)
 
 
@@ -1809,3 +2721,18 @@ class TestGeneralUtils(base.TestCommand):
         limit_hosts_expected = 'controller0:compute0:compute1:!compute2'
         limit_hosts_actual = utils.playbook_limit_parse(limit_nodes)
         self.assertEqual(limit_hosts_actual, limit_hosts_expected)
+
+
+class TestLazyImports(TestCase):
+
+    def test_heavy_modules_not_imported(self):
+        # Every command imports tripleoclient.utils, it must not pull in
+        # dependencies only a few commands need.
+        heavy = ['ansible_runner', 'swiftclient', 'heatclient.client',
+                 'tripleo_common.inventory']
+        out = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys; '
+            'import tripleoclient.command, tripleoclient.plugin; '
+            'print(" ".join(m for m in %r if m in sys.modules))' % heavy])
+        self.assertEqual('', out.decode('utf-8').strip())
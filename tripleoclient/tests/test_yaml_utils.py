@@ -0,0 +1,85 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import mock
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from tripleoclient import yaml_utils
+
+
+class TestYamlUtils(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.addCleanup(yaml_utils.clear_cache)
+        yaml_utils.clear_cache()
+        self.path = os.path.join(self.tmp_dir, 'roles_data.yaml')
+        self._write('- name: Controller\n  count: 1\n')
+
+    def _write(self, content):
+        with open(self.path, 'w') as f:
+            f.write(content)
+
+    def test_safe_load_dump(self):
+        data = {'parameter_defaults': {'Foo': ['a', 'b']}}
+        self.assertEqual(
+            data,
+            yaml_utils.safe_load(
+                yaml_utils.safe_dump(data, default_flow_style=False)))
+
+    def test_safe_load_unsafe(self):
+        self.assertRaises(Exception, yaml_utils.safe_load,
+                          '!!python/object/apply:os.getcwd []')
+
+    def test_safe_dump_no_aliases(self):
+        item = {'a': 1}
+        self.assertIn('&', yaml_utils.safe_dump([item, item]))
+        self.assertNotIn('&', yaml_utils.safe_dump([item, item],
+                                                   aliases=False))
+
+    def test_load_file_cached(self):
+        expected = [{'name': 'Controller', 'count': 1}]
+        self.assertEqual(expected, yaml_utils.load_file(self.path))
+        with mock.patch('tripleoclient.yaml_utils.safe_load') as mock_load:
+            data = yaml_utils.load_file(self.path)
+        mock_load.assert_not_called()
+        self.assertEqual(expected, data)
+
+        # callers get their own copy
+        data[0]['count'] = 3
+        self.assertEqual(expected, yaml_utils.load_file(self.path))
+
+    def test_load_file_changed(self):
+        yaml_utils.load_file(self.path)
+        self._write('- name: Compute\n')
+        self.assertEqual([{'name': 'Compute'}],
+                         yaml_utils.load_file(self.path))
+
+    def test_load_file_same_content(self):
+        yaml_utils.load_file(self.path)
+        other = os.path.join(self.tmp_dir, 'copy.yaml')
+        shutil.copy(self.path, other)
+        with mock.patch('tripleoclient.yaml_utils.safe_load') as mock_load:
+            self.assertEqual([{'name': 'Controller', 'count': 1}],
+                             yaml_utils.load_file(other))
+        mock_load.assert_not_called()
+
+    def test_load_file_missing(self):
+        self.assertRaises(IOError, yaml_utils.load_file,
+                          os.path.join(self.tmp_dir, 'missing.yaml'))
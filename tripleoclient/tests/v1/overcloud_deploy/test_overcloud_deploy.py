@@ -28,6 +28,7 @@ from osc_lib.tests import utils
 from tripleoclient import constants
 from tripleoclient import exceptions
 from tripleoclient import plugin
+from tripleoclient import profiling
 from tripleoclient.tests import fakes as ooofakes
 from tripleoclient.tests.fixture_data import deployment
 from tripleoclient.tests.v1.overcloud_deploy import fakes
@@ -54,6 +55,12 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
         history_patcher.start()
         self.addCleanup(history_patcher.stop)
 
+        # Mock the deploy trace to avoid leaking files
+        trace_patcher = mock.patch(
+            'tripleoclient.profiling.write_deploy_trace', autospec=True)
+        self.mock_write_trace = trace_patcher.start()
+        self.addCleanup(trace_patcher.stop)
+
         self.real_shutil = shutil.rmtree
 
         self.uuid1_value = "uuid"
@@ -1580,6 +1587,25 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
         }
         self.assertEqual(expected, function(mock.ANY))
 
+    def test_write_deploy_trace(self):
+        arglist = ['--templates', '--output-dir', self.tmp_dir.path]
+        verifylist = [
+            ('templates', '/usr/share/openstack-tripleo-heat-templates/'),
+            ('output_dir', self.tmp_dir.path),
+        ]
+        parsed_args = self.check_parser(self.cmd, arglist, verifylist)
+        with profiling.phase('deploy templates', files=3):
+            pass
+
+        self.cmd._write_deploy_trace(parsed_args, self.time_value,
+                                     'DEPLOY_SUCCESS')
+        self.mock_write_trace.assert_called_once_with(
+            os.path.join(self.tmp_dir.path, 'overcloud',
+                         'deploy-trace.json'),
+            mock.ANY, stack='overcloud', status='DEPLOY_SUCCESS')
+        phases = self.mock_write_trace.call_args[0][1]
+        self.assertIn('deploy templates', [i['phase'] for i in phases])
+
 
 class TestArgumentValidation(fakes.TestDeployOvercloud):
 
@@ -1650,3 +1676,43 @@ class TestGetDeploymentStatus(utils.TestCommand):
             '+-----------+-------------------+\n')
 
         self.assertEqual(expected, self.cmd.app.stdout.getvalue())
+
+
+class TestReportDeploymentProfile(utils.TestCommand):
+
+    def setUp(self):
+        super(TestReportDeploymentProfile, self).setUp()
+        self.cmd = overcloud_deploy.ReportDeploymentProfile(self.app, None)
+        self.app.client_manager = mock.Mock()
+
+    @mock.patch('os.path.isfile', return_value=False)
+    def test_report_no_profile(self, mock_isfile):
+        parsed_args = self.check_parser(self.cmd, [], [])
+        self.assertRaises(oscexc.CommandError,
+                          self.cmd.take_action, parsed_args)
+        mock_isfile.assert_called_once_with(
+            os.path.join(constants.DEFAULT_WORK_DIR,
+                         'overcloud-ansible-profile.jsonl'))
+
+    @mock.patch('tripleoclient.profiling.load_ansible_profile')
+    @mock.patch('os.path.isfile', return_value=True)
+    def test_report(self, mock_isfile, mock_load):
+        mock_load.return_value = [
+            {'play': 'step1', 'task': 'slow task', 'host': 'ctrl-0',
+             'start': 0.0, 'end': 4.0, 'changed': True, 'failed': False},
+            {'play': 'step1', 'task': 'fast task', 'host': 'cmp-0',
+             'start': 1.0, 'end': 2.0, 'changed': False, 'failed': False},
+        ]
+        parsed_args = self.check_parser(
+            self.cmd,
+            ['--profile-file', '/tmp/profile.jsonl', '--limit', '1'],
+            [('profile_file', '/tmp/profile.jsonl'), ('limit', 1)])
+        self.cmd.app.stdout = six.StringIO()
+
+        self.cmd.take_action(parsed_args)
+
+        mock_load.assert_called_once_with('/tmp/profile.jsonl')
+        output = self.cmd.app.stdout.getvalue()
+        self.assertIn('slow task', output)
+        self.assertNotIn('fast task', output)
+        self.assertIn('| step1 |      4.00     |     ctrl-0    |', output)
@@ -13,9 +13,13 @@
 #   under the License.
 #
 
+from concurrent import futures
 from datetime import datetime
+import io
 import mock
 import os
+import shutil
+import tempfile
 
 from osc_lib import exceptions
 import tripleo_common.arch
@@ -122,6 +126,125 @@ class TestOvercloudImageBuild(TestPluginV1):
             skip=True,
             images=None)
 
+    @mock.patch('sys.stdout', new_callable=io.StringIO)
+    @mock.patch('concurrent.futures.ProcessPoolExecutor', autospec=True,
+                side_effect=lambda max_workers: futures.ThreadPoolExecutor(
+                    max_workers))
+    @mock.patch.dict(os.environ, {'DIB_IMAGE_CACHE': '/cache'})
+    @mock.patch('tripleoclient.utils.makedirs', autospec=True)
+    @mock.patch('tripleo_common.image.build.ImageBuildManager', autospec=True)
+    def test_overcloud_image_build_sequential(self, mock_manager,
+                                              mock_makedirs, mock_executor,
+                                              mock_stdout):
+        arglist = ['--config-file', 'config.yaml', '--temp-dir', '/tmp/build']
+        verifylist = [('config_files', ['config.yaml']),
+                      ('parallel', 1)]
+        mock_manager.return_value.load_config_files.return_value = [
+            {'imagename': 'overcloud-full', 'arch': 'x86_64'},
+            {'imagename': 'ironic-python-agent', 'arch': 'x86_64'}]
+        environments = {}
+
+        def _build():
+            name = mock_manager.call_args[1]['images'][0]
+            environments[name] = (os.environ['TMPDIR'],
+                                  os.environ['DIB_IMAGE_CACHE'])
+        mock_manager.return_value.build.side_effect = _build
+
+        parsed_args = self.check_parser(self.cmd, arglist, verifylist)
+
+        self.cmd.take_action(parsed_args)
+
+        mock_executor.assert_called_once_with(max_workers=1)
+        mock_manager.assert_has_calls([
+            mock.call(['config.yaml'], output_directory='.', skip=True,
+                      images=['overcloud-full']),
+            mock.call(['config.yaml'], output_directory='.', skip=True,
+                      images=['ironic-python-agent']),
+        ], any_order=True)
+        # the images built one after the other share the cache
+        self.assertEqual(
+            {'overcloud-full': ('/tmp/build/build-overcloud-full',
+                                '/cache'),
+             'ironic-python-agent': ('/tmp/build/build-ironic-python-agent',
+                                     '/cache')},
+            environments)
+        output = mock_stdout.getvalue()
+        self.assertIn('Duration', output)
+        self.assertIn('overcloud-full', output)
+        self.assertIn('ironic-python-agent', output)
+        self.assertEqual(2, output.count('COMPLETE'))
+
+    # Build in a single thread, the builds change the environment
+    @mock.patch('concurrent.futures.ProcessPoolExecutor',
+                lambda max_workers: futures.ThreadPoolExecutor(1))
+    @mock.patch.dict(os.environ, {'DIB_IMAGE_CACHE': '/cache'})
+    @mock.patch('tripleoclient.utils.makedirs', autospec=True)
+    @mock.patch('tripleo_common.image.build.ImageBuildManager', autospec=True)
+    def test_overcloud_image_build_parallel(self, mock_manager,
+                                            mock_makedirs):
+        arglist = ['--config-file', 'config.yaml', '--parallel', '2',
+                   '--temp-dir', '/tmp/build']
+        verifylist = [('config_files', ['config.yaml']),
+                      ('parallel', 2)]
+        mock_manager.return_value.load_config_files.return_value = [
+            {'imagename': 'overcloud-full', 'arch': 'x86_64'},
+            {'imagename': 'ironic-python-agent', 'arch': 'ppc64le'}]
+
+        environments = {}
+
+        def _build():
+            name = mock_manager.call_args[1]['images'][0]
+            environments[name] = (os.environ['TMPDIR'],
+                                  os.environ['DIB_IMAGE_CACHE'],
+                                  os.environ.get('DIB_RELEASE'))
+            # the diskimage-builder wrapper updates the environment
+            os.environ['DIB_RELEASE'] = name
+            os.environ['DIB_IMAGE_CACHE'] = '/other'
+        mock_manager.return_value.build.side_effect = _build
+
+        parsed_args = self.check_parser(self.cmd, arglist, verifylist)
+
+        self.cmd.take_action(parsed_args)
+
+        mock_manager.assert_has_calls([
+            mock.call(['config.yaml'], output_directory='.', skip=True,
+                      images=['overcloud-full']),
+            mock.call(['config.yaml'], output_directory='.', skip=True,
+                      images=['ironic-python-agent']),
+        ], any_order=True)
+        self.assertEqual(2, mock_manager.return_value.build.call_count)
+        mock_makedirs.assert_has_calls([
+            mock.call('/tmp/build/build-overcloud-full'),
+            mock.call('/tmp/build/build-ironic-python-agent'),
+        ], any_order=True)
+        self.assertEqual(
+            {'overcloud-full': ('/tmp/build/build-overcloud-full',
+                                '/cache/overcloud-full', None),
+             'ironic-python-agent': ('/tmp/build/build-ironic-python-agent',
+                                     '/cache/ironic-python-agent', None)},
+            environments)
+        self.assertEqual('/cache', os.environ['DIB_IMAGE_CACHE'])
+        self.assertNotIn('DIB_RELEASE', os.environ)
+
+    # Build in a single thread, the builds change the environment
+    @mock.patch('concurrent.futures.ProcessPoolExecutor',
+                lambda max_workers: futures.ThreadPoolExecutor(1))
+    @mock.patch.dict(os.environ, {})
+    @mock.patch('tripleoclient.utils.makedirs', autospec=True)
+    @mock.patch('tripleo_common.image.build.ImageBuildManager', autospec=True)
+    def test_overcloud_image_build_parallel_fail(self, mock_manager,
+                                                 mock_makedirs):
+        arglist = ['--config-file', 'config.yaml', '--parallel', '2']
+        verifylist = [('parallel', 2)]
+        mock_manager.return_value.load_config_files.return_value = [
+            {'imagename': 'overcloud-full', 'arch': 'x86_64'}]
+        mock_manager.return_value.build.side_effect = OSError('no space')
+
+        parsed_args = self.check_parser(self.cmd, arglist, verifylist)
+
+        self.assertRaises(exceptions.CommandError,
+                          self.cmd.take_action, parsed_args)
+
 
 class TestBaseClientAdapter(base.TestCommand):
 
@@ -162,7 +285,8 @@ class TestBaseClientAdapter(base.TestCommand):
     def test_copy_file(self, mock_subprocess_call):
         self.adapter._copy_file('/foo.qcow2', 'bar.qcow2')
         mock_subprocess_call.assert_called_once_with(
-            'sudo cp -f "/foo.qcow2" "bar.qcow2"', shell=True)
+            'sudo cp -f --reflink=auto --sparse=always "/foo.qcow2" '
+            '"bar.qcow2"', shell=True)
 
     @mock.patch('subprocess.check_call', autospec=True)
     def test_move_file(self, mock_subprocess_call):
@@ -176,6 +300,55 @@ class TestBaseClientAdapter(base.TestCommand):
         mock_subprocess_call.assert_called_once_with(
             'sudo mkdir -m 0775 -p "/foo/bar/baz"', shell=True)
 
+    @mock.patch('subprocess.check_call', autospec=True)
+    def test_convert_image_cached(self, mock_subprocess_call):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        src = os.path.join(tmp_dir, 'overcloud-full.qcow2')
+        dest = os.path.join(tmp_dir, 'overcloud-full.raw')
+        for path in (src, dest):
+            with open(path, 'w') as f:
+                f.write(path)
+
+        with mock.patch('tripleoclient.constants.IMAGE_CONVERT_CACHE_DIR',
+                        os.path.join(tmp_dir, 'cache')), \
+                mock.patch('tripleoclient.utils.file_checksum',
+                           return_value='abcd'):
+            self.adapter._convert_image(src, dest)
+            mock_subprocess_call.assert_has_calls([
+                mock.call('sudo qemu-img convert -S 4k -O raw "%s" "%s.tmp"'
+                          % (src, dest), shell=True),
+                mock.call('sudo mv "%s.tmp" "%s"' % (dest, dest),
+                          shell=True)
+            ])
+
+            # the source and the raw image didn't change
+            mock_subprocess_call.reset_mock()
+            self.adapter._convert_image(src, dest)
+            mock_subprocess_call.assert_not_called()
+
+            # the raw image was replaced
+            os.unlink(dest)
+            with open(dest, 'w') as f:
+                f.write('other')
+            self.adapter._convert_image(src, dest)
+            self.assertEqual(2, mock_subprocess_call.call_count)
+
+    def test_chunked_file_wrapper(self):
+        wrapped = mock.Mock()
+        wrapped.read.side_effect = [b'a' * 8192, b'']
+        handle = overcloud_image.ChunkedFileWrapper(wrapped, 1048576)
+        self.assertEqual([b'a' * 8192], list(handle))
+        wrapped.read.assert_called_with(1048576)
+
+        wrapped.read.side_effect = None
+        handle.read(8192)
+        wrapped.read.assert_called_with(1048576)
+        handle.read(2097152)
+        wrapped.read.assert_called_with(2097152)
+        handle.read()
+        wrapped.read.assert_called_with(-1)
+
 
 class TestFileImageClientAdapter(TestPluginV1):
 
@@ -351,7 +524,8 @@ class TestFileImageClientAdapter(TestPluginV1):
         self.assertEqual(self.image, result)
         mock_subprocess_call.assert_has_calls([
             mock.call('sudo mkdir -m 0775 -p "/my/images/x86_64"', shell=True),
-            mock.call('sudo cp -f "/home/foo/overcloud-full.qcow2" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"/home/foo/overcloud-full.qcow2" '
                       '"/my/images/x86_64/overcloud-full.qcow2"', shell=True)
         ])
 
@@ -570,17 +744,25 @@ class TestUploadOvercloudImage(TestPluginV1):
                       data=mock.ANY,
                       validate_checksum=False,
                       visibility='public'),
-        ])
+        ], any_order=True)
+        # the overcloud image is linked once all the images are uploaded
+        self.assertEqual(
+            mock.call(mock.ANY, kernel_id=mock.ANY, ramdisk_id=mock.ANY),
+            self.app.client_manager.image.update_image.call_args)
 
         self.assertEqual(mock_convert_image.call_count, 1)
         self.assertEqual(mock_subprocess_call.call_count, 2)
         mock_subprocess_call.assert_has_calls([
-            mock.call('sudo cp -f "./ironic-python-agent.kernel" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"./ironic-python-agent.kernel" '
                       '"/var/lib/ironic/httpboot/agent.kernel"', shell=True),
-            mock.call('sudo cp -f "./ironic-python-agent.initramfs" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"./ironic-python-agent.initramfs" '
                       '"/var/lib/ironic/httpboot/agent.ramdisk"', shell=True)
         ])
 
+    @mock.patch('tripleoclient.v1.overcloud_image.'
+                'BaseClientAdapter._convert_image', autospec=True)
     @mock.patch('os.path.isfile')
     @mock.patch('subprocess.check_call', autospec=True)
     @mock.patch('tripleoclient.v1.overcloud_image.'
@@ -591,7 +773,8 @@ class TestUploadOvercloudImage(TestPluginV1):
                                                 mock_image_try_update,
                                                 mock_get_image,
                                                 mock_subprocess_call,
-                                                mock_isfile):
+                                                mock_isfile,
+                                                mock_convert_image):
         parsed_args = self.check_parser(self.cmd,
                                         ['--image-path', '/foo'],
                                         [])
@@ -611,11 +794,13 @@ class TestUploadOvercloudImage(TestPluginV1):
             mock.call(self.cmd.adapter,
                       'overcloud-full',
                       '/foo/overcloud-full.raw'),
-        ])
+        ], any_order=True)
         mock_subprocess_call.assert_has_calls([
-            mock.call('sudo cp -f "/foo/ironic-python-agent.kernel" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"/foo/ironic-python-agent.kernel" '
                       '"/var/lib/ironic/httpboot/agent.kernel"', shell=True),
-            mock.call('sudo cp -f "/foo/ironic-python-agent.initramfs" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"/foo/ironic-python-agent.initramfs" '
                       '"/var/lib/ironic/httpboot/agent.ramdisk"', shell=True)
         ])
 
@@ -703,7 +888,9 @@ class TestUploadOvercloudImage(TestPluginV1):
             self.app.client_manager.image.create_image.call_count
         )
         self.assertEqual(
-            6,  # 3 for new uploads, 3 updating the existsing
+            # 3 for new uploads, 3 updating the existsing, 1 linking the
+            # overcloud image to its kernel and ramdisk
+            7,
             self.app.client_manager.image.update_image.call_count
         )
         self.assertEqual(mock_convert_image.call_count, 1)
@@ -782,9 +969,11 @@ class TestUploadOvercloudImageFull(TestPluginV1):
         self.assertEqual(mock_convert_image.call_count, 1)
         self.assertEqual(mock_subprocess_call.call_count, 2)
         mock_subprocess_call.assert_has_calls([
-            mock.call('sudo cp -f "./ironic-python-agent.kernel" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"./ironic-python-agent.kernel" '
                       '"/var/lib/ironic/httpboot/agent.kernel"', shell=True),
-            mock.call('sudo cp -f "./ironic-python-agent.initramfs" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"./ironic-python-agent.initramfs" '
                       '"/var/lib/ironic/httpboot/agent.ramdisk"', shell=True)
         ])
 
@@ -832,9 +1021,11 @@ class TestUploadOvercloudImageFull(TestPluginV1):
         self.assertEqual(mock_convert_image.call_count, 1)
         self.assertEqual(mock_subprocess_call.call_count, 2)
         mock_subprocess_call.assert_has_calls([
-            mock.call('sudo cp -f "./ironic-python-agent.kernel" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"./ironic-python-agent.kernel" '
                       '"/var/lib/ironic/httpboot/agent.kernel"', shell=True),
-            mock.call('sudo cp -f "./ironic-python-agent.initramfs" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"./ironic-python-agent.initramfs" '
                       '"/var/lib/ironic/httpboot/agent.ramdisk"', shell=True)
         ])
 
@@ -1021,13 +1212,17 @@ class TestUploadOvercloudImageFullMultiArch(TestPluginV1):
         self.assertEqual(mock_convert_image.call_count, 2)
         self.assertEqual(mock_subprocess_call.call_count, 4)
         mock_subprocess_call.assert_has_calls([
-            mock.call('sudo cp -f "./ironic-python-agent.kernel" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"./ironic-python-agent.kernel" '
                       '"/var/lib/ironic/httpboot/agent.kernel"', shell=True),
-            mock.call('sudo cp -f "./ironic-python-agent.initramfs" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"./ironic-python-agent.initramfs" '
                       '"/var/lib/ironic/httpboot/agent.ramdisk"', shell=True),
-            mock.call('sudo cp -f "./ironic-python-agent.kernel" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"./ironic-python-agent.kernel" '
                       '"/httpboot/ppc64le/agent.kernel"', shell=True),
-            mock.call('sudo cp -f "./ironic-python-agent.initramfs" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"./ironic-python-agent.initramfs" '
                       '"/httpboot/ppc64le/agent.ramdisk"', shell=True),
         ])
 
@@ -1104,17 +1299,23 @@ class TestUploadOvercloudImageFullMultiArch(TestPluginV1):
         self.assertEqual(mock_convert_image.call_count, 3)
         self.assertEqual(mock_subprocess.call_count, 6)
         mock_subprocess.assert_has_calls([
-            mock.call('sudo cp -f "./ironic-python-agent.kernel" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"./ironic-python-agent.kernel" '
                       '"/var/lib/ironic/httpboot/agent.kernel"', shell=True),
-            mock.call('sudo cp -f "./ironic-python-agent.initramfs" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"./ironic-python-agent.initramfs" '
                       '"/var/lib/ironic/httpboot/agent.ramdisk"', shell=True),
-            mock.call('sudo cp -f "./ironic-python-agent.kernel" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"./ironic-python-agent.kernel" '
                       '"/httpboot/ppc64le/agent.kernel"', shell=True),
-            mock.call('sudo cp -f "./ironic-python-agent.initramfs" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"./ironic-python-agent.initramfs" '
                       '"/httpboot/ppc64le/agent.ramdisk"', shell=True),
-            mock.call('sudo cp -f "./ironic-python-agent.kernel" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"./ironic-python-agent.kernel" '
                       '"/httpboot/p9-ppc64le/agent.kernel"', shell=True),
-            mock.call('sudo cp -f "./ironic-python-agent.initramfs" '
+            mock.call('sudo cp -f --reflink=auto --sparse=always '
+                      '"./ironic-python-agent.initramfs" '
                       '"/httpboot/p9-ppc64le/agent.ramdisk"', shell=True),
         ])
 
@@ -1177,6 +1378,8 @@ class TestUploadOnlyExisting(TestPluginV1):
 
         self.assertFalse(mock_image_try_update.called)
 
+    @mock.patch('tripleoclient.v1.overcloud_image.'
+                'BaseClientAdapter._convert_image', autospec=True)
     @mock.patch('subprocess.check_call', autospec=True)
     @mock.patch('os.path.isfile', autospec=True)
     @mock.patch('tripleoclient.v1.overcloud_image.'
@@ -1190,7 +1393,8 @@ class TestUploadOnlyExisting(TestPluginV1):
                                                 mock_image_changed,
                                                 mock_image_try_update,
                                                 mock_isfile_call,
-                                                mock_subprocess_call):
+                                                mock_subprocess_call,
+                                                mock_convert_image):
         mock_image_changed.return_value = True
         mock_image_try_update.return_value = None
 
@@ -1243,6 +1447,8 @@ class TestUploadOnlyExisting(TestPluginV1):
 
         self.assertFalse(mock_image_try_update.called)
 
+    @mock.patch('tripleoclient.v1.overcloud_image.'
+                'BaseClientAdapter._convert_image', autospec=True)
     @mock.patch('subprocess.check_call', autospec=True)
     @mock.patch('os.path.isfile', autospec=True)
     @mock.patch('tripleoclient.v1.overcloud_image.'
@@ -1256,7 +1462,8 @@ class TestUploadOnlyExisting(TestPluginV1):
                                       mock_image_changed,
                                       mock_image_try_update,
                                       mock_isfile_call,
-                                      mock_subprocess_call):
+                                      mock_subprocess_call,
+                                      mock_convert_image):
         mock_image_changed.return_value = True
         mock_image_try_update.return_value = None
 
@@ -1282,4 +1489,4 @@ class TestUploadOnlyExisting(TestPluginV1):
             mock.call(self.cmd.adapter,
                       'overcloud-full',
                       './overcloud-full.raw'),
-        ])
+        ], any_order=True)
@@ -33,7 +33,7 @@ class TestOvercloudExport(utils.TestCommand):
         self.mock_open = mock.mock_open()
 
     @mock.patch('os.path.exists')
-    @mock.patch('yaml.safe_dump')
+    @mock.patch('tripleoclient.yaml_utils.safe_dump')
     @mock.patch('tripleoclient.export.export_stack')
     @mock.patch('tripleoclient.export.export_passwords')
     def test_export(self, mock_export_passwords,
@@ -65,7 +65,7 @@ class TestOvercloudExport(utils.TestCommand):
             mock_safe_dump.call_args[0][0])
 
     @mock.patch('os.path.exists')
-    @mock.patch('yaml.safe_dump')
+    @mock.patch('tripleoclient.yaml_utils.safe_dump')
     @mock.patch('tripleoclient.export.export_stack')
     @mock.patch('tripleoclient.export.export_passwords')
     def test_export_stack_name(self, mock_export_passwords,
@@ -90,7 +90,7 @@ class TestOvercloudExport(utils.TestCommand):
             path)
 
     @mock.patch('os.path.exists')
-    @mock.patch('yaml.safe_dump')
+    @mock.patch('tripleoclient.yaml_utils.safe_dump')
     @mock.patch('tripleoclient.export.export_stack')
     @mock.patch('tripleoclient.export.export_passwords')
     def test_export_stack_name_and_dir(self, mock_export_passwords,
@@ -114,7 +114,7 @@ class TestOvercloudExport(utils.TestCommand):
             '/tmp/bar')
 
     @mock.patch('os.path.exists')
-    @mock.patch('yaml.safe_dump')
+    @mock.patch('tripleoclient.yaml_utils.safe_dump')
     @mock.patch('tripleoclient.export.export_stack')
     @mock.patch('tripleoclient.export.export_passwords')
     def test_export_no_excludes(self, mock_export_passwords,
@@ -207,7 +207,7 @@ class TestDeployUndercloud(TestPluginV1):
             'Bar')
 
     @mock.patch('os.path.exists', side_effect=[True, False])
-    @mock.patch('shutil.copytree')
+    @mock.patch('tripleoclient.utils.copy_templates_tree')
     @mock.patch('tripleoclient.v1.tripleo_deploy.Deploy.'
                 '_create_working_dirs')
     def test_populate_templates_dir(self, mock_workingdirs, mock_copy,
@@ -215,7 +215,7 @@ class TestDeployUndercloud(TestPluginV1):
         self.cmd.tht_render = '/foo'
         self.cmd._populate_templates_dir('/bar')
         mock_workingdirs.assert_called_once()
-        mock_copy.assert_called_once_with('/bar', '/foo', symlinks=True)
+        mock_copy.assert_called_once_with('/bar', '/foo')
 
     @mock.patch('os.path.exists', return_value=False)
     @mock.patch('tripleoclient.v1.tripleo_deploy.Deploy.'
@@ -233,7 +233,7 @@ class TestDeployUndercloud(TestPluginV1):
     # TODO(cjeanner) drop once we have proper oslo.privsep
     @mock.patch('subprocess.check_call', autospec=True)
     @mock.patch('tripleo_common.utils.passwords.generate_passwords')
-    @mock.patch('yaml.safe_dump')
+    @mock.patch('tripleoclient.yaml_utils.safe_dump')
     def test_update_passwords_env_init(self, mock_dump, mock_pw, mock_cc,
                                        mock_exists, mock_chmod, mock_user):
         pw_dict = {"GeneratedPassword": 123}
@@ -257,7 +257,7 @@ class TestDeployUndercloud(TestPluginV1):
     # TODO(cjeanner) drop once we have proper oslo.privsep
     @mock.patch('subprocess.check_call', autospec=True)
     @mock.patch('tripleo_common.utils.passwords.generate_passwords')
-    @mock.patch('yaml.safe_dump')
+    @mock.patch('tripleoclient.yaml_utils.safe_dump')
     def test_update_passwords_env(self, mock_dump, mock_pw, mock_cc,
                                   mock_exists, mock_chmod, mock_user):
         pw_dict = {"GeneratedPassword": 123, "LegacyPass": "override me"}
@@ -301,7 +301,7 @@ class TestDeployUndercloud(TestPluginV1):
     # TODO(bogdando) drop once we have proper oslo.privsep
     @mock.patch('subprocess.check_call', autospec=True)
     @mock.patch('tripleo_common.utils.passwords.generate_passwords')
-    @mock.patch('yaml.safe_dump')
+    @mock.patch('tripleoclient.yaml_utils.safe_dump')
     def test_update_passwords_env_upgrade(self, mock_dump, mock_pw, mock_cc,
                                           mock_exists, mock_chmod, mock_user):
         pw_dict = {"GeneratedPassword": 123, "LegacyPass": "override me"}
@@ -398,6 +398,47 @@ class TestDeployUndercloud(TestPluginV1):
             mock.call(env_path='../outside.yaml',
                       include_env_in_files=False)])
 
+    @mock.patch('tripleoclient.utils.get_stack_event_marker',
+                return_value='marker')
+    @mock.patch('tripleoclient.utils.get_stack')
+    @mock.patch('heatclient.common.template_utils.'
+                'process_environment_and_files', return_value=({}, {}),
+                autospec=True)
+    @mock.patch('heatclient.common.template_utils.'
+                'get_template_contents', return_value=({}, {}),
+                autospec=True)
+    @mock.patch('tripleoclient.v1.tripleo_deploy.Deploy.'
+                '_setup_heat_environments', autospec=True)
+    @mock.patch('tripleo_common.image.kolla_builder.'
+                'container_images_prepare_multi')
+    def test_deploy_tripleo_heat_templates_restored_state(
+            self, mock_cipm, mock_setup_heat_envs, mock_hc_get_templ_cont,
+            mock_hc_process, mock_get_stack, mock_marker):
+
+        with tempfile.NamedTemporaryFile(delete=False) as roles_file:
+            self.addCleanup(os.unlink, roles_file.name)
+
+        mock_cipm.return_value = {}
+        mock_setup_heat_envs.return_value = []
+        mock_get_stack.return_value = mock.Mock(id='stack-id')
+        self.cmd.heat_state_restored = True
+
+        parsed_args = self.check_parser(self.cmd,
+                                        ['--local-ip', '127.0.0.1/8',
+                                         '--templates', '/tmp/thtroot',
+                                         '--roles-file', roles_file.name], [])
+
+        self.assertEqual(
+            'undercloud/stack-id',
+            self.cmd._deploy_tripleo_heat_templates(self.orc, parsed_args))
+        self.orc.stacks.update.assert_called_once_with(
+            'stack-id', stack_name='undercloud', template={},
+            environment={}, files={})
+        self.orc.stacks.create.assert_not_called()
+        self.assertEqual('UPDATE', self.cmd.heat_stack_operation)
+        self.assertEqual('marker', self.cmd.heat_stack_marker)
+
+    @mock.patch('tripleoclient.yaml_utils.load_file', return_value=[])
     @mock.patch('tripleoclient.utils.rel_or_abs_path')
     @mock.patch('heatclient.common.template_utils.'
                 'process_environment_and_files', return_value=({}, {}),
@@ -411,8 +452,8 @@ class TestDeployUndercloud(TestPluginV1):
                 'parse', autospec=True, return_value=dict())
     @mock.patch('tripleoclient.v1.tripleo_deploy.Deploy.'
                 '_setup_heat_environments', autospec=True)
-    @mock.patch('yaml.safe_dump', autospec=True)
-    @mock.patch('yaml.safe_load', autospec=True)
+    @mock.patch('tripleoclient.yaml_utils.safe_dump', autospec=True)
+    @mock.patch('tripleoclient.yaml_utils.safe_load', autospec=True)
     @mock.patch('six.moves.builtins.open')
     @mock.patch('tempfile.NamedTemporaryFile', autospec=True)
     @mock.patch('tripleo_common.image.kolla_builder.'
@@ -427,7 +468,8 @@ class TestDeployUndercloud(TestPluginV1):
                                                    mock_hc_env_parse,
                                                    mock_hc_get_templ_cont,
                                                    mock_hc_process,
-                                                   mock_norm_path):
+                                                   mock_norm_path,
+                                                   mock_load_file):
         def hc_process(*args, **kwargs):
             if 'abs.yaml' in kwargs['env_path']:
                 raise hc_exc.CommandError
@@ -487,8 +529,8 @@ class TestDeployUndercloud(TestPluginV1):
                 'parse', autospec=True, return_value=dict())
     @mock.patch('tripleoclient.v1.tripleo_deploy.Deploy.'
                 '_setup_heat_environments', autospec=True)
-    @mock.patch('yaml.safe_dump', autospec=True)
-    @mock.patch('yaml.safe_load', autospec=True)
+    @mock.patch('tripleoclient.yaml_utils.safe_dump', autospec=True)
+    @mock.patch('tripleoclient.yaml_utils.safe_load', autospec=True)
     @mock.patch('six.moves.builtins.open')
     @mock.patch('tempfile.NamedTemporaryFile', autospec=True)
     @mock.patch('tripleo_common.image.kolla_builder.'
@@ -611,9 +653,12 @@ class TestDeployUndercloud(TestPluginV1):
                                                      env_files)
         self.assertEqual(expected, results)
 
+    @mock.patch('tripleoclient.yaml_utils.load_file', return_value={},
+                autospec=True)
     @mock.patch('time.time', return_value=123)
-    @mock.patch('yaml.safe_load', return_value={}, autospec=True)
-    @mock.patch('yaml.safe_dump', autospec=True)
+    @mock.patch('tripleoclient.yaml_utils.safe_load', return_value={},
+                autospec=True)
+    @mock.patch('tripleoclient.yaml_utils.safe_dump', autospec=True)
     @mock.patch('os.path.isfile', return_value=True)
     @mock.patch('six.moves.builtins.open')
     @mock.patch('tripleoclient.v1.tripleo_deploy.Deploy.'
@@ -629,7 +674,7 @@ class TestDeployUndercloud(TestPluginV1):
     def test_setup_heat_environments_dropin(
             self, mock_run, mock_paths, mock_norm, mock_update_pass_env,
             mock_process_hiera, mock_open, mock_os, mock_yaml_dump,
-            mock_yaml_load, mock_time):
+            mock_yaml_load, mock_time, mock_load_file):
 
         parsed_args = self.check_parser(self.cmd,
                                         ['--local-ip', '127.0.0.1/8',
@@ -14,6 +14,10 @@
 #
 
 import mock
+import os
+import shutil
+import tempfile
+from unittest import TestCase
 
 from tripleoclient.tests import fakes
 from tripleoclient.tests.v1.overcloud_deploy import fakes as deploy_fakes
@@ -27,19 +31,19 @@ container_images:
 """
 
 MOCK_WALK = [
-    ("", ["base"], [],),
-    ("/base", ["memcached", "openstack"], ["config.yaml", "test.doc"],),
-    ("/base/memcached", [], ["memcached.yaml"],),
-    ("/base/openstack", ["glance", "keystone", "neutron", "nova"], [],),
+    ("tcib", ["base"], [],),
+    ("tcib/base", ["memcached", "openstack"], ["config.yaml", "test.doc"],),
+    ("tcib/base/memcached", [], ["memcached.yaml"],),
+    ("tcib/base/openstack", ["glance", "keystone", "neutron", "nova"], [],),
     (
-        "/base/openstack/glance",
+        "tcib/base/openstack/glance",
         [],
         ["glance-registry.yaml", "glance-api.yaml"],
     ),
-    ("/base/openstack/keystone", [], ["keystone.yaml"],),
-    ("/base/openstack/neutron", ["api"], [],),
-    ("/base/openstack/neutron/api", [], ["neutron-api.yml"],),
-    ("/base/openstack/nova", [], [],),
+    ("tcib/base/openstack/keystone", [], ["keystone.yaml"],),
+    ("tcib/base/openstack/neutron", ["api"], [],),
+    ("tcib/base/openstack/neutron/api", [], ["neutron-api.yml"],),
+    ("tcib/base/openstack/nova", [], [],),
 ]
 
 
@@ -113,6 +117,21 @@ class TestContainerImages(deploy_fakes.TestDeployOvercloud):
             ],
         )
 
+    def test_index_config_single_walk(self):
+        self.cmd.identified_images = []
+        mock_open = mock.mock_open(read_data='---\ntcib_option: "data"')
+        self.cmd.build_tree("some/path")
+        self.cmd.index_images("some/path")
+        with mock.patch('six.moves.builtins.open', mock_open):
+            self.cmd.find_image("keystone", "some/path", "base-image")
+            self.cmd.find_image("api", "some/path", "base-image")
+        os.walk.assert_called_once_with(os.path.abspath("some/path"))
+        self.assertEqual(
+            ["base", "memcached", "glance", "keystone", "api"],
+            self.cmd.identified_images)
+        self.assertEqual("base", self.cmd.image_parents["keystone"])
+        self.assertEqual("base", self.cmd.image_parents["api"])
+
     def test_image_regex(self):
         image = self.cmd.imagename_to_regex("test/centos-binary-keystone:tag")
         self.assertEqual(image, "keystone")
@@ -246,6 +265,34 @@ class TestContainerImages(deploy_fakes.TestDeployOvercloud):
         self.assertEqual(cfgs, {'foo': rtn_value})
 
 
+class TestContainerImagesConfigTree(TestCase):
+    def setUp(self):
+        super(TestContainerImagesConfigTree, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        # the config path holds the containers config, above the tcib tree
+        for path, file_name in (("config", "tripleo_containers.yaml"),
+                                ("config/tcib/base", "base.yaml"),
+                                ("config/tcib/base/os", "os.yaml")):
+            os.makedirs(os.path.join(self.tmp_dir, path), exist_ok=True)
+            with open(os.path.join(self.tmp_dir, path, file_name), "w") as f:
+                f.write("tcib_option: %s\n" % file_name)
+        cwd = os.getcwd()
+        os.chdir(os.path.join(self.tmp_dir, "config"))
+        self.addCleanup(os.chdir, cwd)
+        self.cmd = tcib.Build(fakes.FakeApp(), None)
+        self.cmd.image_parents = {}
+
+    def test_find_image_relative_path(self):
+        self.assertEqual({"tcib_option": "base.yaml"},
+                         self.cmd.find_image("base", "tcib", "ubi8"))
+        self.assertEqual({"tcib_option": "os.yaml"},
+                         self.cmd.find_image("os", "tcib", "ubi8"))
+        self.assertEqual("config", self.cmd.image_parents["base"])
+        self.assertEqual("base", self.cmd.image_parents["os"])
+        self.assertEqual([{"base": ["os"]}], self.cmd.build_tree("tcib"))
+
+
 class TestContainerImagesHotfix(deploy_fakes.TestDeployOvercloud):
     def setUp(self):
         super(TestContainerImagesHotfix, self).setUp()
@@ -122,3 +122,32 @@ class TestDeploymentWorkflows(utils.TestCommand):
             'timeout')
 
         self.assertEqual(3, mock_playbook.call_count)
+        sessions = set(
+            i[1]['session'] for i in mock_playbook.call_args_list)
+        self.assertEqual(1, len(sessions))
+        workdirs = set(
+            i[1]['workdir'] for i in mock_playbook.call_args_list)
+        self.assertEqual(set([sessions.pop().workdir]), workdirs)
+
+    @mock.patch('tripleoclient.profiling.rotate_ansible_profile',
+                autospec=True)
+    @mock.patch('tripleoclient.utils.run_ansible_playbook',
+                autospec=True)
+    def test_config_download_ansible_profile(self, mock_playbook,
+                                             mock_rotate):
+        log = mock.Mock()
+        stack = mock.Mock()
+        stack.stack_name = 'stacktest'
+        stack.output_show.return_value = {'output': {'output_value': []}}
+        clients = mock.Mock()
+        deployment.config_download(
+            log, clients, stack, output_dir='/tmp/work',
+            ansible_profile=True)
+
+        self.assertEqual(3, mock_playbook.call_count)
+        self.assertEqual(
+            '/tmp/work/stacktest-ansible-profile.jsonl',
+            mock_playbook.call_args[1]['profile_path'])
+        self.assertNotIn('profile_path', mock_playbook.call_args_list[0][1])
+        mock_rotate.assert_called_once_with(
+            '/tmp/work/stacktest-ansible-profile.jsonl')
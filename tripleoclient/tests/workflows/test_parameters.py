@@ -73,7 +73,7 @@ class TestParameterWorkflows(utils.TestCommand):
         flatten.start()
         self.addCleanup(flatten.stop)
 
-    @mock.patch('yaml.safe_load')
+    @mock.patch('tripleoclient.yaml_utils.load_file')
     @mock.patch("six.moves.builtins.open")
     @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
     @mock.patch('tripleoclient.utils.get_tripleo_ansible_inventory',
@@ -116,7 +116,7 @@ class TestParameterWorkflows(utils.TestCommand):
         ]
         mock_playbook.assert_has_calls(calls, any_order=True)
 
-    @mock.patch('yaml.safe_load')
+    @mock.patch('tripleoclient.yaml_utils.load_file')
     @mock.patch("six.moves.builtins.open")
     @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
     @mock.patch('tripleoclient.utils.get_tripleo_ansible_inventory',
@@ -316,7 +316,7 @@ class TestPlanUpdateWorkflows(base.TestCommand):
     @mock.patch("tripleoclient.utils.run_ansible_playbook", autospec=True)
     @mock.patch('tripleoclient.workflows.plan_management._update_passwords',
                 autospec=True)
-    @mock.patch('yaml.safe_load',
+    @mock.patch('tripleoclient.yaml_utils.safe_load',
                 autospec=True)
     @mock.patch('tripleo_common.utils.swift.empty_container',
                 autospec=True)
@@ -20,9 +20,12 @@ try:
 except AttributeError:
     collectionsAbc = collections
 
+from concurrent import futures
+import contextlib
 import csv
 import datetime
 import errno
+import fcntl
 import getpass
 import glob
 import hashlib
@@ -45,28 +48,34 @@ import tempfile
 import time
 import yaml
 
-import ansible_runner
-
-from heatclient.common import event_utils
-from heatclient.common import template_utils
 from heatclient.common import utils as heat_utils
 from heatclient.exc import HTTPNotFound
 from osc_lib import exceptions as oscexc
 from osc_lib.i18n import _
-from oslo_concurrency import processutils
 from six.moves import configparser
 
 from heatclient import exc as hc_exc
 from six.moves.urllib import error as url_error
+from six.moves.urllib import parse
 from six.moves.urllib import request
 
-from tripleo_common.utils import stack as stack_utils
 from tripleoclient import constants
 from tripleoclient import exceptions
+from tripleoclient import profiling
+from tripleoclient import yaml_utils
 
 
 LOG = logging.getLogger(__name__ + ".utils")
 
+# NOTE: Every command imports this module, so dependencies which are slow
+# to import and only needed by a few functions (ansible_runner, openstack,
+# the heat client, tripleo_common inventory...) are imported by those
+# functions rather than at module level. tools/startup_benchmark.py
+# measures the import time of the commands.
+
+# ioctl sharing the data blocks of a file with another one (reflink)
+FICLONE = 0x40049409
+
 
 class Pushd(object):
     """Simple context manager to change directories and then return."""
@@ -229,6 +238,281 @@ def playbook_verbosity(self):
             return self.app_args.verbose_level
 
 
+def _ansible_fact_cache():
+    """Return the ansible fact cache path, creating it when needed.
+
+    :returns: String
+    """
+
+    ansible_fact_path = os.path.join(
+        os.path.expanduser('~'),
+        '.tripleo',
+        'fact_cache'
+    )
+    makedirs(ansible_fact_path)
+    return ansible_fact_path
+
+
+def _write_default_ansible_cfg(plan='overcloud'):
+    """Write the default ansible.cfg for a given plan.
+
+    :param plan: Plan name (Defaults to "overcloud").
+    :type plan: String
+
+    :returns: String
+    """
+
+    config_download = os.path.join(constants.DEFAULT_WORK_DIR, plan)
+    makedirs(config_download)
+    ansible_cfg = os.path.join(config_download, 'ansible.cfg')
+    config = configparser.ConfigParser()
+    if os.path.isfile(ansible_cfg):
+        config.read(ansible_cfg)
+
+    if 'defaults' not in config.sections():
+        config.add_section('defaults')
+
+    config.set('defaults', 'internal_poll_interval', '0.01')
+    with open(ansible_cfg, 'w') as f:
+        config.write(f)
+    return ansible_cfg
+
+
+class AnsibleSession(object):
+    """Reusable ansible-runner execution state for multiple playbooks."""
+
+    def __init__(self, dir_prefix='tripleo-ansible', cleanup=True,
+                 chdir=True):
+        """This context manager holds the state shared by playbook runs.
+
+        The working directory, artifact directory, fact cache, base
+        environment and generated ansible.cfg are created once and reused by
+        every `run_ansible_playbook` call given this session.
+
+        >>> with AnsibleSession() as session:
+        ...     run_ansible_playbook('one.yaml', 'localhost,',
+        ...                          workdir=session.workdir,
+        ...                          session=session)
+        ...     run_ansible_playbook('two.yaml', 'localhost,',
+        ...                          workdir=session.workdir,
+        ...                          session=session)
+
+        :param dir_prefix: prefix to add to the session temp directories
+        :type dir_prefix: `string`
+        :param cleanup: when enabled the session directories will be
+                        removed on exit.
+        :type cleanup: `boolean`
+        :param chdir: Change to/from the session working dir on enter/exit.
+        :type chdir: `boolean`
+        """
+
+        self._workdir = TempDirs(dir_prefix=dir_prefix, cleanup=cleanup,
+                                 chdir=chdir)
+        self._artifacts = TempDirs(dir_prefix=dir_prefix, cleanup=cleanup,
+                                   chdir=False)
+        self.workdir = self._workdir.dir
+        self.artifact_dir = self._artifacts.dir
+        self.runner_files = set()
+        self._fact_cache = None
+        self._base_env = dict()
+        self._ansible_cfg = dict()
+
+    def __enter__(self):
+        self._workdir.__enter__()
+        self._artifacts.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        self._artifacts.__exit__(*args)
+        self._workdir.__exit__(*args)
+
+    @property
+    def fact_cache(self):
+        if not self._fact_cache:
+            self._fact_cache = _ansible_fact_cache()
+        return self._fact_cache
+
+    def base_env(self, workdir, cwd):
+        """Return a copy of the cached base environment.
+
+        :param workdir: Location of the working directory.
+        :type workdir: String
+
+        :param cwd: Current working directory.
+        :type cwd: String
+
+        :returns: Dictionary
+        """
+
+        key = (workdir, cwd)
+        if key not in self._base_env:
+            self._base_env[key] = _ansible_base_env(workdir=workdir, cwd=cwd)
+        return dict(self._base_env[key])
+
+    def ansible_cfg(self, plan='overcloud'):
+        """Return the generated ansible.cfg, writing it only once per plan.
+
+        :param plan: Plan name (Defaults to "overcloud").
+        :type plan: String
+
+        :returns: String
+        """
+
+        if plan not in self._ansible_cfg:
+            self._ansible_cfg[plan] = _write_default_ansible_cfg(plan=plan)
+        return self._ansible_cfg[plan]
+
+    @contextlib.contextmanager
+    def artifact_path(self):
+        """Yield the persistent artifact directory of the session."""
+
+        yield self.artifact_dir
+
+    def reset_runner_env(self):
+        """Remove runner env files written by a previous playbook run."""
+
+        while self.runner_files:
+            path = self.runner_files.pop()
+            if os.path.isfile(path):
+                os.unlink(path)
+
+
+def _ansible_base_env(workdir, cwd):
+    """Return the ansible environment shared by every playbook execution.
+
+    The returned variables only depend on the working directory and the
+    current directory so they can be computed once and reused by an
+    `AnsibleSession`.
+
+    :param workdir: Location of the working directory.
+    :type workdir: String
+
+    :param cwd: Current working directory.
+    :type cwd: String
+
+    :returns: Dictionary
+    """
+
+    env = dict()
+    env['ANSIBLE_SSH_ARGS'] = (
+        '-o UserKnownHostsFile={} '
+        '-o StrictHostKeyChecking=no '
+        '-o ControlMaster=auto '
+        '-o ControlPersist=30m '
+        '-o ServerAliveInterval=64 '
+        '-o ServerAliveCountMax=1024 '
+        '-o Compression=no '
+        '-o TCPKeepAlive=yes '
+        '-o VerifyHostKeyDNS=no '
+        '-o ForwardX11=no '
+        '-o ForwardAgent=yes '
+        '-o PreferredAuthentications=publickey '
+        '-T'
+    ).format(os.devnull)
+    env['ANSIBLE_DISPLAY_FAILED_STDERR'] = True
+    env['ANSIBLE_GATHER_TIMEOUT'] = 45
+    env['ANSIBLE_SSH_RETRIES'] = 3
+    env['ANSIBLE_PIPELINING'] = True
+    env['ANSIBLE_SCP_IF_SSH'] = True
+    env['ANSIBLE_LIBRARY'] = os.path.expanduser(
+        '{}/.ansible/plugins/modules:'
+        '{}:{}:'
+        '/usr/share/ansible/tripleo-plugins/modules:'
+        '/usr/share/ansible/plugins/modules:'
+        '/usr/share/ceph-ansible/library:'
+        '/usr/share/ansible-modules:'
+        '{}/library:'
+        '{}/library'.format(
+            constants.CLOUD_HOME_DIR,
+            os.path.join(workdir, 'modules'),
+            os.path.join(cwd, 'modules'),
+            constants.DEFAULT_VALIDATIONS_BASEDIR,
+            constants.DEFAULT_VALIDATIONS_LEGACY_BASEDIR
+        )
+    )
+    env['ANSIBLE_LOOKUP_PLUGINS'] = os.path.expanduser(
+        '{}/.ansible/plugins/lookup:'
+        '{}:{}:'
+        '/usr/share/ansible/tripleo-plugins/lookup:'
+        '/usr/share/ansible/plugins/lookup:'
+        '/usr/share/ceph-ansible/plugins/lookup:'
+        '{}/lookup_plugins:'
+        '{}/lookup_plugins'.format(
+            constants.CLOUD_HOME_DIR,
+            os.path.join(workdir, 'lookup'),
+            os.path.join(cwd, 'lookup'),
+            constants.DEFAULT_VALIDATIONS_BASEDIR,
+            constants.DEFAULT_VALIDATIONS_LEGACY_BASEDIR
+        )
+    )
+    env['ANSIBLE_CALLBACK_PLUGINS'] = os.path.expanduser(
+        '{}/.ansible/plugins/callback:'
+        '{}:{}:'
+        '/usr/share/ansible/tripleo-plugins/callback:'
+        '/usr/share/ansible/plugins/callback:'
+        '/usr/share/ceph-ansible/plugins/callback:'
+        '{}/callback_plugins:'
+        '{}/callback_plugins'.format(
+            constants.CLOUD_HOME_DIR,
+            os.path.join(workdir, 'callback'),
+            os.path.join(cwd, 'callback'),
+            constants.DEFAULT_VALIDATIONS_BASEDIR,
+            constants.DEFAULT_VALIDATIONS_LEGACY_BASEDIR
+        )
+    )
+    env['ANSIBLE_ACTION_PLUGINS'] = os.path.expanduser(
+        '{}/.ansible/plugins/action:'
+        '{}:{}:'
+        '/usr/share/ansible/tripleo-plugins/action:'
+        '/usr/share/ansible/plugins/action:'
+        '/usr/share/ceph-ansible/plugins/actions:'
+        '{}/action_plugins:'
+        '{}/action_plugins'.format(
+            constants.CLOUD_HOME_DIR,
+            os.path.join(workdir, 'action'),
+            os.path.join(cwd, 'action'),
+            constants.DEFAULT_VALIDATIONS_BASEDIR,
+            constants.DEFAULT_VALIDATIONS_LEGACY_BASEDIR
+        )
+    )
+    env['ANSIBLE_FILTER_PLUGINS'] = os.path.expanduser(
+        '{}/.ansible/plugins/filter:'
+        '{}:{}:'
+        '/usr/share/ansible/tripleo-plugins/filter:'
+        '/usr/share/ansible/plugins/filter:'
+        '/usr/share/ceph-ansible/plugins/filter:'
+        '{}/filter_plugins:'
+        '{}/filter_plugins'.format(
+            constants.CLOUD_HOME_DIR,
+            os.path.join(workdir, 'filter'),
+            os.path.join(cwd, 'filter'),
+            constants.DEFAULT_VALIDATIONS_BASEDIR,
+            constants.DEFAULT_VALIDATIONS_LEGACY_BASEDIR
+        )
+    )
+    env['ANSIBLE_ROLES_PATH'] = os.path.expanduser(
+        '{}/.ansible/roles:'
+        '{}:{}:'
+        '/usr/share/ansible/tripleo-roles:'
+        '/usr/share/ansible/roles:'
+        '/usr/share/ceph-ansible/roles:'
+        '/etc/ansible/roles:'
+        '{}/roles:'
+        '{}/roles'.format(
+            constants.CLOUD_HOME_DIR,
+            os.path.join(workdir, 'roles'),
+            os.path.join(cwd, 'roles'),
+            constants.DEFAULT_VALIDATIONS_BASEDIR,
+            constants.DEFAULT_VALIDATIONS_LEGACY_BASEDIR
+        )
+    )
+    env['ANSIBLE_RETRY_FILES_ENABLED'] = False
+    env['ANSIBLE_HOST_KEY_CHECKING'] = False
+    env['ANSIBLE_CACHE_PLUGIN_TIMEOUT'] = 7200
+
+    return env
+
+
 def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
                          connection='smart', output_callback='tripleo_dense',
                          ssh_user='root', key=None, module_path=None,
@@ -240,7 +524,8 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
                          callback_whitelist=constants.ANSIBLE_CWL,
                          ansible_cfg=None, ansible_timeout=30,
                          reproduce_command=False,
-                         timeout=None, forks=None):
+                         timeout=None, forks=None, session=None,
+                         profile_path=None):
     """Simple wrapper for ansible-playbook.
 
     :param playbook: Playbook filename.
@@ -333,8 +618,23 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
 
     :param timeout: Timeout for ansible to finish playbook execution (minutes).
     :type timeout: int
+
+    :param forks: Number of ansible forks. Defaults to four per CPU, capped
+                  at 100.
+    :type forks: int
+
+    :param session: Ansible session used to reuse the runner environment,
+                    fact cache, artifact directory and generated
+                    ansible.cfg across multiple playbook executions.
+    :type session: `AnsibleSession`
+
+    :param profile_path: Record the per task and per host timing of the
+                         execution and append it to this JSONL file.
+    :type profile_path: String
     """
 
+    import ansible_runner
+
     def _playbook_check(play):
         if not os.path.exists(play):
             play = os.path.join(playbook_dir, play)
@@ -350,7 +650,7 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
                 if os.path.exists(inventory):
                     return inventory
             elif isinstance(inventory, dict):
-                inventory = yaml.safe_dump(
+                inventory = yaml_utils.safe_dump(
                     inventory,
                     default_flow_style=False
                 )
@@ -373,31 +673,39 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
     # Ensure that the ansible-runner env exists
     runner_env = os.path.join(workdir, 'env')
     makedirs(runner_env)
+    if session:
+        session.reset_runner_env()
 
     if extra_vars_file:
         runner_extra_vars = os.path.join(runner_env, 'extravars')
         with open(runner_extra_vars, 'w') as f:
-            f.write(yaml.safe_dump(extra_vars_file, default_flow_style=False))
+            f.write(yaml_utils.safe_dump(extra_vars_file,
+                                         default_flow_style=False))
+        if session:
+            session.runner_files.add(runner_extra_vars)
 
     if timeout and timeout > 0:
         settings_file = os.path.join(runner_env, 'settings')
         timeout_value = timeout * 60
         if os.path.exists(settings_file):
             with open(settings_file, 'r') as f:
-                settings_object = yaml.safe_load(f.read())
+                settings_object = yaml_utils.safe_load(f.read())
                 settings_object['job_timeout'] = timeout_value
         else:
             settings_object = {'job_timeout': timeout_value}
 
         with open(settings_file, 'w') as f:
-            f.write(yaml.safe_dump(settings_object, default_flow_style=False))
+            f.write(yaml_utils.safe_dump(settings_object,
+                                         default_flow_style=False))
+        if session:
+            session.runner_files.add(settings_file)
 
     if isinstance(playbook, (list, set)):
         verified_playbooks = [_playbook_check(play=i) for i in playbook]
         playbook = os.path.join(workdir, 'tripleo-multi-playbook.yaml')
         with open(playbook, 'w') as f:
             f.write(
-                yaml.safe_dump(
+                yaml_utils.safe_dump(
                     [{'import_playbook': i} for i in verified_playbooks],
                     default_flow_style=False
                 )
@@ -431,12 +739,10 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
             )
         )
     cwd = os.getcwd()
-    ansible_fact_path = os.path.join(
-        os.path.expanduser('~'),
-        '.tripleo',
-        'fact_cache'
-    )
-    makedirs(ansible_fact_path)
+    if session:
+        ansible_fact_path = session.fact_cache
+    else:
+        ansible_fact_path = _ansible_fact_cache()
 
     if output_callback not in callback_whitelist.split(','):
         callback_whitelist = ','.join([callback_whitelist, output_callback])
@@ -444,128 +750,16 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
     if not forks:
         forks = min(multiprocessing.cpu_count() * 4, 100)
 
-    env = dict()
-    env['ANSIBLE_SSH_ARGS'] = (
-        '-o UserKnownHostsFile={} '
-        '-o StrictHostKeyChecking=no '
-        '-o ControlMaster=auto '
-        '-o ControlPersist=30m '
-        '-o ServerAliveInterval=64 '
-        '-o ServerAliveCountMax=1024 '
-        '-o Compression=no '
-        '-o TCPKeepAlive=yes '
-        '-o VerifyHostKeyDNS=no '
-        '-o ForwardX11=no '
-        '-o ForwardAgent=yes '
-        '-o PreferredAuthentications=publickey '
-        '-T'
-    ).format(os.devnull)
-    env['ANSIBLE_DISPLAY_FAILED_STDERR'] = True
+    if session:
+        env = session.base_env(workdir=workdir, cwd=cwd)
+    else:
+        env = _ansible_base_env(workdir=workdir, cwd=cwd)
     env['ANSIBLE_FORKS'] = forks
     env['ANSIBLE_TIMEOUT'] = ansible_timeout
-    env['ANSIBLE_GATHER_TIMEOUT'] = 45
-    env['ANSIBLE_SSH_RETRIES'] = 3
-    env['ANSIBLE_PIPELINING'] = True
-    env['ANSIBLE_SCP_IF_SSH'] = True
     env['ANSIBLE_REMOTE_USER'] = ssh_user
     env['ANSIBLE_STDOUT_CALLBACK'] = output_callback
-    env['ANSIBLE_LIBRARY'] = os.path.expanduser(
-        '{}/.ansible/plugins/modules:'
-        '{}:{}:'
-        '/usr/share/ansible/tripleo-plugins/modules:'
-        '/usr/share/ansible/plugins/modules:'
-        '/usr/share/ceph-ansible/library:'
-        '/usr/share/ansible-modules:'
-        '{}/library:'
-        '{}/library'.format(
-            constants.CLOUD_HOME_DIR,
-            os.path.join(workdir, 'modules'),
-            os.path.join(cwd, 'modules'),
-            constants.DEFAULT_VALIDATIONS_BASEDIR,
-            constants.DEFAULT_VALIDATIONS_LEGACY_BASEDIR
-        )
-    )
-    env['ANSIBLE_LOOKUP_PLUGINS'] = os.path.expanduser(
-        '{}/.ansible/plugins/lookup:'
-        '{}:{}:'
-        '/usr/share/ansible/tripleo-plugins/lookup:'
-        '/usr/share/ansible/plugins/lookup:'
-        '/usr/share/ceph-ansible/plugins/lookup:'
-        '{}/lookup_plugins:'
-        '{}/lookup_plugins'.format(
-            constants.CLOUD_HOME_DIR,
-            os.path.join(workdir, 'lookup'),
-            os.path.join(cwd, 'lookup'),
-            constants.DEFAULT_VALIDATIONS_BASEDIR,
-            constants.DEFAULT_VALIDATIONS_LEGACY_BASEDIR
-        )
-    )
-    env['ANSIBLE_CALLBACK_PLUGINS'] = os.path.expanduser(
-        '{}/.ansible/plugins/callback:'
-        '{}:{}:'
-        '/usr/share/ansible/tripleo-plugins/callback:'
-        '/usr/share/ansible/plugins/callback:'
-        '/usr/share/ceph-ansible/plugins/callback:'
-        '{}/callback_plugins:'
-        '{}/callback_plugins'.format(
-            constants.CLOUD_HOME_DIR,
-            os.path.join(workdir, 'callback'),
-            os.path.join(cwd, 'callback'),
-            constants.DEFAULT_VALIDATIONS_BASEDIR,
-            constants.DEFAULT_VALIDATIONS_LEGACY_BASEDIR
-        )
-    )
-    env['ANSIBLE_ACTION_PLUGINS'] = os.path.expanduser(
-        '{}/.ansible/plugins/action:'
-        '{}:{}:'
-        '/usr/share/ansible/tripleo-plugins/action:'
-        '/usr/share/ansible/plugins/action:'
-        '/usr/share/ceph-ansible/plugins/actions:'
-        '{}/action_plugins:'
-        '{}/action_plugins'.format(
-            constants.CLOUD_HOME_DIR,
-            os.path.join(workdir, 'action'),
-            os.path.join(cwd, 'action'),
-            constants.DEFAULT_VALIDATIONS_BASEDIR,
-            constants.DEFAULT_VALIDATIONS_LEGACY_BASEDIR
-        )
-    )
-    env['ANSIBLE_FILTER_PLUGINS'] = os.path.expanduser(
-        '{}/.ansible/plugins/filter:'
-        '{}:{}:'
-        '/usr/share/ansible/tripleo-plugins/filter:'
-        '/usr/share/ansible/plugins/filter:'
-        '/usr/share/ceph-ansible/plugins/filter:'
-        '{}/filter_plugins:'
-        '{}/filter_plugins'.format(
-            constants.CLOUD_HOME_DIR,
-            os.path.join(workdir, 'filter'),
-            os.path.join(cwd, 'filter'),
-            constants.DEFAULT_VALIDATIONS_BASEDIR,
-            constants.DEFAULT_VALIDATIONS_LEGACY_BASEDIR
-        )
-    )
-    env['ANSIBLE_ROLES_PATH'] = os.path.expanduser(
-        '{}/.ansible/roles:'
-        '{}:{}:'
-        '/usr/share/ansible/tripleo-roles:'
-        '/usr/share/ansible/roles:'
-        '/usr/share/ceph-ansible/roles:'
-        '/etc/ansible/roles:'
-        '{}/roles:'
-        '{}/roles'.format(
-            constants.CLOUD_HOME_DIR,
-            os.path.join(workdir, 'roles'),
-            os.path.join(cwd, 'roles'),
-            constants.DEFAULT_VALIDATIONS_BASEDIR,
-            constants.DEFAULT_VALIDATIONS_LEGACY_BASEDIR
-        )
-    )
     env['ANSIBLE_CALLBACK_WHITELIST'] = callback_whitelist
-    env['ANSIBLE_RETRY_FILES_ENABLED'] = False
-    env['ANSIBLE_HOST_KEY_CHECKING'] = False
     env['ANSIBLE_TRANSPORT'] = connection
-    env['ANSIBLE_CACHE_PLUGIN_TIMEOUT'] = 7200
 
     if connection == 'local':
         env['ANSIBLE_PYTHON_INTERPRETER'] = sys.executable
@@ -606,25 +800,20 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
             env.update(extra_env_variables)
 
     if 'ANSIBLE_CONFIG' not in env and not ansible_cfg:
-        config_download = os.path.join(constants.DEFAULT_WORK_DIR, plan)
-        makedirs(config_download)
-        ansible_cfg = os.path.join(config_download, 'ansible.cfg')
-        config = configparser.ConfigParser()
-        if os.path.isfile(ansible_cfg):
-            config.read(ansible_cfg)
-
-        if 'defaults' not in config.sections():
-            config.add_section('defaults')
-
-        config.set('defaults', 'internal_poll_interval', '0.01')
-        with open(ansible_cfg, 'w') as f:
-            config.write(f)
-        env['ANSIBLE_CONFIG'] = ansible_cfg
+        if session:
+            env['ANSIBLE_CONFIG'] = session.ansible_cfg(plan=plan)
+        else:
+            env['ANSIBLE_CONFIG'] = _write_default_ansible_cfg(plan=plan)
     elif 'ANSIBLE_CONFIG' not in env and ansible_cfg:
         env['ANSIBLE_CONFIG'] = ansible_cfg
 
+    if session:
+        artifact_dir = session.artifact_path()
+    else:
+        artifact_dir = TempDirs(chdir=False)
+
     command_path = None
-    with TempDirs(chdir=False) as ansible_artifact_path:
+    with artifact_dir as ansible_artifact_path:
 
         r_opts = {
             'private_data_dir': workdir,
@@ -663,7 +852,18 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
         #                  made available to us, this line should be removed.
         runner_config.env['ANSIBLE_STDOUT_CALLBACK'] = \
             r_opts['envvars']['ANSIBLE_STDOUT_CALLBACK']
-        runner = ansible_runner.Runner(config=runner_config)
+        if profile_path:
+            profiler = profiling.AnsibleProfiler(
+                path=profile_path,
+                playbook=playbook
+            )
+            runner = ansible_runner.Runner(
+                config=runner_config,
+                event_handler=profiler.event_handler
+            )
+        else:
+            profiler = None
+            runner = ansible_runner.Runner(config=runner_config)
 
         if reproduce_command:
             command_path = os.path.join(
@@ -680,8 +880,12 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
             os.chmod(command_path, 0o750)
 
         try:
-            status, rc = runner.run()
+            with profiling.phase('playbook {}'.format(
+                    os.path.basename(playbook))):
+                status, rc = runner.run()
         finally:
+            if profiler:
+                profiler.write()
             # NOTE(cloudnull): After a playbook executes, ensure the log
             #                  file, if it exists, was created with
             #                  appropriate ownership.
@@ -717,6 +921,189 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
             playbook))
 
 
+class AnsiblePlaybookScheduler(object):
+    """Run ansible playbooks concurrently according to their dependencies."""
+
+    def __init__(self, max_workers=None, log_dir=None):
+        """Schedule playbooks as a DAG of independent executions.
+
+        Every playbook is executed by `run_ansible_playbook` in its own
+        private data directory. A playbook starts as soon as all of the
+        playbooks it requires have succeeded, and is skipped when one of
+        them failed.
+
+        >>> scheduler = AnsiblePlaybookScheduler(log_dir='/tmp/logs')
+        >>> scheduler.add('introspection', 'introspect.yaml', 'localhost,')
+        >>> scheduler.add('image-upload', 'upload.yaml', 'localhost,')
+        >>> scheduler.add('provide', 'provide.yaml', 'localhost,',
+        ...               requires=['introspection'])
+        >>> results = scheduler.run()
+
+        :param max_workers: Maximum number of concurrent playbooks. Defaults
+                            to the number of CPUs.
+        :type max_workers: Integer
+
+        :param log_dir: Directory where every playbook writes its own
+                        ansible log, named after the playbook job.
+        :type log_dir: String
+        """
+
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self.log_dir = log_dir
+        self.jobs = collections.OrderedDict()
+
+    def add(self, name, playbook, inventory, requires=None, **kwargs):
+        """Add a playbook to the schedule.
+
+        :param name: Unique name of the playbook job.
+        :type name: String
+
+        :param playbook: Playbook filename.
+        :type playbook: String
+
+        :param inventory: Either proper inventory file, or a coma-separated
+                          list.
+        :type inventory: String
+
+        :param requires: Names of the jobs which must succeed before this
+                         one starts.
+        :type requires: List
+
+        :param kwargs: Additional `run_ansible_playbook` arguments.
+        :type kwargs: Dictionary
+        """
+
+        if name in self.jobs:
+            raise exceptions.InvalidConfiguration(
+                'Playbook job {} is already scheduled'.format(name))
+        kwargs['playbook'] = playbook
+        kwargs['inventory'] = inventory
+        self.jobs[name] = {
+            'requires': list(requires or []),
+            'kwargs': kwargs
+        }
+
+    def _check_graph(self):
+        """Ensure every dependency exists and the graph has no cycle."""
+
+        for name, job in self.jobs.items():
+            for required in job['requires']:
+                if required not in self.jobs:
+                    raise exceptions.InvalidConfiguration(
+                        'Playbook job {} requires unknown job {}'.format(
+                            name, required))
+
+        resolved = set()
+        pending = set(self.jobs)
+        while pending:
+            ready = [i for i in pending
+                     if set(self.jobs[i]['requires']) <= resolved]
+            if not ready:
+                raise exceptions.InvalidConfiguration(
+                    'Circular dependency between playbook jobs: {}'.format(
+                        ', '.join(sorted(pending))))
+            resolved.update(ready)
+            pending.difference_update(ready)
+
+    def _run_job(self, name):
+        kwargs = dict(self.jobs[name]['kwargs'])
+        kwargs['parallel_run'] = True
+        kwargs.setdefault('quiet', True)
+        log_path = None
+        if self.log_dir:
+            log_path = os.path.join(self.log_dir, '{}.log'.format(name))
+            extra_env_variables = dict(
+                kwargs.get('extra_env_variables') or dict())
+            extra_env_variables['ANSIBLE_LOG_PATH'] = log_path
+            kwargs['extra_env_variables'] = extra_env_variables
+
+        start = time.time()
+        with TempDirs(dir_prefix='tripleo-playbook', chdir=False) as workdir:
+            kwargs['workdir'] = workdir
+            try:
+                run_ansible_playbook(**kwargs)
+            except Exception as e:
+                return {'status': 'FAILED', 'error': str(e),
+                        'duration': time.time() - start,
+                        'log_path': log_path}
+        return {'status': 'SUCCESS', 'error': None,
+                'duration': time.time() - start,
+                'log_path': log_path}
+
+    def run(self, raise_on_failure=True):
+        """Run every scheduled playbook.
+
+        :param raise_on_failure: Raise a RuntimeError once every job has
+                                 completed if any of them failed.
+        :type raise_on_failure: Boolean
+
+        :returns: OrderedDict of job name to result dictionaries with the
+                  status (SUCCESS, FAILED or SKIPPED), error, duration and
+                  log_path of every job.
+        """
+
+        self._check_graph()
+        if self.log_dir:
+            makedirs(self.log_dir)
+
+        # NOTE: write the default ansible.cfg once, concurrent executions
+        #       would otherwise rewrite the same file.
+        for job in self.jobs.values():
+            kwargs = job['kwargs']
+            if not kwargs.get('ansible_cfg') and \
+                    'ANSIBLE_CONFIG' not in os.environ:
+                kwargs['ansible_cfg'] = _write_default_ansible_cfg(
+                    plan=kwargs.get('plan', 'overcloud'))
+
+        results = dict()
+        pending = list(self.jobs)
+        running = dict()
+        with futures.ThreadPoolExecutor(
+                max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name in list(pending):
+                    requires = self.jobs[name]['requires']
+                    status = [results[i]['status'] for i in requires
+                              if i in results]
+                    if any(i != 'SUCCESS' for i in status):
+                        LOG.warning(
+                            'Skipping playbook job {}, a required job '
+                            'did not succeed'.format(name))
+                        results[name] = {'status': 'SKIPPED', 'error': None,
+                                         'duration': 0, 'log_path': None}
+                        pending.remove(name)
+                    elif len(status) == len(requires):
+                        LOG.info('Starting playbook job {}'.format(name))
+                        running[executor.submit(self._run_job, name)] = name
+                        pending.remove(name)
+
+                if not running:
+                    continue
+
+                done, _ = futures.wait(
+                    running, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+                    LOG.info(
+                        'Playbook job {} finished with status {} in '
+                        '{:.1f}s'.format(
+                            name,
+                            results[name]['status'],
+                            results[name]['duration']
+                        )
+                    )
+
+        results = collections.OrderedDict(
+            (name, results[name]) for name in self.jobs)
+        failed = [k for k, v in results.items() if v['status'] != 'SUCCESS']
+        if failed and raise_on_failure:
+            raise RuntimeError(
+                'Ansible execution failed for playbook jobs: {}'.format(
+                    ', '.join(failed)))
+        return results
+
+
 def convert(data):
     """Recursively converts dictionary keys,values to strings."""
     if isinstance(data, six.string_types):
@@ -827,9 +1214,7 @@ def write_env_file(env_data, env_file, registry_overwrites):
     if registry_overwrites:
         data['resource_registry'] = registry_overwrites
     with open(env_file, "w") as f:
-        dumper = yaml.dumper.SafeDumper
-        dumper.ignore_aliases = lambda self, data: True
-        yaml.dump(data, f, default_flow_style=False, Dumper=dumper)
+        yaml_utils.safe_dump(data, f, aliases=False, default_flow_style=False)
 
 
 def store_cli_param(command_name, parsed_args):
@@ -889,20 +1274,246 @@ def create_tempest_deployer_input(config_name='tempest-deployer-input.conf'):
     # set in [cinder]->enabled_backends
     config.set('volume', 'backend1_name', 'tripleo_iscsi')
 
-    # Update bootable status of a volume Not implemented on icehouse
-    # (default: false)
-    # python-cinderclient supports set-bootable
-    config.set('volume-feature-enabled', 'bootable', 'true')
+    # Update bootable status of a volume Not implemented on icehouse
+    # (default: false)
+    # python-cinderclient supports set-bootable
+    config.set('volume-feature-enabled', 'bootable', 'true')
+
+    # Fix region value because TripleO is using non-standard value
+    for section in ('compute', 'identity', 'image', 'network',
+                    'object-storage', 'orchestration', 'volume'):
+        config.set(section, 'region', 'regionOne')
+
+    with open(config_name, 'w+') as config_file:
+        config.write(config_file)
+
+
+class StackEventWatcher(object):
+    """Incrementally follow the events of a stack and its nested stacks."""
+
+    def __init__(self, orchestration_client, stack, action=None, marker=None,
+                 nested_depth=2, poll_period=5, min_poll_period=1,
+                 max_poll_period=30, out=None):
+        """Watch a stack until its action completes or fails.
+
+        Only events newer than the last seen event are fetched on every poll.
+        When the Heat API supports nested_depth a single cursor covers every
+        nested stack, otherwise one cursor is kept per nested stack and
+        nested stacks are only rediscovered when their parent changed.
+
+        The poll period backs off up to max_poll_period while nothing
+        changes and drops to min_poll_period once no top-level resource is
+        in progress, which is when the stack is about to complete.
+
+        :param orchestration_client: Instance of Orchestration client
+        :type  orchestration_client: heatclient.v1.client.Client
+
+        :param stack: Stack to watch.
+        :type stack: Object
+
+        :param action: Action to wait for (CREATE, UPDATE, ...)
+        :type action: string
+
+        :param marker: UUID of the last stack event before the current action
+        :type  marker: string
+
+        :param nested_depth: Max depth to look for events
+        :type nested_depth: int
+
+        :param poll_period: Poll period in seconds while events are coming.
+        :type poll_period: int
+
+        :param min_poll_period: Poll period in seconds near completion.
+        :type min_poll_period: int
+
+        :param max_poll_period: Largest poll period in seconds.
+        :type max_poll_period: int
+
+        :param out: Stream where the events are written (default stdout).
+        :type out: Object
+        """
+
+        self.client = orchestration_client
+        self.stack_name = stack.stack_name
+        self.stack_id = stack.id
+        self.stack_identifier = "%s/%s" % (stack.stack_name, stack.id)
+        self.action = action
+        self.nested_depth = nested_depth
+        self.poll_period = poll_period
+        self.min_poll_period = min_poll_period
+        self.max_poll_period = max_poll_period
+        self.out = out or sys.stdout
+        # None until the first poll tells if nested_depth is supported
+        self.nested_api = None
+        # stack identifier -> (marker, depth)
+        self.markers = {self.stack_identifier: (marker, 0)}
+        self.in_progress = set()
+        self.completed = set()
+        self._event_log_context = heat_utils.EventLogContext()
+        self._period = poll_period
+        self._no_event_polls = 0
+
+    def _stop(self, stack_status):
+        if self.action:
+            return stack_status in ('%s_FAILED' % self.action,
+                                    '%s_COMPLETE' % self.action)
+        return (stack_status.endswith('_COMPLETE') or
+                stack_status.endswith('_FAILED'))
+
+    @staticmethod
+    def _event_stack_id(event):
+        for link in getattr(event, 'links', None) or []:
+            if link.get('rel') == 'stack' and link.get('href'):
+                return link['href'].rsplit('/', 1)[-1]
+
+    def _list(self, stack_identifier, marker, nested_depth=0):
+        event_args = {'sort_dir': 'asc'}
+        if marker:
+            event_args['marker'] = marker
+        if nested_depth:
+            event_args['nested_depth'] = nested_depth
+        try:
+            return self.client.events.list(stack_id=stack_identifier,
+                                           **event_args)
+        except HTTPNotFound as e:
+            raise oscexc.CommandError(str(e))
+
+    def _nested_ids(self, stack_identifier):
+        try:
+            resources = self.client.resources.list(stack_id=stack_identifier)
+        except HTTPNotFound:
+            return []
+        return [i for i in map(heat_utils.resource_nested_identifier,
+                               resources) if i]
+
+    def poll(self):
+        """Fetch the events which happened since the previous poll.
+
+        :returns: List of events sorted by event time.
+        """
+
+        if self.nested_api is not False:
+            marker, _ = self.markers[self.stack_identifier]
+            events = self._list(self.stack_identifier, marker,
+                                self.nested_depth)
+            if self.nested_api is None and events and self.nested_depth:
+                self.nested_api = any(
+                    link.get('rel') == 'root_stack'
+                    for link in getattr(events[0], 'links', None) or [])
+            if self.nested_api is not False:
+                if events:
+                    self.markers[self.stack_identifier] = (events[-1].id, 0)
+                return events
+
+        # NOTE: The API does not support nested_depth, follow every nested
+        #       stack with its own cursor.
+        events = list()
+        for stack_identifier, (marker, depth) in list(self.markers.items()):
+            stack_events = self._list(stack_identifier, marker)
+            if not stack_events:
+                continue
+            self.markers[stack_identifier] = (stack_events[-1].id, depth)
+            events.extend(stack_events)
+            if depth < self.nested_depth:
+                for nested_id in self._nested_ids(stack_identifier):
+                    if nested_id not in self.markers:
+                        self.markers[nested_id] = (None, depth + 1)
+        events.sort(key=lambda x: x.event_time)
+        return events
+
+    def _track(self, event):
+        """Track the state of the top-level resources of the stack."""
+
+        stack_id = self._event_stack_id(event)
+        if stack_id and stack_id != self.stack_id:
+            return
+        name = getattr(event, 'resource_name', None)
+        if name == self.stack_name:
+            return
+        status = getattr(event, 'resource_status', '')
+        if status.endswith('_IN_PROGRESS'):
+            self.in_progress.add(name)
+        elif status.endswith('_COMPLETE') or status.endswith('_FAILED'):
+            self.in_progress.discard(name)
+            self.completed.add(name)
+
+    def _is_stack_event(self, event):
+        if getattr(event, 'resource_name', '') != self.stack_name:
+            return False
+        phys_id = getattr(event, 'physical_resource_id', '')
+        return (self._event_stack_id(event) or phys_id) == phys_id
+
+    def _next_period(self, got_events):
+        if self.completed and not self.in_progress:
+            self._period = self.min_poll_period
+        elif got_events:
+            self._period = self.poll_period
+        else:
+            self._period = min(self._period * 2, self.max_poll_period)
+        return self._period
+
+    def wait(self):
+        """Wait for the stack action to complete or fail.
+
+        :returns: Tuple of the stack status and a message.
+        """
+
+        msg_template = _("\n Stack %(name)s %(status)s \n")
+        while True:
+            events = self.poll()
+            if events:
+                self._no_event_polls = 0
+                self.out.write(heat_utils.event_log_formatter(
+                    events, self._event_log_context))
+                self.out.write('\n')
+                for event in events:
+                    self._track(event)
+                    if self._is_stack_event(event):
+                        stack_status = getattr(event, 'resource_status', '')
+                        if self._stop(stack_status):
+                            return stack_status, msg_template % dict(
+                                name=self.stack_identifier,
+                                status=stack_status)
+            else:
+                self._no_event_polls += 1
+
+            if self._no_event_polls >= 2:
+                # after 2 polls with no events, fall back to a stack get
+                stack = self.client.stacks.get(self.stack_identifier,
+                                               resolve_outputs=False)
+                if self._stop(stack.stack_status):
+                    return stack.stack_status, msg_template % dict(
+                        name=self.stack_identifier,
+                        status=stack.stack_status)
+                self._no_event_polls = 0
+
+            time.sleep(self._next_period(bool(events)))
+
+
+def get_stack_event_marker(orchestration_client, stack_name):
+    """Return the id of the latest event of a stack.
+
+    The marker is used to only watch the events of the next stack action.
+
+    :param orchestration_client: Instance of Orchestration client
+    :type  orchestration_client: heatclient.v1.client.Client
+
+    :param stack_name: Name or UUID of the stack
+    :type  stack_name: string
 
-    # Fix region value because TripleO is using non-standard value
-    for section in ('compute', 'identity', 'image', 'network',
-                    'object-storage', 'orchestration', 'volume'):
-        config.set(section, 'region', 'regionOne')
+    :returns: String or None
+    """
 
-    with open(config_name, 'w+') as config_file:
-        config.write(config_file)
+    from heatclient.common import event_utils
 
+    events = event_utils.get_events(orchestration_client,
+                                    stack_id=stack_name,
+                                    event_args={'sort_dir': 'desc',
+                                                'limit': 1})
+    return events[0].id if events else None
 
+
+@profiling.phase('heat stack wait')
 def wait_for_stack_ready(orchestration_client, stack_name, marker=None,
                          action='CREATE', nested_depth=2,
                          max_retries=10):
@@ -936,16 +1547,19 @@ def wait_for_stack_ready(orchestration_client, stack_name, marker=None,
     stack = get_stack(orchestration_client, stack_name)
     if not stack:
         return False
-    stack_name = "%s/%s" % (stack.stack_name, stack.id)
 
+    watcher = StackEventWatcher(
+        orchestration_client,
+        stack,
+        action=action,
+        marker=marker,
+        nested_depth=nested_depth
+    )
     retries = 0
 
     while retries <= max_retries:
         try:
-            stack_status, msg = event_utils.poll_for_events(
-                orchestration_client, stack_name, action=action,
-                poll_period=5, marker=marker, out=sys.stdout,
-                nested_depth=nested_depth)
+            stack_status, msg = watcher.wait()
             print(msg)
             return stack_status == '%s_COMPLETE' % action
         except hc_exc.HTTPException as e:
@@ -963,15 +1577,182 @@ def wait_for_stack_ready(orchestration_client, stack_name, marker=None,
         "wait_for_stack_ready: Max retries {} reached".format(max_retries))
 
 
+def _stack_version(stack):
+    """Return the version of a stack usable as a metadata cache key.
+
+    A stack version is only returned once the stack reached a stable
+    ``*_COMPLETE`` state, as outputs of stacks in progress may still change
+    without ``updated_time`` being bumped.
+
+    :param stack: Heat stack.
+    :type stack: Object
+
+    :returns: Tuple of (id, updated or creation time, status) or None
+    """
+
+    stack_id = getattr(stack, 'id', None)
+    status = getattr(stack, 'stack_status', None)
+    stamp = (getattr(stack, 'updated_time', None) or
+             getattr(stack, 'creation_time', None))
+    version = (stack_id, stamp, status)
+    if not all(isinstance(i, six.string_types) for i in version):
+        return None
+    if not status.endswith('_COMPLETE'):
+        return None
+    return version
+
+
+class StackMetadata(object):
+    """Outputs, parameters and environment of a given stack version.
+
+    Outputs are indexed by key once and the environment is only downloaded
+    when it is first needed. The metadata of a stable stack version is
+    persisted in ``constants.STACK_METADATA_CACHE_DIR`` so that subsequent
+    commands against an unchanged stack don't fetch it from Heat again.
+    """
+
+    def __init__(self, stack, cache_dir=None):
+        self.stack = stack
+        self.version = _stack_version(stack)
+        self.cache_dir = cache_dir or constants.STACK_METADATA_CACHE_DIR
+        self._outputs = None
+        self._parameters = None
+        self._environment = None
+        if self.version:
+            self._load()
+
+    @property
+    def cache_path(self):
+        return os.path.join(self.cache_dir,
+                            '{}.json'.format(self.version[0]))
+
+    def _index(self):
+        stack_dict = self.stack.to_dict()
+        if 'outputs' not in stack_dict:
+            # The stack has been fetched without resolving its outputs.
+            self.stack.get()
+            stack_dict = self.stack.to_dict()
+        # Both come with the same stack body, index them at once.
+        self._outputs = dict(
+            (output['output_key'], output['output_value'])
+            for output in stack_dict.get('outputs', None) or [])
+        self._parameters = stack_dict.get('parameters', None) or {}
+        self._save()
+
+    @property
+    def outputs(self):
+        """Stack outputs indexed by output key.
+
+        :returns: Dictionary
+        """
+
+        if self._outputs is None:
+            self._index()
+        return self._outputs
+
+    @property
+    def parameters(self):
+        """Stack parameters.
+
+        :returns: Dictionary
+        """
+
+        if self._parameters is None:
+            self._index()
+        return self._parameters
+
+    @property
+    def environment(self):
+        """Stack environment.
+
+        :returns: Dictionary
+        """
+
+        if self._environment is None:
+            self._environment = self.stack.environment()
+            self._save()
+        return self._environment
+
+    def _load(self):
+        try:
+            with open(self.cache_path, 'r') as f:
+                data = simplejson.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if tuple(data.get('version') or ()) != self.version:
+            return
+        self._outputs = data.get('outputs')
+        self._parameters = data.get('parameters')
+        self._environment = data.get('environment')
+        LOG.debug('Loaded metadata of stack {} from {}'.format(
+            self.version[0], self.cache_path))
+
+    def _save(self):
+        if not self.version:
+            return
+        data = {
+            'version': list(self.version),
+            'outputs': self._outputs,
+            'parameters': self._parameters,
+            'environment': self._environment,
+        }
+        try:
+            makedirs(self.cache_dir)
+            os.chmod(self.cache_dir, 0o700)
+            tmp_path = '{}.tmp'.format(self.cache_path)
+            # The environment holds the passwords of the deployment.
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o600)
+            with os.fdopen(fd, 'w') as f:
+                simplejson.dump(data, f)
+            os.rename(tmp_path, self.cache_path)
+        except (IOError, OSError) as e:
+            LOG.warning('Unable to cache metadata of stack {}: {}'.format(
+                self.version[0], e))
+
+
+_STACK_METADATA = dict()
+
+
+def get_stack_metadata(stack):
+    """Return the cached metadata of a stack.
+
+    Metadata of stacks which are not in a stable state are not cached.
+
+    :param stack: Heat stack.
+    :type stack: Object
+
+    :returns: StackMetadata
+    """
+
+    version = _stack_version(stack)
+    if not version:
+        return StackMetadata(stack)
+    metadata = _STACK_METADATA.get(version[0])
+    if metadata is None or metadata.version != version:
+        metadata = _STACK_METADATA[version[0]] = StackMetadata(stack)
+    # Make sure lazy fetches are done with the latest stack object.
+    metadata.stack = stack
+    return metadata
+
+
+def get_stack_environment(stack):
+    """Return the environment of a stack, from the cache when possible.
+
+    :param stack: Heat stack.
+    :type stack: Object
+
+    :returns: Dictionary
+    """
+
+    return get_stack_metadata(stack).environment
+
+
 def get_stack_output_item(stack, item):
     if not stack:
         return None
 
-    for output in stack.to_dict().get('outputs', {}):
-        if output['output_key'] == item:
-            return output['output_value']
-    # item not found in outputs
-    return None
+    return get_stack_metadata(stack).outputs.get(item)
 
 
 def get_overcloud_endpoint(stack):
@@ -979,10 +1760,7 @@ def get_overcloud_endpoint(stack):
 
 
 def get_service_ips(stack):
-    service_ips = {}
-    for output in stack.to_dict().get('outputs', {}):
-        service_ips[output['output_key']] = output['output_value']
-    return service_ips
+    return dict(get_stack_metadata(stack).outputs)
 
 
 def get_endpoint_map(stack):
@@ -1008,21 +1786,33 @@ def get_endpoint(key, stack):
         return get_service_ips(stack).get(key + 'Vip')
 
 
-def get_stack(orchestration_client, stack_name):
+def get_stack(orchestration_client, stack_name, resolve_outputs=True):
     """Get the ID for the current deployed overcloud stack if it exists.
 
     Caller is responsible for checking if return is None
+
+    When ``resolve_outputs`` is False, outputs are only fetched from Heat
+    when they are needed and not already in the stack metadata cache.
     """
 
     try:
-        stack = orchestration_client.stacks.get(stack_name)
+        if resolve_outputs:
+            stack = orchestration_client.stacks.get(stack_name)
+        else:
+            stack = orchestration_client.stacks.get(
+                stack_name, resolve_outputs=False)
         return stack
     except HTTPNotFound:
         pass
 
 
 def get_rc_params(orchestration_client, stack_name):
-    env = orchestration_client.stacks.environment(stack_name)
+    stack = get_stack(orchestration_client, stack_name,
+                      resolve_outputs=False)
+    if stack is not None and _stack_version(stack):
+        env = get_stack_environment(stack)
+    else:
+        env = orchestration_client.stacks.environment(stack_name)
     rc_params = {}
     try:
         rc_params['password'] = env[
@@ -1048,8 +1838,8 @@ def check_ceph_fsid_matches_env_files(stack, environment):
     """
     env_ceph_fsid = environment.get('parameter_defaults',
                                     {}).get('CephClusterFSID', False)
-    stack_ceph_fsid = stack.environment().get('parameter_defaults',
-                                              {}).get('CephClusterFSID', False)
+    stack_ceph_fsid = get_stack_environment(stack).get(
+        'parameter_defaults', {}).get('CephClusterFSID', False)
 
     if bool(env_ceph_fsid) and env_ceph_fsid != stack_ceph_fsid:
         raise exceptions.InvalidConfiguration('The CephFSID environment value '
@@ -1068,9 +1858,9 @@ def check_nic_config_with_ansible(stack, environment):
     stack_registry = {}
     is_ansible_config_stack = True
     if stack:
-        stack_registry = stack.environment().get(
-            'resource_registry', {})
-        is_ansible_config_stack = stack.environment().get(
+        stack_env = get_stack_environment(stack)
+        stack_registry = stack_env.get('resource_registry', {})
+        is_ansible_config_stack = stack_env.get(
             'parameter_defaults', {}).get(
                 'NetworkConfigWithAnsible', True)
 
@@ -1120,7 +1910,8 @@ def check_stack_network_matches_env_files(stack, environment):
                 nets.add(k)
         return nets
 
-    stack_registry = stack.environment().get('resource_registry', {})
+    stack_registry = get_stack_environment(stack).get(
+        'resource_registry', {})
     env_registry = environment.get('resource_registry', {})
 
     stack_nets = _get_networks(stack_registry)
@@ -1146,24 +1937,79 @@ def remove_known_hosts(overcloud_ip):
         subprocess.check_call(command)
 
 
-def file_checksum(filepath):
-    """Calculate md5 checksum on file
+def _hash_file(filepath):
+    md5 = hashlib.md5()
+    sha256 = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        while True:
+            fragment = f.read(1048576)
+            if not fragment:
+                break
+            md5.update(fragment)
+            sha256.update(fragment)
+    return {'md5': md5.hexdigest(), 'sha256': sha256.hexdigest()}
+
+
+def _checksum_cache_key(st, path):
+    return [path, st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns]
+
+
+def file_checksums(filepath):
+    """Calculate the md5 and sha256 checksums of a file
+
+    Checksums are cached in CHECKSUM_CACHE_DIR, keyed on the path, device,
+    inode, size and modification time of the file, so unchanged files,
+    like multi-GB overcloud images, are only read once.
 
     :param filepath: Full path to file (e.g. /home/stack/image.qcow2)
     :type  filepath: string
 
+    :returns: Dictionary with the md5 and sha256 hex digests.
     """
     if not os.path.isfile(filepath):
         raise ValueError(_("The given file {0} is not a regular "
                            "file").format(filepath))
-    checksum = hashlib.md5()
-    with open(filepath, 'rb') as f:
-        while True:
-            fragment = f.read(65536)
-            if not fragment:
-                break
-            checksum.update(fragment)
-    return checksum.hexdigest()
+    path = os.path.realpath(filepath)
+    st = os.stat(path)
+    key = _checksum_cache_key(st, path)
+    cache_file = os.path.join(
+        constants.CHECKSUM_CACHE_DIR,
+        hashlib.sha256(path.encode('utf-8')).hexdigest() + '.json')
+    try:
+        with open(cache_file, 'r') as f:
+            cached = simplejson.load(f)
+        if cached.get('key') == key:
+            return cached['checksums']
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+
+    checksums = _hash_file(path)
+    if (time.time() - st.st_mtime < constants.CHECKSUM_CACHE_MIN_AGE or
+            _checksum_cache_key(os.stat(path), path) != key):
+        return checksums
+    tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+    try:
+        makedirs(constants.CHECKSUM_CACHE_DIR)
+        with open(tmp_file, 'w') as f:
+            simplejson.dump({'key': key, 'checksums': checksums}, f)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError) as e:
+        LOG.warning('Unable to cache the checksums of {}: {}'.format(
+            path, e))
+    return checksums
+
+
+def file_checksum(filepath, algorithm='md5'):
+    """Calculate md5 checksum on file
+
+    :param filepath: Full path to file (e.g. /home/stack/image.qcow2)
+    :type  filepath: string
+
+    :param algorithm: md5 or sha256.
+    :type  algorithm: string
+
+    """
+    return file_checksums(filepath)[algorithm]
 
 
 def ensure_run_as_normal_user():
@@ -1402,7 +2248,7 @@ def parse_env_file(env_file, file_type=None):
     elif file_type == 'csv' or env_file.name.endswith('.csv'):
         nodes_config = _csv_to_nodes_dict(env_file)
     elif env_file.name.endswith('.yaml'):
-        nodes_config = yaml.safe_load(env_file)
+        nodes_config = yaml_utils.safe_load(env_file)
     else:
         raise exceptions.InvalidConfiguration(
             _("Invalid file extension for %s, must be json, yaml or csv") %
@@ -1465,7 +2311,7 @@ def replace_links_in_template_contents(contents, link_replacement):
 
     template = {}
     try:
-        template = yaml.safe_load(contents)
+        template = yaml_utils.safe_load(contents)
     except yaml.YAMLError:
         return contents
 
@@ -1475,7 +2321,7 @@ def replace_links_in_template_contents(contents, link_replacement):
 
     template = replace_links_in_template(template, link_replacement)
 
-    return yaml.safe_dump(template)
+    return yaml_utils.safe_dump(template)
 
 
 def replace_links_in_template(template_part, link_replacement):
@@ -1572,6 +2418,240 @@ def get_key(stack, needs_pair=False):
         return
 
 
+_CONNECTIONS = dict()
+
+
+def token_cache_enabled():
+    """Whether keystone tokens are cached across CLI invocations.
+
+    The cache is opt-in through the ``OS_TRIPLEOCLIENT_TOKEN_CACHE``
+    environment variable.
+
+    :returns: Boolean
+    """
+
+    return os.environ.get('OS_TRIPLEOCLIENT_TOKEN_CACHE', '').lower() in (
+        '1', 'true', 'yes')
+
+
+def _auth_cache_file(auth):
+    try:
+        cache_id = auth.get_cache_id()
+    except (AttributeError, NotImplementedError):
+        cache_id = None
+    if not cache_id:
+        return None
+    return os.path.join(
+        constants.TOKEN_CACHE_DIR,
+        hashlib.sha256(cache_id.encode('utf-8')).hexdigest())
+
+
+def load_auth_state(auth):
+    """Restore a cached token and service catalog into an auth plugin.
+
+    Tokens expiring within ``constants.TOKEN_CACHE_MARGIN`` seconds are not
+    restored.
+
+    :param auth: Keystone auth plugin.
+    :type auth: keystoneauth1.plugin.BaseAuthPlugin
+
+    :returns: True when a valid token has been restored.
+    """
+
+    cache_file = _auth_cache_file(auth)
+    if not cache_file:
+        return False
+    try:
+        with open(cache_file, 'r') as f:
+            auth.set_auth_state(f.read())
+    except (IOError, OSError, ValueError, KeyError) as e:
+        LOG.debug('No usable cached token in %s: %s', cache_file, e)
+        return False
+    if not auth.auth_ref or auth.auth_ref.will_expire_soon(
+            stale_duration=constants.TOKEN_CACHE_MARGIN):
+        auth.invalidate()
+        return False
+    LOG.debug('Reusing the cached token from %s', cache_file)
+    return True
+
+
+def save_auth_state(auth):
+    """Cache the token and service catalog of an authenticated plugin.
+
+    :param auth: Keystone auth plugin.
+    :type auth: keystoneauth1.plugin.BaseAuthPlugin
+    """
+
+    cache_file = _auth_cache_file(auth)
+    state = auth.get_auth_state() if cache_file else None
+    if not state:
+        return
+    tmp_file = cache_file + '.tmp'
+    try:
+        if not os.path.isdir(constants.TOKEN_CACHE_DIR):
+            os.makedirs(constants.TOKEN_CACHE_DIR, mode=0o700)
+        with os.fdopen(os.open(tmp_file, os.O_WRONLY | os.O_CREAT |
+                               os.O_TRUNC, 0o600), 'w') as f:
+            f.write(state)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError) as e:
+        LOG.warning('Unable to cache the token in %s: %s', cache_file, e)
+
+
+def cache_client_manager_auth(client_manager):
+    """Reuse the cached token of the openstack client session.
+
+    osc_lib authenticates the session of the client manager in the shell,
+    before the command runs. Its setup_auth is wrapped so that a valid
+    token and service catalog of a previous invocation are restored into
+    the auth plugin as soon as it is created, and the shell uses them
+    instead of authenticating again. The token is recorded by
+    save_auth_state once the command runs.
+
+    :param client_manager: Client manager of the openstack client.
+    :type client_manager: osc_lib.clientmanager.ClientManager
+    """
+
+    setup_auth = client_manager.setup_auth
+
+    def _setup_auth():
+        setup_auth()
+        auth = getattr(client_manager, 'auth', None)
+        if auth is None or getattr(auth, 'auth_ref', None):
+            return
+        if load_auth_state(auth):
+            # NOTE: the client manager only takes the auth reference of
+            # the plugin while setting up the auth, keep it in sync.
+            client_manager._auth_ref = auth.auth_ref
+
+    client_manager.setup_auth = _setup_auth
+
+
+def get_undercloud_connection(cloud='undercloud'):
+    """Return the openstacksdk connection to a cloud of clouds.yaml.
+
+    A single connection, and so a single keystone session, is shared by
+    every caller of the process. With the token cache enabled, a valid
+    token and service catalog of a previous invocation are reused instead
+    of authenticating again.
+
+    :param cloud: Cloud name.
+    :type cloud: String
+
+    :returns: openstack.connection.Connection
+    """
+
+    conn = _CONNECTIONS.get(cloud)
+    if conn is not None:
+        return conn
+    import openstack
+    conn = openstack.connect(cloud)
+    if token_cache_enabled():
+        auth = conn.session.auth
+        if not load_auth_state(auth):
+            auth.get_access(conn.session)
+            save_auth_state(auth)
+    _CONNECTIONS[cloud] = conn
+    return conn
+
+
+def _load_inventory_cache(cache_file, key):
+    try:
+        with open(cache_file, 'r') as f:
+            cached = simplejson.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if cached.get('key') != key:
+        return None
+    return cached.get('inventory')
+
+
+def _save_inventory_cache(cache_file, key, inventory):
+    tmp_file = cache_file + '.tmp'
+    try:
+        makedirs(os.path.dirname(cache_file))
+        with os.fdopen(os.open(tmp_file, os.O_WRONLY | os.O_CREAT |
+                               os.O_TRUNC, 0o600), 'w') as f:
+            simplejson.dump({'key': key, 'inventory': inventory}, f)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError) as e:
+        LOG.warning('Unable to cache the ansible inventory in %s: %s',
+                    cache_file, e)
+
+
+def generate_tripleo_ansible_inventory(inventory_file,
+                                       ssh_user='tripleo-admin',
+                                       stack='overcloud',
+                                       undercloud_connection='ssh'):
+    """Write the static ansible inventory of a stack.
+
+    The inventory is generated in-process with TripleoInventory, using the
+    ``undercloud`` cloud credentials. Inventories of a stack in a stable
+    state are cached in its working directory, so the inventory is only
+    generated again once the stack changed.
+
+    :param inventory_file: Path of the inventory to write.
+    :type inventory_file: String
+
+    :param ssh_user: User ansible connects to the overcloud nodes as.
+    :type ssh_user: String
+
+    :param stack: Stack name.
+    :type stack: String
+
+    :param undercloud_connection: Ansible connection to the undercloud.
+    :type undercloud_connection: String
+    """
+
+    from heatclient import client as heat_client
+    from tripleo_common.inventory import TripleoInventory
+
+    try:
+        conn = get_undercloud_connection()
+        hclient = heat_client.Client('1', session=conn.session)
+        key_file = get_key(stack=stack) if stack else None
+        key = None
+        cache_file = None
+        if stack:
+            version = _stack_version(hclient.stacks.get(stack))
+            if version:
+                key = list(version) + [ssh_user, undercloud_connection,
+                                       key_file]
+                cache_file = os.path.join(constants.DEFAULT_WORK_DIR, stack,
+                                          'tripleo-ansible-inventory.json')
+
+        inventory = None
+        if key:
+            inventory = _load_inventory_cache(cache_file, key)
+        if inventory is not None:
+            LOG.info('Stack %s is unchanged, reusing its ansible inventory',
+                     stack)
+            with open(inventory_file, 'w') as f:
+                f.write(inventory)
+            return
+
+        auth = conn.config.config.get('auth', {})
+        TripleoInventory(
+            session=conn.session,
+            hclient=hclient,
+            plan_name=stack,
+            auth_url=auth.get('auth_url'),
+            project_name=auth.get('project_name'),
+            username=auth.get('username'),
+            cacert=conn.config.config.get('cacert'),
+            ansible_ssh_user=ssh_user,
+            undercloud_key_file=key_file,
+            undercloud_connection=undercloud_connection
+        ).write_static_inventory(inventory_file)
+    except Exception as e:
+        LOG.error('Failed to generate inventory: %s', e)
+        raise exceptions.InvalidConfiguration("Failed to generate inventory")
+
+    if key:
+        with open(inventory_file, 'r') as f:
+            _save_inventory_cache(cache_file, key, f.read())
+
+
 def get_tripleo_ansible_inventory(inventory_file=None,
                                   ssh_user='tripleo-admin',
                                   stack='overcloud',
@@ -1582,23 +2662,11 @@ def get_tripleo_ansible_inventory(inventory_file=None,
             constants.CLOUD_HOME_DIR,
             'tripleo-ansible-inventory.yaml'
         )
-
-        command = ['/usr/bin/tripleo-ansible-inventory',
-                   '--os-cloud', 'undercloud']
-        if stack:
-            command.extend(['--stack', stack])
-            command.extend(['--undercloud-key-file', get_key(stack=stack)])
-        if ssh_user:
-            command.extend(['--ansible_ssh_user', ssh_user])
-        if undercloud_connection:
-            command.extend(['--undercloud-connection',
-                           undercloud_connection])
-        if inventory_file:
-            command.extend(['--static-yaml-inventory', inventory_file])
-        rc = run_command_and_log(LOG, command)
-        if rc != 0:
-            message = "Failed to generate inventory"
-            raise exceptions.InvalidConfiguration(message)
+        generate_tripleo_ansible_inventory(
+            inventory_file,
+            ssh_user=ssh_user,
+            stack=stack,
+            undercloud_connection=undercloud_connection)
     if os.path.exists(inventory_file):
         if return_inventory_file_path:
             return inventory_file
@@ -1614,6 +2682,7 @@ def get_tripleo_ansible_inventory(inventory_file=None,
 def cleanup_tripleo_ansible_inventory_file(path):
     """Remove the static tripleo-ansible-inventory file from disk"""
     if os.path.exists(path):
+        from oslo_concurrency import processutils
         processutils.execute('/usr/bin/rm', '-f', path)
 
 
@@ -1644,6 +2713,7 @@ def build_stack_data(clients, stack_name, template,
     if result:
         stack_data['environment_parameters'] = result.get(
             'Environment', {}).get('parameter_defaults')
+        from tripleo_common.utils import stack as stack_utils
         flattened = {'resources': {}, 'parameters': {}}
         stack_utils._flat_it(flattened, 'Root', result)
         stack_data['heat_resource_tree'] = flattened
@@ -1651,57 +2721,344 @@ def build_stack_data(clients, stack_name, template,
     return stack_data
 
 
+def _clone_file(src, dst):
+    """Create dst as a copy-on-write clone of src."""
+
+    with open(src, 'rb') as fsrc:
+        with open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+
+def copy_templates_tree(source, destination):
+    """Copy a templates tree into a deployment working directory.
+
+    Files are cloned with copy-on-write when the filesystem supports it
+    (e.g. XFS with reflink or btrfs), so the working directory shares the
+    data blocks of the pristine tree and only the files which are written
+    by rendering or by the deployment use additional space. Other
+    filesystems fall back to a regular copy.
+
+    :param source: Templates directory to copy.
+    :type source: String
+
+    :param destination: Directory to create.
+    :type destination: String
+
+    :returns: Boolean, True when the files have been cloned.
+    """
+
+    state = {'clone': True}
+
+    def _copy(src, dst, **kwargs):
+        if state['clone']:
+            try:
+                _clone_file(src, dst)
+                return dst
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EXDEV, errno.EOPNOTSUPP,
+                                   errno.ENOTTY, errno.EINVAL,
+                                   errno.ENOSYS):
+                    raise
+                LOG.debug('Unable to clone {} into {}: {}, falling back to '
+                          'copying the templates'.format(src, dst, e))
+                state['clone'] = False
+        return shutil.copy2(src, dst, **kwargs)
+
+    shutil.copytree(source, destination, symlinks=True, copy_function=_copy)
+    return state['clone']
+
+
+def _artifact_name(path, output_dir):
+    """Return the name of an artifact relative to the output dir."""
+
+    leading_path = output_dir[1:] + '/'
+    return path.lstrip('/').replace(leading_path, '')
+
+
+def _compressor(compression):
+    """Return the command of an available multi-threaded compressor."""
+
+    for cmd in constants.ARTIFACT_COMPRESSION[compression][1]:
+        if shutil.which(cmd[0]):
+            return cmd
+    return None
+
+
+def _store_artifacts(log, tar_filename, paths, output_dir):
+    """Store the artifacts in the content addressed store.
+
+    Files are stored once under their sha256 digest in
+    ``constants.ARTIFACT_STORE_DIR`` and referenced by a JSON manifest.
+    """
+
+    objects_dir = os.path.join(constants.ARTIFACT_STORE_DIR, 'objects')
+    makedirs(objects_dir)
+    # config-download holds the passwords of the deployment
+    os.chmod(constants.ARTIFACT_STORE_DIR, 0o700)
+    manifest = list()
+    stored = 0
+    for path in paths:
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            manifest.append({'name': _artifact_name(root, output_dir),
+                             'type': 'directory'})
+            for name in sorted(files + [d for d in dirs if os.path.islink(
+                    os.path.join(root, d))]):
+                file_path = os.path.join(root, name)
+                entry = {'name': _artifact_name(file_path, output_dir)}
+                if os.path.islink(file_path):
+                    entry.update(type='symlink',
+                                 target=os.readlink(file_path))
+                else:
+                    digest = hashlib.sha256()
+                    with open(file_path, 'rb') as f:
+                        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                            digest.update(chunk)
+                    digest = digest.hexdigest()
+                    obj = os.path.join(objects_dir, digest[:2], digest)
+                    if not os.path.exists(obj):
+                        makedirs(os.path.dirname(obj))
+                        shutil.copyfile(file_path, obj + '.tmp')
+                        os.chmod(obj + '.tmp', 0o600)
+                        os.rename(obj + '.tmp', obj)
+                        stored += 1
+                    entry.update(
+                        type='file', sha256=digest,
+                        mode=os.stat(file_path).st_mode & 0o777)
+                manifest.append(entry)
+    with open(tar_filename, 'w') as f:
+        simplejson.dump(manifest, f, indent=1)
+    log.debug(_("Stored %(stored)s new files out of %(total)s artifacts")
+              % {'stored': stored, 'total': len(manifest)})
+
+
+def restore_deploy_artifacts(manifest_path, destination):
+    """Restore deployment artifacts from the content addressed store.
+
+    :param manifest_path: Artifacts manifest.
+    :type manifest_path: String
+
+    :param destination: Directory to restore the artifacts into.
+    :type destination: String
+    """
+
+    objects_dir = os.path.join(constants.ARTIFACT_STORE_DIR, 'objects')
+    with open(manifest_path, 'r') as f:
+        manifest = simplejson.load(f)
+    for entry in manifest:
+        path = os.path.join(destination, entry['name'])
+        if entry['type'] == 'directory':
+            makedirs(path)
+        elif entry['type'] == 'symlink':
+            os.symlink(entry['target'], path)
+        else:
+            shutil.copyfile(os.path.join(objects_dir, entry['sha256'][:2],
+                                         entry['sha256']), path)
+            os.chmod(path, entry['mode'])
+
+
 def archive_deploy_artifacts(log, stack_name, tht_dir,
-                             ansible_dir=None, output_dir=None):
-    """Create a tarball of the temporary folders used"""
+                             ansible_dir=None, output_dir=None,
+                             compression=None, store=False):
+    """Create a tarball of the temporary folders used
+
+    The tarball is compressed with a multi-threaded compressor when one is
+    installed (lbzip2 or pbzip2, pigz, zstd). With ``store``, the artifacts
+    are saved in a content addressed store instead and only a manifest is
+    written, so files unchanged since a previous deployment are stored
+    once.
+
+    :param compression: One of ``constants.ARTIFACT_COMPRESSION``.
+    :type compression: String
+
+    :param store: Whether to use the content addressed store.
+    :type store: Boolean
+
+    :returns: Path of the tarball or of the manifest.
+    """
     log.debug(_("Preserving deployment artifacts"))
 
     if not output_dir:
         output_dir = tht_dir
+    compression = compression or constants.DEFAULT_ARTIFACT_COMPRESSION
+    extension, _compressors, tar_mode = \
+        constants.ARTIFACT_COMPRESSION[compression]
+    cmd = _compressor(compression)
+    if not cmd and not tar_mode:
+        log.warning(_("No %s compressor found, using gzip") % compression)
+        compression = 'gzip'
+        extension, _compressors, tar_mode = \
+            constants.ARTIFACT_COMPRESSION[compression]
+        cmd = _compressor(compression)
+    if store:
+        extension = 'manifest.json'
 
     def get_tar_filename():
-        return '%s/%s-install-%s.tar.bzip2' % \
+        return '%s/%s-install-%s.%s' % \
            (constants.CLOUD_HOME_DIR, stack_name,
-            datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S'))
+            datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S'), extension)
 
     def remove_leading_path(info):
         """Tar filter to remove output dir from path"""
-        leading_path = output_dir[1:] + '/'
-        info.name = info.name.replace(leading_path, '')
+        info.name = _artifact_name(info.name, output_dir)
         return info
 
     tar_filename = get_tar_filename()
+    paths = [tht_dir] + ([ansible_dir] if ansible_dir else [])
     try:
-        tf = tarfile.open(tar_filename, 'w:bz2')
-        tf.add(tht_dir, recursive=True, filter=remove_leading_path)
-        if ansible_dir:
-            tf.add(ansible_dir, recursive=True,
-                   filter=remove_leading_path)
-        tf.close()
+        if store:
+            _store_artifacts(log, tar_filename, paths, output_dir)
+            return tar_filename
+        with open(tar_filename, 'wb') as out:
+            proc = None
+            if cmd:
+                log.debug(_("Compressing artifacts with %s") % cmd[0])
+                proc = subprocess.Popen(cmd + ['-c'], stdin=subprocess.PIPE,
+                                        stdout=out)
+                tf = tarfile.open(fileobj=proc.stdin, mode='w|')
+            else:
+                tf = tarfile.open(fileobj=out, mode='w|%s' % tar_mode)
+            try:
+                for path in paths:
+                    tf.add(path, recursive=True, filter=remove_leading_path)
+            finally:
+                tf.close()
+                if proc:
+                    proc.stdin.close()
+                    if proc.wait() != 0:
+                        raise RuntimeError(
+                            '%s exited with %s' % (cmd[0], proc.returncode))
     except Exception as ex:
         msg = _("Unable to create artifact tarball, %s") % str(ex)
         log.warning(msg)
     return tar_filename
 
 
+def _walk_templates(path):
+    """Yield the relative path of the files process-templates looks at."""
+
+    for subdir, dirs, files in os.walk(path):
+        # process-templates ignores hidden files and directories
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for f in sorted(files):
+            if not f.startswith('.'):
+                yield os.path.relpath(os.path.join(subdir, f), path)
+
+
+def _render_fingerprint(args, source_root, data_files):
+    """Return a digest of everything jinja rendering depends on.
+
+    :param args: process-templates command line.
+    :type args: List
+
+    :param source_root: Templates directory being rendered.
+    :type source_root: String
+
+    :param data_files: Roles and networks data files.
+    :type data_files: List
+
+    :returns: String
+    """
+
+    # The templates tree is usually a new temporary copy
+    source_root = os.path.normpath(source_root)
+
+    def _relocate(path):
+        return path.replace(source_root, '@SOURCE_ROOT@')
+
+    digest = hashlib.sha256()
+    digest.update(
+        simplejson.dumps([_relocate(a) for a in args]).encode('utf-8'))
+    # The defaults of roles and networks data and the templates included
+    # by jinja are in the tree, fingerprint all of it.
+    paths = [(f, os.path.join(source_root, f))
+             for f in _walk_templates(source_root)]
+    paths.extend((_relocate(f), f) for f in data_files + [args[1]])
+    for name, path in paths:
+        digest.update(name.encode('utf-8') + b'\0')
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _tree_snapshot(path):
+    snapshot = dict()
+    for f in _walk_templates(path):
+        stat = os.lstat(os.path.join(path, f))
+        snapshot[f] = (stat.st_size, stat.st_mtime)
+    return snapshot
+
+
+def _restore_rendered_templates(cache_dir, render_root):
+    """Copy cached rendered templates, returns False on a cache miss."""
+
+    try:
+        with open(os.path.join(cache_dir, 'manifest.json')) as f:
+            rendered = simplejson.load(f)
+    except (IOError, OSError, ValueError):
+        return False
+    for f in rendered:
+        shutil.copy2(os.path.join(cache_dir, 'templates', f),
+                     os.path.join(render_root, f))
+    # Keep the recently used entries when pruning
+    os.utime(cache_dir)
+    return True
+
+
+def _store_rendered_templates(cache_dir, render_root, rendered):
+    """Cache the rendered templates and prune the oldest entries."""
+
+    try:
+        makedirs(cache_dir)
+        for f in rendered:
+            dst = os.path.join(cache_dir, 'templates', f)
+            makedirs(os.path.dirname(dst))
+            shutil.copy2(os.path.join(render_root, f), dst)
+        with open(os.path.join(cache_dir, 'manifest.json'), 'w') as f:
+            simplejson.dump(sorted(rendered), f)
+        entries = sorted(
+            (os.path.join(constants.RENDER_CACHE_DIR, e)
+             for e in os.listdir(constants.RENDER_CACHE_DIR)),
+            key=os.path.getmtime, reverse=True)
+        for entry in entries[constants.RENDER_CACHE_ENTRIES:]:
+            shutil.rmtree(entry, ignore_errors=True)
+    except (IOError, OSError) as e:
+        LOG.warning('Unable to cache rendered templates: {}'.format(e))
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+@profiling.phase('template rendering')
 def jinja_render_files(log, templates, working_dir,
                        roles_file=None, networks_file=None,
-                       base_path=None, output_dir=None):
+                       base_path=None, output_dir=None, use_cache=True):
+    """Render the jinja templates of a templates tree.
+
+    Templates are rendered by the process-templates tool of the templates
+    tree. When the templates are rendered in place, the rendered files are
+    cached in ``constants.RENDER_CACHE_DIR`` and reused as long as the
+    templates tree, roles and networks data are unchanged.
+    """
+
     python_version = sys.version_info[0]
     python_cmd = "python{}".format(python_version)
     process_templates = os.path.join(
         templates, 'tools/process-templates.py')
     args = [python_cmd, process_templates]
+    data_files = []
 
     if roles_file:
         roles_file_path = get_roles_file_path(
             roles_file, base_path)
         args.extend(['--roles-data', roles_file_path])
+        data_files.append(os.path.join(working_dir, roles_file_path))
 
     if networks_file:
         networks_file_path = get_networks_file_path(
             networks_file, base_path)
         args.extend(['--network-data', networks_file_path])
+        data_files.append(os.path.join(working_dir, networks_file_path))
 
     if base_path:
         args.extend(['-p', base_path])
@@ -1709,20 +3066,192 @@ def jinja_render_files(log, templates, working_dir,
     if output_dir:
         args.extend(['-o', output_dir])
 
+    source_root = os.path.join(working_dir, base_path or '.')
+    render_root = os.path.join(working_dir, output_dir or source_root)
+    cache_dir = None
+    # Outputs written to another directory include a copy of the whole
+    # tree, only rendering in place is cached.
+    if (use_cache and os.path.isdir(source_root) and
+            os.path.realpath(source_root) == os.path.realpath(render_root)):
+        try:
+            cache_dir = os.path.join(
+                constants.RENDER_CACHE_DIR,
+                _render_fingerprint(args, source_root, data_files))
+        except (IOError, OSError) as e:
+            log.debug('Not caching rendered templates: {}'.format(e))
+        if cache_dir and _restore_rendered_templates(cache_dir, render_root):
+            log.info(_("Using cached rendered templates from %s")
+                     % cache_dir)
+            return
+        snapshot = _tree_snapshot(render_root)
+
     if run_command_and_log(log, args, working_dir) != 0:
         msg = _("Problems generating templates.")
         log.error(msg)
         raise exceptions.DeploymentError(msg)
 
+    if cache_dir:
+        rendered = [f for f, stat in _tree_snapshot(render_root).items()
+                    if snapshot.get(f) != stat]
+        _store_rendered_templates(cache_dir, render_root, rendered)
+
+
+class EnvironmentCache(object):
+    """Persistent cache of processed Heat environment files.
+
+    Entries are keyed on the content of an environment file and are only
+    used when none of the files it references changed. Paths below the
+    templates directory are stored relative to it, as it is a new temporary
+    directory for every deployment.
+    """
+
+    THT_ROOT = '@THT_ROOT@'
+
+    def __init__(self, tht_root, user_tht_root, cache_dir=None):
+        self.tht_root = os.path.normpath(tht_root)
+        self.user_tht_root = os.path.normpath(user_tht_root)
+        self.cache_dir = cache_dir or constants.ENV_CACHE_DIR
+        self._json_root = simplejson.dumps(self.tht_root)[1:-1]
+        self._digests = dict()
+
+    def _digest(self, url):
+        """Return the sha256 digest of a file:// URL, None if unreadable."""
+
+        if url not in self._digests:
+            digest = None
+            if url.startswith('file:'):
+                path = request.url2pathname(parse.urlparse(url).path)
+                try:
+                    with open(path, 'rb') as f:
+                        digest = hashlib.sha256(f.read()).hexdigest()
+                except (IOError, OSError):
+                    pass
+            self._digests[url] = digest
+        return self._digests[url]
+
+    def key(self, env_path, include_env_in_files):
+        """Return the cache key of an environment file.
+
+        :param env_path: Path of the environment file.
+        :type env_path: String
+
+        :param include_env_in_files: Whether the environment itself is
+                                     added to the files.
+        :type include_env_in_files: Boolean
+
+        :returns: String or None when the file can't be read.
+        """
+
+        if not os.path.isfile(env_path):
+            return None
+        key = hashlib.sha256()
+        abs_env_path = os.path.abspath(env_path)
+        for item in (abs_env_path, self.user_tht_root,
+                     str(include_env_in_files)):
+            item = item.replace(self.tht_root, self.THT_ROOT)
+            key.update(item.encode('utf-8') + b'\0')
+        try:
+            with open(env_path, 'rb') as f:
+                key.update(f.read())
+        except (IOError, OSError):
+            return None
+        return key.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, '{}.json'.format(key))
+
+    def get(self, key):
+        """Return a cached environment if none of its files changed.
 
+        :param key: Cache key.
+        :type key: String
+
+        :returns: Tuple of (files, env, tracked URL) or None
+        """
+
+        try:
+            with open(self._path(key), 'r') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return None
+        try:
+            entry = simplejson.loads(data.replace(self.THT_ROOT,
+                                                  self._json_root))
+        except ValueError:
+            return None
+        for url, digest in entry['deps'].items():
+            if self._digest(url) != digest:
+                LOG.debug('Cached environment {} outdated by {}'.format(
+                    key, url))
+                return None
+        return entry['files'], entry['env'], entry['tracked']
+
+    def put(self, key, files, env, tracked=None, transient=None):
+        """Cache a processed environment.
+
+        :param key: Cache key.
+        :type key: String
+
+        :param files: Files referenced by the environment.
+        :type files: Dictionary
+
+        :param env: Processed environment.
+        :type env: Dictionary
+
+        :param tracked: URL of the environment in the files tracker.
+        :type tracked: String
+
+        :param transient: URL of a temporary environment which is not a
+                          dependency of the entry.
+        :type transient: String
+        """
+
+        deps = dict()
+        for url in files:
+            if url == transient:
+                continue
+            digest = self._digest(url)
+            if digest is None:
+                # Remote or missing files can't be validated
+                return
+            deps[url] = digest
+        entry = {'files': files, 'env': env, 'tracked': tracked,
+                 'deps': deps}
+        try:
+            data = simplejson.dumps(entry)
+        except (TypeError, ValueError):
+            return
+        if simplejson.loads(data) != entry:
+            # e.g. non string keys, which would not round-trip.
+            return
+        try:
+            makedirs(self.cache_dir)
+            os.chmod(self.cache_dir, 0o700)
+            # Environments hold passwords, keep them private.
+            fd = os.open(self._path(key),
+                         os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                f.write(data.replace(self._json_root, self.THT_ROOT))
+        except (IOError, OSError) as e:
+            LOG.warning('Unable to cache environment: {}'.format(e))
+
+
+@profiling.phase('environment processing')
 def process_multiple_environments(created_env_files, tht_root,
                                   user_tht_root,
                                   env_files_tracker=None,
-                                  cleanup=True):
+                                  cleanup=True,
+                                  use_cache=True):
+    from heatclient.common import template_utils
+
     log = logging.getLogger(__name__ + ".process_multiple_environments")
+    profiling.annotate(files=len(created_env_files))
     env_files = {}
     localenv = {}
     include_env_in_files = env_files_tracker is not None
+    env_cache = None
+    if use_cache:
+        env_cache = EnvironmentCache(tht_root, user_tht_root)
     # Normalize paths for full match checks
     user_tht_root = os.path.normpath(user_tht_root)
     tht_root = os.path.normpath(tht_root)
@@ -1739,12 +3268,27 @@ def process_multiple_environments(created_env_files, tht_root,
             log.debug("Redirecting env file %s to %s"
                       % (abs_env_path, new_env_path))
             env_path = new_env_path
+        cache_key = None
+        if env_cache is not None:
+            cache_key = env_cache.key(env_path, include_env_in_files)
+        cached = cache_key and env_cache.get(cache_key)
+        if cached:
+            log.debug("Using cached environment file %s" % env_path)
+            files, env, tracked = cached
+            if env_files_tracker is not None:
+                env_files_tracker.append(tracked)
+            env_files.update(files)
+            localenv = template_utils.deep_update(localenv, env)
+            continue
         try:
             files, env = template_utils.process_environment_and_files(
                 env_path=env_path, include_env_in_files=include_env_in_files)
+            tracked = None
             if env_files_tracker is not None:
-                env_files_tracker.append(
-                    heat_utils.normalise_file_path_to_url(env_path))
+                tracked = heat_utils.normalise_file_path_to_url(env_path)
+                env_files_tracker.append(tracked)
+            if cache_key:
+                env_cache.put(cache_key, files, env, tracked)
         except hc_exc.CommandError as ex:
             # This provides fallback logic so that we can reference files
             # inside the resource_registry values that may be rendered via
@@ -1757,7 +3301,7 @@ def process_multiple_environments(created_env_files, tht_root,
             # Use the temporary path as it's possible the environment
             # itself was rendered via jinja.
             with open(env_path, 'r') as f:
-                env_map = yaml.safe_load(f)
+                env_map = yaml_utils.safe_load(f)
             env_registry = env_map.get('resource_registry', {})
             env_dirname = os.path.dirname(os.path.abspath(env_path))
             for rsrc, rsrc_path in six.iteritems(env_registry):
@@ -1789,13 +3333,22 @@ def process_multiple_environments(created_env_files, tht_root,
                                              delete=cleanup) as f:
                 log.debug("Rewriting %s environment to %s"
                           % (env_path, f.name))
-                f.write(yaml.safe_dump(env_map, default_flow_style=False))
+                f.write(yaml_utils.safe_dump(env_map,
+                                             default_flow_style=False))
                 f.flush()
                 files, env = template_utils.process_environment_and_files(
                     env_path=f.name, include_env_in_files=include_env_in_files)
+                tracked = None
                 if env_files_tracker is not None:
-                    env_files_tracker.append(
-                        heat_utils.normalise_file_path_to_url(f.name))
+                    tracked = heat_utils.normalise_file_path_to_url(f.name)
+                    env_files_tracker.append(tracked)
+                # Callers keeping the rewritten environment expect it on
+                # disk, it can only be cached when it's cleaned up.
+                if cache_key and cleanup:
+                    env_cache.put(
+                        cache_key, files, env, tracked,
+                        transient=heat_utils.normalise_file_path_to_url(
+                            f.name))
         if files:
             log.debug("Adding files %s for %s" % (files, env_path))
             env_files.update(files)
@@ -1806,6 +3359,76 @@ def process_multiple_environments(created_env_files, tht_root,
     return env_files, localenv
 
 
+def _files_size(files):
+    return sum(len(k) + len(v) for k, v in files.items())
+
+
+def prune_stack_files(template, files, environment=None,
+                      environment_files=None):
+    """Drop the files a stack create or update doesn't reference.
+
+    The files of every processed environment are collected, including the
+    templates of resource registry entries overridden by a later
+    environment. A file is kept when it is referenced by the template, by
+    the final resource registry or by another kept template (``get_file``,
+    resource ``type`` and ``resource_def`` references are URLs of the files
+    once processed by heatclient), and when it is one of the environment
+    files.
+
+    :param template: Processed top level template.
+    :type template: Dictionary
+
+    :param files: Files of the template and environments.
+    :type files: Dictionary
+
+    :param environment: Merged environment.
+    :type environment: Dictionary
+
+    :param environment_files: Environment files sent with the stack.
+    :type environment_files: List
+
+    :returns: Dictionary of the referenced files.
+    """
+
+    reachable = set()
+    pending = list()
+
+    def _visit(data):
+        if isinstance(data, dict):
+            for value in data.values():
+                _visit(value)
+        elif isinstance(data, list):
+            for value in data:
+                _visit(value)
+        elif (isinstance(data, six.string_types) and data in files and
+              data not in reachable):
+            reachable.add(data)
+            pending.append(data)
+
+    _visit(template)
+    _visit((environment or {}).get('resource_registry', {}))
+    # Environment files are parsed by Heat, but registry entries they
+    # contain may be overridden so their own references aren't followed.
+    reachable.update(f for f in environment_files or [] if f in files)
+    while pending:
+        content = files[pending.pop()]
+        # Templates are stored as JSON, other files as they are
+        if (isinstance(content, six.string_types) and
+                content.lstrip().startswith('{')):
+            try:
+                _visit(simplejson.loads(content))
+            except ValueError:
+                pass
+
+    pruned = dict((k, v) for k, v in files.items() if k in reachable)
+    LOG.info('Heat files payload: {} files, {:.1f} KiB (pruned {} '
+             'unreferenced files, {:.1f} KiB)'.format(
+                 len(pruned), _files_size(pruned) / 1024.0,
+                 len(files) - len(pruned),
+                 (_files_size(files) - _files_size(pruned)) / 1024.0))
+    return pruned
+
+
 def parse_extra_vars(extra_var_strings):
     """Parses extra variables like Ansible would.
 
@@ -1831,7 +3454,7 @@ def parse_extra_vars(extra_var_strings):
         invalid_yaml = False
 
         try:
-            parse_vars = yaml.safe_load(extra_var_string)
+            parse_vars = yaml_utils.safe_load(extra_var_string)
         except yaml.YAMLError:
             invalid_yaml = True
 
@@ -1891,8 +3514,13 @@ def wait_api_port_ready(api_port, host='127.0.0.1'):
     urlopen_timeout = 1
     max_retries = 30
     count = 0
+    # Poll quickly while the service starts, the connection is refused
+    # right away until the API socket listens.
+    interval = 0.1
     while count < max_retries:
-        time.sleep(1)
+        if count:
+            time.sleep(interval)
+            interval = min(interval * 2, 1)
         count += 1
         try:
             request.urlopen(
@@ -2005,6 +3633,8 @@ def build_prepare_env(environment_files, environment_directories):
         env_url = heat_utils.normalise_file_path_to_url(path)
         return request.urlopen(env_url).read()
 
+    from heatclient.common import template_utils
+
     return (
         template_utils.process_multiple_environments_and_files(
             env_files,
@@ -2031,8 +3661,7 @@ def fetch_roles_file(roles_file, tht_path=constants.TRIPLEO_HEAT_TEMPLATES):
     '''Fetch t-h-t roles data fromm roles_file abs path or rel to tht_path.'''
     if not roles_file:
         return None
-    with open(rel_or_abs_path(roles_file, tht_path)) as f:
-        return yaml.safe_load(f)
+    return yaml_utils.load_file(rel_or_abs_path(roles_file, tht_path))
 
 
 def load_config(osloconf, path):
@@ -2351,8 +3980,7 @@ def check_file_for_enabled_service(env_file):
     :raises CommandError: If the action is not confirmed
     """
     if os.path.exists(env_file):
-        with open(env_file, "r") as f:
-            content = yaml.safe_load(f)
+        content = yaml_utils.load_file(env_file)
         deprecated_services_enabled = []
         for service in constants.DEPRECATED_SERVICES.keys():
             try:
@@ -2478,7 +4106,7 @@ def get_status_yaml(stack_name):
 def update_deployment_status(stack_name, status):
     """Update the deployment status."""
 
-    contents = yaml.safe_dump(
+    contents = yaml_utils.safe_dump(
         {'deployment_status': status},
         default_flow_style=False)
 
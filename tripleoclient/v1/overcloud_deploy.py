@@ -27,7 +27,6 @@ import six
 import subprocess
 import tempfile
 import time
-import yaml
 
 from heatclient.common import template_utils
 from keystoneauth1.exceptions.catalog import EndpointNotFound
@@ -41,10 +40,12 @@ from tripleo_common.utils import plan as plan_utils
 from tripleoclient import command
 from tripleoclient import constants
 from tripleoclient import exceptions
+from tripleoclient import profiling
 from tripleoclient import utils
 from tripleoclient.workflows import deployment
 from tripleoclient.workflows import parameters as workflow_params
 from tripleoclient.workflows import roles
+from tripleoclient import yaml_utils
 
 CONF = cfg.CONF
 
@@ -77,7 +78,7 @@ class DeployOvercloud(command.Command):
     def _update_args_from_answers_file(self, args):
         if args.answers_file is not None:
             with open(args.answers_file, 'r') as answers_file:
-                answers = yaml.safe_load(answers_file)
+                answers = yaml_utils.safe_load(answers_file)
 
             if args.templates is None:
                 args.templates = answers['templates']
@@ -110,9 +111,10 @@ class DeployOvercloud(command.Command):
         _, env = utils.process_multiple_environments(
             env_files, tht_root, user_tht_root,
             cleanup=(not args.no_cleanup))
-        image_params = kolla_builder.container_images_prepare_multi(
-            env, roles.get_roles_data(args.roles_file,
-                                      tht_root), dry_run=True)
+        with profiling.phase('container image prepare'):
+            image_params = kolla_builder.container_images_prepare_multi(
+                env, roles.get_roles_data(args.roles_file,
+                                          tht_root), dry_run=True)
         if image_params:
             parameters.update(image_params)
 
@@ -146,7 +148,7 @@ class DeployOvercloud(command.Command):
 
     def _get_ctlplane_attrs(self):
         try:
-            conn = openstack.connect('undercloud')
+            conn = utils.get_undercloud_connection()
         except openstack.exceptions.ConfigException:
             return dict()
 
@@ -245,7 +247,7 @@ class DeployOvercloud(command.Command):
                                 container_name):
         # We write the env_map to the local /tmp tht_root and also
         # to the swift plan container.
-        contents = yaml.safe_dump(env_map, default_flow_style=False)
+        contents = yaml_utils.safe_dump(env_map, default_flow_style=False)
         user_env_path = self._user_env_path(abs_env_path, tht_root)
         self.log.debug("user_env_path=%s" % user_env_path)
         with open(user_env_path, 'w') as f:
@@ -274,6 +276,8 @@ class DeployOvercloud(command.Command):
         template_files, template = template_utils.get_template_contents(
             template_file=template_path)
         files = dict(list(template_files.items()) + list(env_files.items()))
+        files = utils.prune_stack_files(template, files, env,
+                                        env_files_tracker)
 
         # Fix if required
         # workflow_params.check_deprecated_parameters(self.clients, stack_name)
@@ -292,7 +296,7 @@ class DeployOvercloud(command.Command):
         self.log.debug("Creating temporary templates tree in %s"
                        % new_tht_root)
         try:
-            shutil.copytree(tht_root, new_tht_root, symlinks=True)
+            utils.copy_templates_tree(tht_root, new_tht_root)
             utils.jinja_render_files(self.log, parsed_args.templates,
                                      new_tht_root,
                                      parsed_args.roles_file,
@@ -301,8 +305,10 @@ class DeployOvercloud(command.Command):
             self._deploy_tripleo_heat_templates(stack, parsed_args,
                                                 new_tht_root, tht_root)
         finally:
-            utils.archive_deploy_artifacts(self.log, parsed_args.stack,
-                                           new_tht_root)
+            utils.archive_deploy_artifacts(
+                self.log, parsed_args.stack, new_tht_root,
+                compression=parsed_args.artifact_compression,
+                store=parsed_args.artifact_store)
             if parsed_args.no_cleanup:
                 self.log.warning("Not cleaning temporary directory %s"
                                  % tht_tmp)
@@ -329,8 +335,10 @@ class DeployOvercloud(command.Command):
                 parsed_args.environment_directories))
 
         parameters = {}
-        parameters.update(self._update_parameters(
-            parsed_args, stack, tht_root, user_tht_root))
+        with profiling.phase('update parameters'):
+            parameters.update(self._update_parameters(
+                parsed_args, stack, tht_root, user_tht_root))
+            profiling.annotate(parameters=len(parameters))
         param_env = self._create_parameters_env(
             parameters, tht_root, parsed_args.stack)
         created_env_files.extend(param_env)
@@ -531,13 +539,16 @@ class DeployOvercloud(command.Command):
                 "Error: The following environment directories were not found"
                 ": {0}".format(", ".join(nonexisting_dirs)))
 
+    @profiling.phase('provision baremetal')
     def _provision_baremetal(self, parsed_args, tht_root):
 
         if not parsed_args.baremetal_deployment:
             return []
 
-        with open(parsed_args.baremetal_deployment, 'r') as fp:
-            roles = yaml.safe_load(fp)
+        roles = yaml_utils.load_file(parsed_args.baremetal_deployment)
+        profiling.annotate(
+            roles=len(roles),
+            nodes=sum(role.get('count', 1) for role in roles))
 
         key = self.get_key_pair(parsed_args)
         with open('{}.pub'.format(key), 'rt') as fp:
@@ -566,7 +577,7 @@ class DeployOvercloud(command.Command):
             )
 
         with open(output_path, 'r') as fp:
-            parameter_defaults = yaml.safe_load(fp)
+            parameter_defaults = yaml_utils.safe_load(fp)
 
         # TODO(sbaker) Remove this call when it is no longer necessary
         # to write to a swift object
@@ -578,13 +589,35 @@ class DeployOvercloud(command.Command):
 
         return [output_path]
 
+    def _write_deploy_trace(self, parsed_args, start, status):
+        """Write the phases of the deployment and print their summary"""
+
+        phases = profiling.get_phases(since=start)
+        trace_path = profiling.get_deploy_trace_path(
+            parsed_args.stack,
+            parsed_args.output_dir or constants.DEFAULT_WORK_DIR)
+        try:
+            profiling.write_deploy_trace(
+                trace_path, phases,
+                stack=parsed_args.stack,
+                status=status)
+        except (IOError, OSError) as e:
+            self.log.warning('Unable to write the deploy trace to %s: %s' %
+                             (trace_path, e))
+
+        table = PrettyTable(['Phase', 'Duration', 'Outcome', 'Details'])
+        table.align = 'l'
+        for row in profiling.phase_summary(phases):
+            table.add_row(row)
+        print(table)
+
+    @profiling.phase('unprovision baremetal')
     def _unprovision_baremetal(self, parsed_args):
 
         if not parsed_args.baremetal_deployment:
             return
 
-        with open(parsed_args.baremetal_deployment, 'r') as fp:
-            roles = yaml.safe_load(fp)
+        roles = yaml_utils.load_file(parsed_args.baremetal_deployment)
 
         with utils.TempDirs() as tmp:
             utils.run_ansible_playbook(
@@ -692,6 +725,24 @@ class DeployOvercloud(command.Command):
             '--no-cleanup', action='store_true',
             help=_('Don\'t cleanup temporary files, just log their location')
         )
+        parser.add_argument(
+            '--artifact-compression',
+            choices=sorted(constants.ARTIFACT_COMPRESSION),
+            default=constants.DEFAULT_ARTIFACT_COMPRESSION,
+            help=_('Compression of the deployment artifacts tarball. A '
+                   'multi-threaded compressor (lbzip2 or pbzip2, pigz, '
+                   'zstd) is used when installed.')
+        )
+        parser.add_argument(
+            '--artifact-store',
+            action='store_true',
+            default=False,
+            help=_('Save the deployment artifacts in a content addressed '
+                   'store in %s instead of a tarball, so files unchanged '
+                   'since a previous deployment are only stored once. A '
+                   'manifest of the artifacts is written in place of the '
+                   'tarball.') % constants.ARTIFACT_STORE_DIR
+        )
         parser.add_argument(
             '--update-plan-only',
             action='store_true',
@@ -882,6 +933,16 @@ class DeployOvercloud(command.Command):
             help=_('The number of Ansible forks to use for the'
                    ' config-download ansible-playbook command.')
         )
+        parser.add_argument(
+            '--ansible-profile',
+            action='store_true',
+            default=False,
+            help=_('Record the start and end time of every task on every '
+                   'host of the config-download ansible-playbook command. '
+                   'The timeline is written next to the config-download '
+                   'directory and can be summarized with the '
+                   '"openstack overcloud deploy profile report" command.')
+        )
         parser.add_argument(
             '--disable-container-prepare',
             action='store_true',
@@ -938,7 +999,14 @@ class DeployOvercloud(command.Command):
         start = time.time()
 
         if not parsed_args.config_download_only:
-            self._deploy_tripleo_heat_templates_tmpdir(stack, parsed_args)
+            try:
+                with profiling.phase('deploy templates'):
+                    self._deploy_tripleo_heat_templates_tmpdir(stack,
+                                                               parsed_args)
+            except Exception:
+                self._write_deploy_trace(parsed_args, start,
+                                         'DEPLOY_FAILED')
+                raise
 
         # Get a new copy of the stack after stack update/create. If it was
         # a create then the previous stack object would be None.
@@ -948,14 +1016,17 @@ class DeployOvercloud(command.Command):
             # Force fetching of attributes
             stack.get()
             overcloud_endpoint = utils.get_overcloud_endpoint(stack)
-            horizon_url = deployment.get_horizon_url(
-                stack=stack.stack_name)
-            rc_params = utils.get_rc_params(
-                self.orchestration_client,
-                parsed_args.stack)
-
-            rcpath = deployment.create_overcloudrc(
-                stack, rc_params, parsed_args.no_proxy)
+            with profiling.phase('get horizon url'):
+                horizon_url = deployment.get_horizon_url(
+                    stack=stack.stack_name)
+            with profiling.phase('get rc params'):
+                rc_params = utils.get_rc_params(
+                    self.orchestration_client,
+                    parsed_args.stack)
+
+            with profiling.phase('create overcloudrc'):
+                rcpath = deployment.create_overcloudrc(
+                    stack, rc_params, parsed_args.no_proxy)
 
             if parsed_args.config_download:
                 self.log.info("Deploying overcloud configuration")
@@ -1005,7 +1076,8 @@ class DeployOvercloud(command.Command):
                     limit_hosts=utils.playbook_limit_parse(
                         limit_nodes=parsed_args.limit
                     ),
-                    forks=parsed_args.ansible_forks
+                    forks=parsed_args.ansible_forks,
+                    ansible_profile=parsed_args.ansible_profile
                 )
                 deployment.set_deployment_status(
                     stack.stack_name,
@@ -1023,7 +1095,8 @@ class DeployOvercloud(command.Command):
             # endpoints are created with deploy reruns and upgrades
             if (stack_create or parsed_args.force_postconfig
                     and not parsed_args.skip_postconfig):
-                self._deploy_postconfig(stack, parsed_args)
+                with profiling.phase('postconfig'):
+                    self._deploy_postconfig(stack, parsed_args)
 
             # Copy clouds.yaml to the cloud user directory
             user = \
@@ -1035,6 +1108,7 @@ class DeployOvercloud(command.Command):
             print("Overcloud Horizon Dashboard URL: {0}".format(horizon_url))
             print("Overcloud rc file: {0}".format(rcpath))
             print("Overcloud Deployed {0}".format(deploy_message))
+            self._write_deploy_trace(parsed_args, start, deploy_status)
 
             if deploy_status == 'DEPLOY_FAILED':
                 raise(deploy_trace)
@@ -1070,3 +1144,74 @@ class GetDeploymentStatus(command.Command):
             ['Plan Name', 'Deployment Status'])
         table.add_row([plan, status])
         print(table, file=self.app.stdout)
+
+
+class ReportDeploymentProfile(command.Command):
+    """Show the slowest tasks, hosts and steps of a profiled deployment"""
+
+    log = logging.getLogger(__name__ + ".ReportDeploymentProfile")
+
+    def get_parser(self, prog_name):
+        parser = super(ReportDeploymentProfile, self).get_parser(prog_name)
+        parser.add_argument('--plan', '--stack',
+                            help=_('Name of the stack/plan. '
+                                   '(default: overcloud)'),
+                            default='overcloud')
+        parser.add_argument('--output-dir',
+                            default=constants.DEFAULT_WORK_DIR,
+                            help=_('Directory used for saved output by '
+                                   'config-download. (default: %s)') %
+                            constants.DEFAULT_WORK_DIR)
+        parser.add_argument('--profile-file',
+                            default=None,
+                            help=_('Path to an ansible profile timeline. '
+                                   'Overrides the lookup based on --stack '
+                                   'and --output-dir.'))
+        parser.add_argument('--limit',
+                            type=int,
+                            default=10,
+                            help=_('Number of tasks and hosts to show. '
+                                   '(default: 10)'))
+        return parser
+
+    def take_action(self, parsed_args):
+        self.log.debug("take_action(%s)" % parsed_args)
+        profile_path = parsed_args.profile_file
+        if not profile_path:
+            profile_path = profiling.get_ansible_profile_path(
+                stack=parsed_args.plan,
+                output_dir=parsed_args.output_dir
+            )
+
+        if not os.path.isfile(profile_path):
+            raise oscexc.CommandError(
+                'No ansible profile found at {}. Deploy with '
+                '--ansible-profile to record one.'.format(profile_path))
+
+        records = profiling.load_ansible_profile(profile_path)
+        if not records:
+            self.log.info('Ansible profile %s is empty' % profile_path)
+            return
+
+        table = PrettyTable(['Play', 'Task', 'Duration (s)', 'Hosts'])
+        for play, task, duration, hosts in profiling.slowest_tasks(
+                records, limit=parsed_args.limit):
+            table.add_row([play, task, '%.2f' % duration, hosts])
+        print('Slowest tasks', file=self.app.stdout)
+        print(table, file=self.app.stdout)
+
+        table = PrettyTable(
+            ['Host', 'Busy time (s)', 'Tasks', 'Changed', 'Failed'])
+        for host, busy, tasks, changed, failed in profiling.slowest_hosts(
+                records, limit=parsed_args.limit):
+            table.add_row([host, '%.2f' % busy, tasks, changed, failed])
+        print('Slowest hosts', file=self.app.stdout)
+        print(table, file=self.app.stdout)
+
+        table = PrettyTable(
+            ['Step', 'Wall time (s)', 'Critical host', 'Host time (s)'])
+        for play, wall, host, host_time in profiling.step_critical_path(
+                records):
+            table.add_row([play, '%.2f' % wall, host, '%.2f' % host_time])
+        print('Critical path per step', file=self.app.stdout)
+        print(table, file=self.app.stdout)
@@ -13,13 +13,13 @@
 from datetime import datetime
 import logging
 import os.path
-import yaml
 
 from osc_lib.i18n import _
 from osc_lib import utils
 
 from tripleoclient import command
 from tripleoclient import export
+from tripleoclient import yaml_utils
 
 
 class ExportOvercloudCeph(command.Command):
@@ -109,7 +109,7 @@ class ExportOvercloudCeph(command.Command):
         data['parameter_defaults']['CephExternalMultiConfig'] = cephs
         # write the exported data
         with open(output_file, 'w') as f:
-            yaml.safe_dump(data, f, default_flow_style=False)
+            yaml_utils.safe_dump(data, f, default_flow_style=False)
 
         print("Ceph information from %s stack(s) exported to %s." %
               (len(cephs), output_file))
@@ -15,12 +15,16 @@
 
 import abc
 import collections
+from concurrent import futures
 from datetime import datetime
+import hashlib
+import json
 import logging
 import os
 import re
 import subprocess
 import sys
+import time
 
 from glanceclient.common.progressbar import VerboseFileWrapper
 from keystoneauth1.exceptions import catalog as exc_catalog
@@ -35,6 +39,50 @@ from tripleoclient import constants
 from tripleoclient import utils as plugin_utils
 
 
+def _build_environment(image_name, temp_dir, concurrent):
+    """Return the environment of the build of an image.
+
+    The image gets its own temporary directory and, when images are built
+    concurrently, its own diskimage-builder cache directory, so it doesn't
+    share any state with the images built at the same time.
+    """
+    environment = dict(os.environ)
+    environment['TMPDIR'] = os.path.join(temp_dir, 'build-%s' % image_name)
+    if concurrent:
+        environment['DIB_IMAGE_CACHE'] = os.path.join(
+            os.environ.get('DIB_IMAGE_CACHE',
+                           os.path.expanduser('~/.cache/image-create')),
+            image_name)
+    return environment
+
+
+def _build_image(config_files, image_name, output_directory, skip,
+                 environment):
+    """Build a single image of the config files, in a worker process.
+
+    The build runs with the given environment. As the workers are reused
+    and the diskimage-builder wrapper updates os.environ, the environment
+    of the worker is restored once the build is done.
+
+    :returns: Duration of the build in seconds.
+    """
+    saved_environment = dict(os.environ)
+    os.environ.clear()
+    os.environ.update(environment)
+    try:
+        plugin_utils.makedirs(environment['TMPDIR'])
+        start = time.time()
+        build.ImageBuildManager(
+            config_files,
+            output_directory=output_directory,
+            skip=skip,
+            images=[image_name]).build()
+        return time.time() - start
+    finally:
+        os.environ.clear()
+        os.environ.update(saved_environment)
+
+
 class BuildOvercloudImage(command.Command):
     """Build images for the overcloud"""
 
@@ -95,6 +143,18 @@ class BuildOvercloudImage(command.Command):
             help=_("Temporary directory to use when building the images. "
                    "Defaults to $TMPDIR or current directory if unset."),
         )
+        parser.add_argument(
+            "--parallel",
+            dest="parallel",
+            metavar='<count>',
+            type=int,
+            default=1,
+            help=_("Number of images to build concurrently. Each image is "
+                   "built in its own process, with its own temporary "
+                   "directory, and its own diskimage-builder cache "
+                   "directory when built concurrently. Defaults to 1, "
+                   "building the images one after the other."),
+        )
         return parser
 
     def _ensure_packages_installed(self):
@@ -117,7 +177,72 @@ class BuildOvercloudImage(command.Command):
             output_directory=parsed_args.output_directory,
             skip=parsed_args.skip,
             images=parsed_args.image_names)
-        manager.build()
+        self._build_images(manager, parsed_args)
+
+    def _build_images(self, manager, parsed_args):
+        disk_images = manager.load_config_files(manager.DISK_IMAGES) or []
+        builds = collections.OrderedDict()
+        concurrent = parsed_args.parallel > 1
+        with futures.ProcessPoolExecutor(
+                max_workers=max(parsed_args.parallel, 1)) as executor:
+            for image in disk_images:
+                builds[image['imagename']] = (
+                    image.get('arch', tripleo_common.arch.dib_arch()),
+                    executor.submit(
+                        _build_image,
+                        parsed_args.config_files,
+                        image['imagename'],
+                        parsed_args.output_directory,
+                        parsed_args.skip,
+                        _build_environment(image['imagename'],
+                                           parsed_args.temp_dir,
+                                           concurrent)))
+
+        failed = []
+        table = PrettyTable(['Image', 'Architecture', 'Duration', 'Status'])
+        for image_name, (arch, future) in builds.items():
+            try:
+                table.add_row([image_name, arch,
+                               '%.1fs' % future.result(), 'COMPLETE'])
+            except Exception as e:
+                self.log.error('Building image %s failed: %s',
+                               image_name, e)
+                failed.append(image_name)
+                table.add_row([image_name, arch, '-', 'FAILED'])
+        print(table, file=sys.stdout)
+
+        if failed:
+            raise exceptions.CommandError(
+                _('Failed to build images: %s') % ', '.join(failed))
+
+
+class ChunkedFileWrapper(object):
+    """Read a file in chunks of at least chunk_size bytes.
+
+    HTTP clients stream file objects in small blocks, 8KB for http.client,
+    reading multi-GB images in larger chunks saves many system calls.
+    """
+
+    def __init__(self, wrapped, chunk_size):
+        self.wrapped = wrapped
+        self.chunk_size = chunk_size
+
+    def read(self, size=-1):
+        if size is not None and size > 0:
+            size = max(size, self.chunk_size)
+        return self.wrapped.read(size)
+
+    def __iter__(self):
+        return iter(lambda: self.read(self.chunk_size), b'')
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.wrapped.close()
 
 
 class BaseClientAdapter(object):
@@ -125,11 +250,15 @@ class BaseClientAdapter(object):
     log = logging.getLogger(__name__ + ".BaseClientAdapter")
 
     def __init__(self, image_path, progress=False,
-                 update_existing=False, updated=None):
+                 update_existing=False, updated=None,
+                 chunk_size=constants.IMAGE_UPLOAD_CHUNK_SIZE):
         self.progress = progress
         self.image_path = image_path
         self.update_existing = update_existing
         self.updated = updated
+        self.chunk_size = chunk_size
+        # Images uploaded, rather than found up-to-date, by this adapter
+        self.uploaded = set()
 
     @abc.abstractmethod
     def get_image_property(self, image, prop):
@@ -141,8 +270,27 @@ class BaseClientAdapter(object):
                          disk_format='raw', container_format='bare'):
         pass
 
+    def link_image(self, image, properties):
+        """Set properties referencing other images on an uploaded image.
+
+        :returns: The updated image.
+        """
+        return image
+
+    def _report_throughput(self, name, path, start):
+        duration = max(time.time() - start, 0.001)
+        try:
+            size = os.path.getsize(path) / 1024.0 / 1024.0
+        except (IOError, OSError):
+            return
+        print('Image "%s": %.1f MB in %.1f seconds (%.1f MB/s)' %
+              (name, size, duration, size / duration), file=sys.stdout)
+
     def _copy_file(self, src, dest):
-        cmd = 'sudo cp -f "{0}" "{1}"'.format(src, dest)
+        # Share the blocks with the source where the filesystem supports it,
+        # and don't write the holes of sparse raw images.
+        cmd = 'sudo cp -f --reflink=auto --sparse=always "{0}" "{1}"'.format(
+            src, dest)
         self.log.debug(cmd)
         subprocess.check_call(cmd, shell=True)
 
@@ -151,10 +299,63 @@ class BaseClientAdapter(object):
         self.log.debug(cmd)
         subprocess.check_call(cmd, shell=True)
 
+    def _convert_record_path(self, dest):
+        dest = os.path.realpath(dest)
+        return os.path.join(
+            constants.IMAGE_CONVERT_CACHE_DIR,
+            hashlib.sha256(dest.encode('utf-8')).hexdigest() + '.json')
+
+    def _convert_record(self, src, dest):
+        st = os.stat(dest)
+        return {'source': [os.path.realpath(src),
+                           plugin_utils.file_checksum(src, 'sha256')],
+                'raw': [os.path.realpath(dest), st.st_dev, st.st_ino,
+                        st.st_size, st.st_mtime_ns]}
+
+    def _is_converted(self, src, dest):
+        try:
+            with open(self._convert_record_path(dest), 'r') as f:
+                record = json.load(f)
+            return record == self._convert_record(src, dest)
+        except (IOError, OSError, ValueError):
+            return False
+
     def _convert_image(self, src, dest):
-        cmd = 'sudo qemu-img convert -O raw "{0}" "{1}"'.format(src, dest)
+        """Convert a qcow2 image to a sparse raw image.
+
+        The checksum of the source and the identity of the raw image are
+        recorded in IMAGE_CONVERT_CACHE_DIR, the conversion is skipped when
+        neither changed since the last one.
+        """
+        if self._is_converted(src, dest):
+            print('Image file "%s" is already converted from "%s", '
+                  'skipping.' % (dest, src))
+            return
+
+        start = time.time()
+        tmp_dest = dest + '.tmp'
+        cmd = 'sudo qemu-img convert -S 4k -O raw "{0}" "{1}"'.format(
+            src, tmp_dest)
         self.log.debug(cmd)
         subprocess.check_call(cmd, shell=True)
+        self._move_file(tmp_dest, dest)
+
+        st = os.stat(dest)
+        print('Image "%s" converted to raw in %.1f seconds: %.1f MB written, '
+              '%.1f MB virtual size' %
+              (dest, time.time() - start, st.st_blocks * 512 / 1024.0 / 1024.0,
+               st.st_size / 1024.0 / 1024.0), file=sys.stdout)
+
+        record_file = self._convert_record_path(dest)
+        tmp_file = '{}.{}.tmp'.format(record_file, os.getpid())
+        try:
+            plugin_utils.makedirs(constants.IMAGE_CONVERT_CACHE_DIR)
+            with open(tmp_file, 'w') as f:
+                json.dump(self._convert_record(src, dest), f)
+            os.rename(tmp_file, record_file)
+        except (IOError, OSError) as e:
+            self.log.warning('Unable to record the conversion of %s: %s',
+                             src, e)
 
     def _make_dirs(self, path):
         cmd = 'sudo mkdir -m 0775 -p "{0}"'.format(path)
@@ -191,7 +392,7 @@ class BaseClientAdapter(object):
         if self.progress:
             file_descriptor = VerboseFileWrapper(file_descriptor)
 
-        return file_descriptor
+        return ChunkedFileWrapper(file_descriptor, self.chunk_size)
 
 
 class FileImageClientAdapter(BaseClientAdapter):
@@ -284,6 +485,7 @@ class FileImageClientAdapter(BaseClientAdapter):
 
         self._copy_file(src_path, dest_path)
         image = self._get_image(dest_path)
+        self.uploaded.add(image.id)
         print('Image "%s" was copied.' % image.id, file=sys.stdout)
         self._print_image_info(image)
         return image
@@ -300,7 +502,10 @@ class FileImageClientAdapter(BaseClientAdapter):
         if existing_image:
             return existing_image
 
-        return self._upload_image(src_path, dest_path)
+        start = time.time()
+        image = self._upload_image(src_path, dest_path)
+        self._report_throughput(image_file, src_path, start)
+        return image
 
 
 class GlanceClientAdapter(BaseClientAdapter):
@@ -363,11 +568,16 @@ class GlanceClientAdapter(BaseClientAdapter):
             self.client.update_image(image.id, **properties)
         # Refresh image info
         image = self.client.get_image(image.id)
+        self.uploaded.add(image.id)
 
         print('Image "%s" was uploaded.' % image.name, file=sys.stdout)
         self._print_image_info(image)
         return image
 
+    def link_image(self, image, properties):
+        self.client.update_image(image.id, **properties)
+        return self.client.get_image(image.id)
+
     def get_image_property(self, image, prop):
         return getattr(image, prop)
 
@@ -387,13 +597,16 @@ class GlanceClientAdapter(BaseClientAdapter):
         if updated_image:
             return updated_image
 
+        start = time.time()
         with self.read_image_file_pointer(file_path) as data:
-            return self._upload_image(
+            image = self._upload_image(
                     name=glance_name,
                     disk_format=disk_format,
                     container_format=container_format,
                     properties=properties,
                     data=data)
+        self._report_throughput(glance_name, file_path, start)
+        return image
 
 
 class UploadOvercloudImage(command.Command):
@@ -405,7 +618,8 @@ class UploadOvercloudImage(command.Command):
             'progress': parsed_args.progress,
             'image_path': parsed_args.image_path,
             'update_existing': parsed_args.update_existing,
-            'updated': self.updated
+            'updated': self.updated,
+            'chunk_size': parsed_args.chunk_size
         }
         if not parsed_args.local:
             try:
@@ -514,9 +728,41 @@ class UploadOvercloudImage(command.Command):
             help=_("Root directory for image file copy destination when there "
                    "is no image endpoint, or when --local is specified")
         )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=constants.IMAGE_UPLOAD_CONCURRENCY,
+            help=_("Maximum number of images uploaded at the same time. "
+                   "The kernel, ramdisk and overcloud images and the "
+                   "ironic-python-agent files are uploaded concurrently, "
+                   "the overcloud image is linked to its kernel and ramdisk "
+                   "once they are all uploaded. (default: %d)") %
+            constants.IMAGE_UPLOAD_CONCURRENCY
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=constants.IMAGE_UPLOAD_CHUNK_SIZE,
+            help=_("Size in bytes of the chunks image files are read and "
+                   "streamed to the image service in. (default: %d)") %
+            constants.IMAGE_UPLOAD_CHUNK_SIZE
+        )
 
         return parser
 
+    def _copy_agent_files(self, parsed_args):
+        self.adapter.file_create_or_update(
+            os.path.join(parsed_args.image_path,
+                         '%s.kernel' % parsed_args.ipa_name),
+            os.path.join(parsed_args.http_boot, 'agent.kernel')
+        )
+
+        self.adapter.file_create_or_update(
+            os.path.join(parsed_args.image_path,
+                         '%s.initramfs' % parsed_args.ipa_name),
+            os.path.join(parsed_args.http_boot, 'agent.ramdisk')
+        )
+
     def take_action(self, parsed_args):
         self.log.debug("take_action(%s)" % parsed_args)
         self.updated = []
@@ -570,10 +816,22 @@ class UploadOvercloudImage(command.Command):
         if platform:
             properties['tripleo_platform'] = platform
 
-        if parsed_args.image_type is None or parsed_args.image_type == 'os':
-            # vmlinuz and initrd only need to be uploaded for a partition image
-            if not parsed_args.whole_disk:
-                kernel = self.adapter.update_or_upload(
+        upload_os = (parsed_args.image_type is None or
+                     parsed_args.image_type == 'os')
+        upload_ipa = (parsed_args.image_type is None or
+                      parsed_args.image_type == 'ironic-python-agent')
+        # vmlinuz and initrd only need to be uploaded for a partition image
+        partition_image = upload_os and not parsed_args.whole_disk
+
+        # The images are independent until the overcloud image is linked to
+        # its kernel and ramdisk, upload them concurrently and link once
+        # they are all done.
+        uploads = collections.OrderedDict()
+        with futures.ThreadPoolExecutor(
+                max_workers=max(parsed_args.concurrency, 1)) as executor:
+            if partition_image:
+                uploads['kernel'] = executor.submit(
+                    self.adapter.update_or_upload,
                     image_name=image_name,
                     properties=properties,
                     names_func=plugin_utils.overcloud_kernel,
@@ -581,8 +839,8 @@ class UploadOvercloudImage(command.Command):
                     platform=platform,
                     disk_format='aki'
                 )
-
-                ramdisk = self.adapter.update_or_upload(
+                uploads['ramdisk'] = executor.submit(
+                    self.adapter.update_or_upload,
                     image_name=image_name,
                     properties=properties,
                     names_func=plugin_utils.overcloud_ramdisk,
@@ -590,61 +848,46 @@ class UploadOvercloudImage(command.Command):
                     platform=platform,
                     disk_format='ari'
                 )
-
-                overcloud_image = self.adapter.update_or_upload(
-                    image_name=image_name,
-                    properties=dict(
-                        {'kernel_id': kernel.id,
-                         'ramdisk_id': ramdisk.id},
-                        **properties),
-                    names_func=plugin_utils.overcloud_image,
-                    arch=arch,
-                    platform=platform
-                )
-
-                img_kernel_id = self.adapter.get_image_property(
-                    overcloud_image, 'kernel_id')
-                img_ramdisk_id = self.adapter.get_image_property(
-                    overcloud_image, 'ramdisk_id')
-                # check overcloud image links
-                if img_kernel_id is None or img_ramdisk_id is None:
-                    self.log.error('Link of overcloud image %s to its initrd'
-                                   ' or kernel images is MISSING.'
-                                   'You can keep it or fix it manually.' %
-                                   overcloud_image.name)
-                elif (img_kernel_id != kernel.id or
-                      img_ramdisk_id != ramdisk.id):
-                    self.log.error('Link of overcloud image %s to its initrd'
-                                   ' or kernel images leads to OLD image.'
-                                   'You can keep it or fix it manually.' %
-                                   overcloud_image.name)
-
-            else:
-                overcloud_image = self.adapter.update_or_upload(
+            if upload_os:
+                uploads['image'] = executor.submit(
+                    self.adapter.update_or_upload,
                     image_name=image_name,
                     properties=properties,
                     names_func=plugin_utils.overcloud_image,
                     arch=arch,
                     platform=platform
                 )
-
-            self.log.debug("uploading bm images")
-
-        if parsed_args.image_type is None or \
-                parsed_args.image_type == 'ironic-python-agent':
-            self.log.debug("copy agent images to HTTP BOOT dir")
-
-            self.adapter.file_create_or_update(
-                os.path.join(parsed_args.image_path,
-                             '%s.kernel' % parsed_args.ipa_name),
-                os.path.join(parsed_args.http_boot, 'agent.kernel')
-            )
-
-            self.adapter.file_create_or_update(
-                os.path.join(parsed_args.image_path,
-                             '%s.initramfs' % parsed_args.ipa_name),
-                os.path.join(parsed_args.http_boot, 'agent.ramdisk')
-            )
+            if upload_ipa:
+                self.log.debug("copy agent images to HTTP BOOT dir")
+                uploads['agent'] = executor.submit(
+                    self._copy_agent_files, parsed_args)
+        results = dict((k, f.result()) for k, f in uploads.items())
+
+        if partition_image:
+            kernel = results['kernel']
+            ramdisk = results['ramdisk']
+            overcloud_image = results['image']
+            if overcloud_image.id in self.adapter.uploaded:
+                overcloud_image = self.adapter.link_image(
+                    overcloud_image,
+                    {'kernel_id': kernel.id, 'ramdisk_id': ramdisk.id})
+
+            img_kernel_id = self.adapter.get_image_property(
+                overcloud_image, 'kernel_id')
+            img_ramdisk_id = self.adapter.get_image_property(
+                overcloud_image, 'ramdisk_id')
+            # check overcloud image links
+            if img_kernel_id is None or img_ramdisk_id is None:
+                self.log.error('Link of overcloud image %s to its initrd'
+                               ' or kernel images is MISSING.'
+                               'You can keep it or fix it manually.' %
+                               overcloud_image.name)
+            elif (img_kernel_id != kernel.id or
+                  img_ramdisk_id != ramdisk.id):
+                self.log.error('Link of overcloud image %s to its initrd'
+                               ' or kernel images leads to OLD image.'
+                               'You can keep it or fix it manually.' %
+                               overcloud_image.name)
 
         if self.updated:
             print('%s images have been updated, make sure to '
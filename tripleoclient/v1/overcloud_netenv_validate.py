@@ -20,9 +20,9 @@ import os
 import ipaddress
 from osc_lib.i18n import _
 import six
-import yaml
 
 from tripleoclient import command
+from tripleoclient import yaml_utils
 
 
 class ValidateOvercloudNetenv(command.Command):
@@ -42,8 +42,7 @@ class ValidateOvercloudNetenv(command.Command):
     def take_action(self, parsed_args):
         self.log.debug("take_action(%s)" % parsed_args)
 
-        with open(parsed_args.netenv, 'r') as net_file:
-            network_data = yaml.safe_load(net_file)
+        network_data = yaml_utils.load_file(parsed_args.netenv)
 
         cidrinfo = {}
         poolsinfo = {}
@@ -162,7 +161,7 @@ class ValidateOvercloudNetenv(command.Command):
     def NIC_validate(self, resource, path):
         try:
             with open(path, 'r') as nic_file:
-                nic_data = yaml.safe_load(nic_file)
+                nic_data = yaml_utils.safe_load(nic_file)
         except (IOError, OSError):
             self.log.error(
                 'The resource "%s" reference file does not exist: "%s"',
@@ -27,7 +27,6 @@ import sys
 import tempfile
 import time
 import traceback
-import yaml
 
 from cliff import command
 from heatclient.common import template_utils
@@ -37,7 +36,9 @@ from six.moves import configparser
 from tripleoclient import constants
 from tripleoclient import exceptions
 from tripleoclient import heat_launcher
+from tripleoclient import profiling
 from tripleoclient import utils
+from tripleoclient import yaml_utils
 
 from tripleo_common import constants as tc_constants
 from tripleo_common.image import kolla_builder
@@ -92,6 +93,10 @@ class Deploy(command.Command):
     log = logging.getLogger(__name__ + ".Deploy")
     auth_required = False
     heat_pid = None
+    heat_launch = None
+    heat_state_restored = False
+    heat_stack_marker = None
+    heat_stack_operation = 'CREATE'
     tht_render = None
     output_dir = None
     tmp_ansible_dir = None
@@ -175,6 +180,11 @@ class Deploy(command.Command):
             _('The heat stack {0} action is {1}').format(
                 parsed_args.stack, self.stack_action))
 
+    def _get_heat_state_dir(self, parsed_args):
+        """Return the directory the ephemeral heat state is saved into"""
+        return os.path.join(constants.STANDALONE_EPHEMERAL_HEAT_STATE,
+                            parsed_args.stack.lower())
+
     def _get_roles_file_path(self, parsed_args):
         """Return roles_file for the deployment"""
         if not parsed_args.roles_file:
@@ -252,8 +262,7 @@ class Deploy(command.Command):
                                       "or permission denied" %
                                       source_templates_dir)
         if not os.path.exists(self.tht_render):
-            shutil.copytree(source_templates_dir, self.tht_render,
-                            symlinks=True)
+            utils.copy_templates_tree(source_templates_dir, self.tht_render)
 
     def _set_default_plan(self):
         """Populate default plan-environment.yaml."""
@@ -306,7 +315,7 @@ class Deploy(command.Command):
         if os.path.exists(pw_file):
             with open(pw_file) as pf:
                 stack_env['parameter_defaults'].update(
-                    yaml.safe_load(pf.read())['parameter_defaults'])
+                    yaml_utils.safe_load(pf.read())['parameter_defaults'])
 
         if upgrade:
             # Getting passwords that were managed by instack-undercloud so
@@ -386,7 +395,7 @@ class Deploy(command.Command):
         # Write out the password file in yaml for heat.
         # This contains sensitive data so ensure it's not world-readable
         with open(pw_file, 'w') as pf:
-            yaml.safe_dump(stack_env, pf, default_flow_style=False)
+            yaml_utils.safe_dump(stack_env, pf, default_flow_style=False)
         # TODO(cjeanner) drop that once using oslo.privsep
         # Do not forget to re-add os.chmod 0o600 on that one!
         self._set_data_rights(pw_file, user=user)
@@ -495,6 +504,11 @@ class Deploy(command.Command):
                 parsed_args.heat_container_image,
                 parsed_args.heat_user)
 
+        if (parsed_args.heat_persist_state and
+                not parsed_args.force_stack_create):
+            self.heat_state_restored = self.heat_launch.restore_state(
+                self._get_heat_state_dir(parsed_args))
+
         # NOTE(dprince): we launch heat with fork exec because
         # we don't want it to inherit our args. Launching heat
         # as a "library" would be cool... but that would require
@@ -584,8 +598,7 @@ class Deploy(command.Command):
             if env_file.endswith('-stack-vstate-dropin.yaml'):
                 continue
 
-            with open(env_file, 'r') as f:
-                data = yaml.safe_load(f.read())
+            data = yaml_utils.load_file(env_file)
 
             if data is None or data.get('parameter_defaults') is None:
                 continue
@@ -635,8 +648,7 @@ class Deploy(command.Command):
         # Include any environments from the plan-environment.yaml
         plan_env_path = utils.rel_or_abs_path(
             self._get_plan_env_file_path(parsed_args), self.tht_render)
-        with open(plan_env_path, 'r') as f:
-            plan_env_data = yaml.safe_load(f)
+        plan_env_data = yaml_utils.load_file(plan_env_path)
         environments = [utils.rel_or_abs_path(e.get('path'), self.tht_render)
                         for e in plan_env_data.get('environments', {})]
 
@@ -701,8 +713,8 @@ class Deploy(command.Command):
         )
 
         with open(maps_file, 'w') as env_file:
-            yaml.safe_dump({'parameter_defaults': tmp_env}, env_file,
-                           default_flow_style=False)
+            yaml_utils.safe_dump({'parameter_defaults': tmp_env}, env_file,
+                                 default_flow_style=False)
         environments.append(maps_file)
 
         # NOTE(aschultz): this doesn't get copied into tht_root but
@@ -719,7 +731,7 @@ class Deploy(command.Command):
                                            '%s-stack-vstate-dropin.yaml' %
                                            parsed_args.stack)
         with open(stack_vstate_dropin, 'w') as dropin_file:
-            yaml.safe_dump(
+            yaml_utils.safe_dump(
                 {'parameter_defaults': {
                     'RootStackName': parsed_args.stack.lower(),
                     'StackAction': self.stack_action,
@@ -729,6 +741,7 @@ class Deploy(command.Command):
 
         return environments + user_environments
 
+    @profiling.phase('container image prepare')
     def _prepare_container_images(self, env, roles_data):
         image_params = kolla_builder.container_images_prepare_multi(
             env, roles_data, dry_run=True)
@@ -778,7 +791,7 @@ class Deploy(command.Command):
             roles_file_path = os.path.join(
                 self.tht_render, 'roles-data-override.yaml')
             with open(roles_file_path, "w") as f:
-                f.write(yaml.safe_dump(roles_data))
+                f.write(yaml_utils.safe_dump(roles_data))
             # Redo the dance
             environments = self._setup_heat_environments(
                 roles_file_path, networks_file_path, parsed_args)
@@ -796,6 +809,7 @@ class Deploy(command.Command):
             template_utils.get_template_contents(template_path)
 
         files = dict(list(template_files.items()) + list(env_files.items()))
+        files = utils.prune_stack_files(template, files, env)
 
         stack_name = parsed_args.stack
 
@@ -814,6 +828,19 @@ class Deploy(command.Command):
         if parsed_args.timeout:
             stack_args['timeout_mins'] = parsed_args.timeout
 
+        stack = None
+        if self.heat_state_restored:
+            stack = utils.get_stack(orchestration_client, stack_name)
+        if stack:
+            # The heat state restored from a previous run already has the
+            # stack, only the changed resources need to be updated.
+            self.heat_stack_operation = 'UPDATE'
+            self.heat_stack_marker = utils.get_stack_event_marker(
+                orchestration_client, stack_name)
+            self.log.warning(_("** Performing Heat stack update.. **"))
+            orchestration_client.stacks.update(stack.id, **stack_args)
+            return "%s/%s" % (stack_name, stack.id)
+
         self.log.warning(_("** Performing Heat stack create.. **"))
         stack = orchestration_client.stacks.create(**stack_args)
         if not stack:
@@ -894,7 +921,7 @@ class Deploy(command.Command):
         self._create_working_dirs(stack_name.lower())
         output = {'parameter_defaults': outputs}
         with open(endpointmap_file, 'w') as f:
-            yaml.safe_dump(output, f, default_flow_style=False)
+            yaml_utils.safe_dump(output, f, default_flow_style=False)
         return output
 
     def get_parser(self, prog_name):
@@ -1049,6 +1076,24 @@ class Deploy(command.Command):
                    'after the command is run.'),
 
         )
+        parser.add_argument(
+            '--artifact-compression',
+            choices=sorted(constants.ARTIFACT_COMPRESSION),
+            default=constants.DEFAULT_ARTIFACT_COMPRESSION,
+            help=_('Compression of the deployment artifacts tarball. A '
+                   'multi-threaded compressor (lbzip2 or pbzip2, pigz, '
+                   'zstd) is used when installed.')
+        )
+        parser.add_argument(
+            '--artifact-store',
+            action='store_true',
+            default=False,
+            help=_('Save the deployment artifacts in a content addressed '
+                   'store in %s instead of a tarball, so files unchanged '
+                   'since a previous deployment are only stored once. A '
+                   'manifest of the artifacts is written in place of the '
+                   'tarball.') % constants.ARTIFACT_STORE_DIR
+        )
         parser.add_argument(
             '--hieradata-override', nargs='?',
             help=_('Path to hieradata override file. When it points to a heat '
@@ -1072,6 +1117,18 @@ class Deploy(command.Command):
                    'openstack stack list\n '
                    'where 8006 is the port specified by --heat-api-port.')
         )
+        parser.add_argument(
+            '--heat-persist-state',
+            action='store_true',
+            default=False,
+            help=_('Save the ephemeral Heat database in %s once the stack '
+                   'operation is complete and restore it on the next run, '
+                   'so the next run is a real Heat stack update which only '
+                   'changes the modified resources. Ignored with '
+                   '--force-stack-create, in which case the stack is '
+                   'created from scratch and its state saved '
+                   'again.') % constants.STANDALONE_EPHEMERAL_HEAT_STATE
+        )
         parser.add_argument(
             '--inflight-validations',
             action='store_true',
@@ -1159,7 +1216,7 @@ class Deploy(command.Command):
             self.log.error(msg)
             raise exceptions.DeploymentError(msg)
 
-        hiera_data = yaml.safe_load(data)
+        hiera_data = yaml_utils.safe_load(data)
         if not hiera_data:
             msg = (_('Unsupported data format in hieradata override %s') %
                    target)
@@ -1177,7 +1234,7 @@ class Deploy(command.Command):
                           'legacy format into a file %s' %
                           hiera_override_file)
             with open(hiera_override_file, 'w') as override:
-                yaml.safe_dump(
+                yaml_utils.safe_dump(
                     {'parameter_defaults': {
                      extra_config_var: hiera_data}},
                     override,
@@ -1246,6 +1303,7 @@ class Deploy(command.Command):
         self._set_default_plan()
 
         is_complete = False
+        stack_ready = False
         try:
             # NOTE(bogdando): Look for the unique virtual update mark matching
             # the heat stack name we are going to create below. If found the
@@ -1262,17 +1320,27 @@ class Deploy(command.Command):
             # Wait for heat to be ready.
             utils.wait_api_port_ready(parsed_args.heat_api_port)
             # Deploy TripleO Heat templates.
+            stack_start = time.time()
             stack_id = \
                 self._deploy_tripleo_heat_templates(orchestration_client,
                                                     parsed_args)
 
             # Wait for complete..
-            status = utils.wait_for_stack_ready(orchestration_client, stack_id,
-                                                nested_depth=6)
+            status = utils.wait_for_stack_ready(
+                orchestration_client, stack_id,
+                marker=self.heat_stack_marker,
+                action=self.heat_stack_operation,
+                nested_depth=6)
+            self.log.info(
+                _('Heat stack %(action)s took %(time).1f seconds') %
+                {'action': self.heat_stack_operation,
+                 'time': time.time() - stack_start})
             if not status:
-                message = _("Stack create failed")
+                message = _("Stack %s failed") % (
+                    self.heat_stack_operation.lower())
                 self.log.error(message)
                 raise exceptions.DeploymentError(message)
+            stack_ready = True
 
             # download the ansible playbooks and execute them.
             depl_python = utils.get_deployment_python_interpreter(parsed_args)
@@ -1351,13 +1419,18 @@ class Deploy(command.Command):
         finally:
             if not parsed_args.keep_running:
                 self._kill_heat(parsed_args)
+                if parsed_args.heat_persist_state and stack_ready:
+                    self.heat_launch.save_state(
+                        self._get_heat_state_dir(parsed_args))
             tar_filename = \
                 utils.archive_deploy_artifacts(
                     self.log,
                     parsed_args.stack.lower(),
                     self.tht_render,
                     self.tmp_ansible_dir,
-                    self.output_dir)
+                    self.output_dir,
+                    compression=parsed_args.artifact_compression,
+                    store=parsed_args.artifact_store)
 
             if self.ansible_dir:
                 self._dump_ansible_errors(
@@ -24,12 +24,12 @@ from cliff.formatters import table
 from osc_lib import exceptions as oscexc
 from osc_lib.i18n import _
 from osc_lib import utils
-import yaml
 
 from tripleoclient import command
 from tripleoclient import constants
 from tripleoclient import utils as oooutils
 from tripleoclient.workflows import baremetal
+from tripleoclient import yaml_utils
 
 # NOTE(cloudnull): V1 imports, These classes will be removed as they're
 #                  converted from mistral to ansible.
@@ -262,7 +262,7 @@ class ProvisionNode(command.Command):
         self.log.debug("take_action(%s)" % parsed_args)
 
         with open(parsed_args.input, 'r') as fp:
-            roles = yaml.safe_load(fp)
+            roles = yaml_utils.safe_load(fp)
 
         key = self.get_key_pair(parsed_args)
         with open('{}.pub'.format(key), 'rt') as fp:
@@ -330,7 +330,7 @@ class UnprovisionNode(command.Command):
         self.log.debug("take_action(%s)" % parsed_args)
 
         with open(parsed_args.input, 'r') as fp:
-            roles = yaml.safe_load(fp)
+            roles = yaml_utils.safe_load(fp)
 
         with oooutils.TempDirs() as tmp:
             unprovision_confirm = os.path.join(tmp, 'unprovision_confirm.json')
@@ -17,7 +17,6 @@ import collections
 import os
 import re
 import uuid
-import yaml
 
 import six
 
@@ -32,6 +31,7 @@ from tripleo_common.image.builder import buildah
 from tripleoclient import command
 from tripleoclient import constants
 from tripleoclient import utils
+from tripleoclient import yaml_utils
 
 
 CONF = cfg.CONF
@@ -54,6 +54,8 @@ class Build(command.Command):
     identified_images = list()
     image_parents = collections.OrderedDict()
     image_paths = dict()
+    # (path, root directory, index) of the last tcib config tree indexed
+    _config_index = None
 
     def get_parser(self, prog_name):
         parser = super(Build, self).get_parser(prog_name)
@@ -243,13 +245,43 @@ class Build(command.Command):
         # what results should be acceptable as a regex to build one image
         return imagename
 
-    def build_tree(self, path, tree=""):
-        content = []
-        path = os.path.join(path, tree)
+    def index_config(self, path):
+        """Walk a tcib config tree once and index its directories.
+
+        The index is kept for the following calls with the same path, so
+        the tree, the identified images and the config of every image are
+        all looked up from a single walk.
+
+        :param path: Directory path to traverse.
+        :type path: String.
+        :returns: Tuple of the root directory and an OrderedDict of the
+                  sub directories and sorted yaml files of every directory,
+                  in walk order.
+        """
+
+        # Parents are looked up above the root of the tree, which needs an
+        # absolute path.
+        path = os.path.abspath(path)
+        if self._config_index and self._config_index[0] == path:
+            return self._config_index[1], self._config_index[2]
+
+        root_dir = None
+        index = collections.OrderedDict()
+        for root, dirs, files in os.walk(path):
+            if root_dir is None:
+                root_dir = root
+            index[root] = (
+                list(dirs),
+                sorted(i for i in files if i.endswith(("yaml", "yml")))
+            )
+        self._config_index = (path, root_dir, index)
+        return root_dir, index
 
-        (cur_path, children, _) = next(os.walk(path))
+    def _tree_node(self, index, node_path, tree):
+        content = []
+        children = index.get(node_path, ([], []))[0]
         for child in children:
-            val = self.build_tree(cur_path, child)
+            val = self._tree_node(index, os.path.join(node_path, child), child)
             if val:
                 content.append(val)
 
@@ -261,17 +293,45 @@ class Build(command.Command):
 
         return tree
 
+    def build_tree(self, path, tree=""):
+        root_dir, index = self.index_config(path)
+        if tree:
+            root_dir = os.path.join(root_dir, tree)
+        return self._tree_node(index, root_dir, tree)
+
     def index_images(self, path):
-        for root, __, files in os.walk(path):
-            if [i for i in files if i.endswith(("yaml", "yml"))]:
+        __, index = self.index_config(path)
+        for root, (__, yaml_files) in index.items():
+            if yaml_files:
                 self.identified_images.append(os.path.basename(root))
 
+    def _find_parent(self, index, image_dir, base_image):
+        """Return the name of the closest parent directory with configs."""
+
+        base_dir = image_dir
+        while base_dir != os.sep:
+            parent_dir = os.path.dirname(base_dir)
+            if not parent_dir or parent_dir == base_dir:
+                break
+            base_dir = parent_dir
+            if base_dir in index:
+                base_files = index[base_dir][1]
+            else:
+                base_files = [
+                    i
+                    for i in os.listdir(base_dir)
+                    if i.endswith(("yaml", "yml"))
+                ]
+            if base_files:
+                return os.path.basename(base_dir)
+        return base_image
+
     def find_image(self, name, path, base_image):
         """Find an image and load its config.
 
-        This will traverse a directory structure looking for an image
-        directory, when found all configs will be loaded lexically and
-        returned a single Dictionary.
+        This will look for an image directory in the index of the config
+        tree, when found all configs will be loaded lexically and returned
+        a single Dictionary.
 
         :param name: Container name.
         :type name: String.
@@ -283,36 +343,23 @@ class Build(command.Command):
         """
 
         container_vars = dict()
-        for root, dirs, files in os.walk(path):
-            if os.path.basename(root) == name:
-                for file_name in sorted(files):
-                    if file_name.endswith(("yaml", "yml")):
-                        _option_file = os.path.join(root, file_name)
-                        self.log.debug(
-                            "reading option file: {}".format(_option_file)
-                        )
-                        with open(_option_file) as f:
-                            _options = yaml.safe_load(f)
-                        if _options:
-                            container_vars.update(_options)
-
-                        base_dir = root
-                        while base_dir != os.sep:
-                            base_dir = os.path.dirname(base_dir)
-                            base_files = [
-                                i
-                                for i in os.listdir(base_dir)
-                                if i.endswith(("yaml", "yml"))
-                            ]
-                            if base_files:
-                                self.image_parents[name] = os.path.basename(
-                                    base_dir
-                                )
-                                break
-                        else:
-                            self.image_parents[name] = base_image
-        else:
-            return container_vars
+        __, index = self.index_config(path)
+        for root, (__, yaml_files) in index.items():
+            if os.path.basename(root) != name or not yaml_files:
+                continue
+            for file_name in yaml_files:
+                _option_file = os.path.join(root, file_name)
+                self.log.debug(
+                    "reading option file: {}".format(_option_file)
+                )
+                with open(_option_file) as f:
+                    _options = yaml_utils.safe_load(f)
+                if _options:
+                    container_vars.update(_options)
+            self.image_parents[name] = self._find_parent(
+                index, root, base_image
+            )
+        return container_vars
 
     def rectify_excludes(self, images_to_prepare):
         """Build a dynamic exclude list.
@@ -446,7 +493,7 @@ class Build(command.Command):
         )
         utils.makedirs(os.path.dirname(tree_file))
         with open(tree_file, "w") as f:
-            yaml.safe_dump(
+            yaml_utils.safe_dump(
                 images_tree, f, default_flow_style=False, width=4096
             )
 
@@ -465,7 +512,7 @@ class Build(command.Command):
                 "Configuration file found: {}".format(self.config_file)
             )
             with open(self.config_file, "r") as f:
-                containers_yaml = yaml.safe_load(f)
+                containers_yaml = yaml_utils.safe_load(f)
 
             for c in containers_yaml["container_images"]:
                 entry = dict(c)
@@ -585,7 +632,7 @@ class Build(command.Command):
             )
             utils.makedirs(os.path.dirname(var_file))
             with open(var_file, "w") as f:
-                yaml.safe_dump(
+                yaml_utils.safe_dump(
                     image_config, f, default_flow_style=False, width=4096
                 )
 
@@ -614,12 +661,12 @@ class Build(command.Command):
                     )
                 else:
                     with open(parsed_args.extra_config) as f:
-                        generation_playbook["vars"] = yaml.safe_load(f)
+                        generation_playbook["vars"] = yaml_utils.safe_load(f)
 
             playdata.append(generation_playbook)
 
             with open(playbook, "w") as f:
-                yaml.safe_dump(
+                yaml_utils.safe_dump(
                     playdata, f, default_flow_style=False, width=4096
                 )
 
@@ -731,7 +778,7 @@ class HotFix(command.Command):
             }
 
             with open(playbook, "w") as f:
-                yaml.safe_dump(
+                yaml_utils.safe_dump(
                     [playdata], f, default_flow_style=False, width=4096
                 )
 
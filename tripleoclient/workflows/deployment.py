@@ -13,9 +13,7 @@
 import copy
 import getpass
 import os
-import yaml
 
-from heatclient.common import event_utils
 from heatclient import exc as heat_exc
 from openstackclient import shell
 from tripleo_common.utils import overcloudrc as rc_utils
@@ -24,7 +22,9 @@ from tripleoclient.constants import ANSIBLE_TRIPLEO_PLAYBOOKS
 from tripleoclient.constants import CLOUD_HOME_DIR
 from tripleoclient.constants import DEFAULT_WORK_DIR
 from tripleoclient import exceptions
+from tripleoclient import profiling
 from tripleoclient import utils
+from tripleoclient import yaml_utils
 
 
 _WORKFLOW_TIMEOUT = 360  # 6 * 60 seconds
@@ -82,11 +82,7 @@ def deploy_and_wait(log, clients, stack, plan_name, verbose_level,
         log.info("Performing Heat stack update")
         # Make sure existing parameters for stack are reused
         # Find the last top-level event to use for the first marker
-        events = event_utils.get_events(orchestration_client,
-                                        stack_id=plan_name,
-                                        event_args={'sort_dir': 'desc',
-                                                    'limit': 1})
-        marker = events[0].id if events else None
+        marker = utils.get_stack_event_marker(orchestration_client, plan_name)
         action = 'UPDATE'
 
     set_deployment_status(plan_name,
@@ -133,6 +129,7 @@ def create_overcloudrc(stack, rc_params, no_proxy='',
     return os.path.abspath(rcpath)
 
 
+@profiling.phase('heat stack deploy')
 def deploy_without_plan(clients, stack, stack_name, template,
                         files, env_files,
                         log):
@@ -145,11 +142,7 @@ def deploy_without_plan(clients, stack, stack_name, template,
         log.info("Performing Heat stack update")
         # Make sure existing parameters for stack are reused
         # Find the last top-level event to use for the first marker
-        events = event_utils.get_events(orchestration_client,
-                                        stack_id=stack_name,
-                                        event_args={'sort_dir': 'desc',
-                                                    'limit': 1})
-        marker = events[0].id if events else None
+        marker = utils.get_stack_event_marker(orchestration_client, stack_name)
         action = 'UPDATE'
 
     set_deployment_status(stack_name,
@@ -212,6 +205,7 @@ def get_overcloud_hosts(stack, ssh_network):
     return ips
 
 
+@profiling.phase('enable ssh admin')
 def get_hosts_and_enable_ssh_admin(stack, overcloud_ssh_network,
                                    overcloud_ssh_user, overcloud_ssh_key,
                                    overcloud_ssh_port_timeout,
@@ -241,6 +235,7 @@ def get_hosts_and_enable_ssh_admin(stack, overcloud_ssh_network,
     """
 
     hosts = get_overcloud_hosts(stack, overcloud_ssh_network)
+    profiling.annotate(hosts=len(hosts))
     if [host for host in hosts if host]:
         enable_ssh_admin(
             stack,
@@ -311,6 +306,7 @@ def enable_ssh_admin(stack, hosts, ssh_user, ssh_key, timeout,
     print("Enabling ssh admin - COMPLETE.")
 
 
+@profiling.phase('config download')
 def config_download(log, clients, stack, ssh_network='ctlplane',
                     output_dir=None, override_ansible_cfg=None,
                     timeout=600, verbosity=0, deployment_options=None,
@@ -318,7 +314,8 @@ def config_download(log, clients, stack, ssh_network='ctlplane',
                     ansible_playbook_name='deploy_steps_playbook.yaml',
                     limit_hosts=None, extra_vars=None, inventory_path=None,
                     ssh_user='tripleo-admin', tags=None, skip_tags=None,
-                    deployment_timeout=None, forks=None):
+                    deployment_timeout=None, forks=None,
+                    ansible_profile=False):
     """Run config download.
 
     :param log: Logging object
@@ -377,6 +374,13 @@ def config_download(log, clients, stack, ssh_network='ctlplane',
     :param deployment_timeout: Deployment timeout in minutes.
     :type deployment_timeout: Integer
 
+    :param forks: Number of ansible forks.
+    :type forks: Integer
+
+    :param ansible_profile: Record the per task and per host timing of the
+                            deployment playbook next to the config-download
+                            directory.
+    :type ansible_profile: Boolean
     """
 
     def _log_and_print(message, logger, level='info', print_msg=True):
@@ -413,44 +417,45 @@ def config_download(log, clients, stack, ssh_network='ctlplane',
         else:
             skip_tags = 'opendev-validation'
 
-    with utils.TempDirs() as tmp:
+    with utils.AnsibleSession() as session:
         utils.run_ansible_playbook(
             playbook='cli-grant-local-access.yaml',
             inventory='localhost,',
-            workdir=tmp,
+            workdir=session.workdir,
             playbook_dir=ANSIBLE_TRIPLEO_PLAYBOOKS,
             verbosity=verbosity,
             extra_vars={
                 'access_path': output_dir,
                 'execution_user': getpass.getuser()
-            }
+            },
+            session=session
         )
 
-    _log_and_print(
-        message='Checking for blacklisted hosts from stack: {}'.format(
-            stack.stack_name
-        ),
-        logger=log,
-        print_msg=(verbosity == 0)
-    )
-    if not limit_hosts:
-        blacklist_show = stack.output_show('BlacklistedHostnames')
-        blacklist_stack_output = blacklist_show.get('output', dict())
-        blacklist_stack_output_value = blacklist_stack_output.get(
-            'output_value')
-        if blacklist_stack_output_value:
-            limit_hosts = (
-                ':'.join(['!{}'.format(i) for i in blacklist_stack_output_value
-                          if i]))
-
-    key_file = utils.get_key(stack.stack_name)
-    python_interpreter = deployment_options.get('ansible_python_interpreter')
+        _log_and_print(
+            message='Checking for blacklisted hosts from stack: {}'.format(
+                stack.stack_name
+            ),
+            logger=log,
+            print_msg=(verbosity == 0)
+        )
+        if not limit_hosts:
+            blacklist_show = stack.output_show('BlacklistedHostnames')
+            blacklist_stack_output = blacklist_show.get('output', dict())
+            blacklist_stack_output_value = blacklist_stack_output.get(
+                'output_value')
+            if blacklist_stack_output_value:
+                limit_hosts = (
+                    ':'.join(['!{}'.format(i)
+                              for i in blacklist_stack_output_value if i]))
+
+        key_file = utils.get_key(stack.stack_name)
+        python_interpreter = deployment_options.get(
+            'ansible_python_interpreter')
 
-    with utils.TempDirs() as tmp:
         utils.run_ansible_playbook(
             playbook='cli-config-download.yaml',
             inventory='localhost,',
-            workdir=tmp,
+            workdir=session.workdir,
             playbook_dir=ANSIBLE_TRIPLEO_PLAYBOOKS,
             verbosity=verbosity,
             extra_vars={
@@ -461,33 +466,51 @@ def config_download(log, clients, stack, ssh_network='ctlplane',
                 'ssh_network': ssh_network,
                 'python_interpreter': python_interpreter,
                 'inventory_path': inventory_path
-            }
+            },
+            session=session
         )
 
-    _log_and_print(
-        message='Executing deployment playbook for stack: {}'.format(
-            stack.stack_name
-        ),
-        logger=log,
-        print_msg=(verbosity == 0)
-    )
+        _log_and_print(
+            message='Executing deployment playbook for stack: {}'.format(
+                stack.stack_name
+            ),
+            logger=log,
+            print_msg=(verbosity == 0)
+        )
 
-    stack_work_dir = os.path.join(output_dir, stack.stack_name)
-    if not inventory_path:
-        inventory_path = os.path.join(stack_work_dir,
-                                      'tripleo-ansible-inventory.yaml')
+        stack_work_dir = os.path.join(output_dir, stack.stack_name)
+        if not inventory_path:
+            inventory_path = os.path.join(stack_work_dir,
+                                          'tripleo-ansible-inventory.yaml')
 
-    if isinstance(ansible_playbook_name, list):
-        playbooks = [os.path.join(stack_work_dir, p)
-                     for p in ansible_playbook_name]
-    else:
-        playbooks = os.path.join(stack_work_dir, ansible_playbook_name)
+        if isinstance(ansible_playbook_name, list):
+            playbooks = [os.path.join(stack_work_dir, p)
+                         for p in ansible_playbook_name]
+            profiling.annotate(playbooks=len(playbooks))
+        else:
+            playbooks = os.path.join(stack_work_dir, ansible_playbook_name)
+            profiling.annotate(playbooks=1)
+
+        if ansible_profile:
+            profile_path = profiling.get_ansible_profile_path(
+                stack=stack.stack_name,
+                output_dir=output_dir
+            )
+            profiling.rotate_ansible_profile(profile_path)
+            _log_and_print(
+                message='Recording ansible profile in: {}'.format(
+                    profile_path
+                ),
+                logger=log,
+                print_msg=(verbosity == 0)
+            )
+        else:
+            profile_path = None
 
-    with utils.TempDirs() as tmp:
         utils.run_ansible_playbook(
             playbook=playbooks,
             inventory=inventory_path,
-            workdir=tmp,
+            workdir=session.workdir,
             playbook_dir=stack_work_dir,
             skip_tags=skip_tags,
             tags=tags,
@@ -503,7 +526,9 @@ def config_download(log, clients, stack, ssh_network='ctlplane',
             },
             extra_vars=extra_vars,
             timeout=deployment_timeout,
-            forks=forks
+            forks=forks,
+            session=session,
+            profile_path=profile_path
         )
 
     _log_and_print(
@@ -551,7 +576,7 @@ def get_deployment_status(clients, stack_name):
 
     try:
         status_yaml = utils.get_status_yaml(stack_name)
-        return yaml.safe_load(status_yaml)['deployment_status']
+        return yaml_utils.safe_load(status_yaml)['deployment_status']
     except Exception:
         return None
 
@@ -13,7 +13,6 @@
 import logging
 import os
 import re
-import yaml
 
 from heatclient.common import template_utils
 from tripleo_common.utils import stack_parameters as stk_parameters
@@ -24,6 +23,7 @@ from tripleoclient.constants import UNUSED_PARAMETER_EXCLUDES_RE
 from tripleoclient import exceptions
 from tripleoclient import utils
 from tripleoclient.workflows import roles
+from tripleoclient import yaml_utils
 
 
 LOG = logging.getLogger(__name__)
@@ -36,8 +36,7 @@ def invoke_plan_env_workflows(clients, stack_name, plan_env_file,
     """Invokes the workflows in plan environment file"""
 
     try:
-        with open(plan_env_file) as pf:
-            plan_env_data = yaml.safe_load(pf.read())
+        plan_env_data = yaml_utils.load_file(plan_env_file)
     except IOError as exc:
         raise exceptions.PlanEnvWorkflowError('File (%s) is not found: '
                                               '%s' % (plan_env_file, exc))
@@ -319,17 +318,16 @@ def check_forbidden_params(log, env_files, forbidden):
 
     for file in env_files:
         if os.path.exists(file):
-            with open(file, 'r') as env_file:
-                contents = yaml.safe_load(env_file)
-                pd = contents.get('parameter_defaults', {})
-                if pd:
-                    # Intersection of values and forbidden params
-                    list_of_keys = []
-                    get_all_keys(pd, list_of_keys)
-                    found_in_pd = list(set(list_of_keys) & set(forbidden))
-
-                    # Combine them without duplicates
-                    matched_params = list(set(matched_params + found_in_pd))
+            contents = yaml_utils.load_file(file)
+            pd = contents.get('parameter_defaults', {})
+            if pd:
+                # Intersection of values and forbidden params
+                list_of_keys = []
+                get_all_keys(pd, list_of_keys)
+                found_in_pd = list(set(list_of_keys) & set(forbidden))
+
+                # Combine them without duplicates
+                matched_params = list(set(matched_params + found_in_pd))
 
     if matched_params:
         raise exceptions.BannedParameters("The following parameters should be "
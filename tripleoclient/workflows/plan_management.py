@@ -11,7 +11,6 @@
 # under the License.
 import logging
 import os
-import yaml
 
 from tripleo_common.actions import plan
 from tripleo_common.utils import plan as plan_utils
@@ -21,6 +20,7 @@ from tripleo_common.utils import template as temputils
 from tripleoclient import constants
 from tripleoclient import exceptions
 from tripleoclient import utils
+from tripleoclient import yaml_utils
 
 LOG = logging.getLogger(__name__)
 # Plan management workflows should generally be quick. However, the creation
@@ -353,7 +353,7 @@ def _upload_file_content(swift_client, container, filename, content):
 
 
 def _load_passwords(swift_client, name):
-    plan_env = yaml.safe_load(swift_client.get_object(
+    plan_env = yaml_utils.safe_load(swift_client.get_object(
         name, constants.PLAN_ENVIRONMENT)[1])
 
     if "passwords" in plan_env:
@@ -369,14 +369,14 @@ def _update_passwords(swift_client, name, passwords):
     # separate environment (https://review.opendev.org/#/c/467909/)
     if passwords:
         try:
-            env = yaml.safe_load(swift_client.get_object(
+            env = yaml_utils.safe_load(swift_client.get_object(
                 name, constants.PLAN_ENVIRONMENT)[1])
             env['passwords'] = passwords
             swiftutils.put_object_string(
                 swift=swift_client,
                 container=name,
                 object_name=constants.PLAN_ENVIRONMENT,
-                contents=yaml.safe_dump(env, default_flow_style=False)
+                contents=yaml_utils.safe_dump(env, default_flow_style=False)
             )
         except Exception as exp:
             # The plan likely has not been migrated to using Swift yet.
@@ -12,13 +12,13 @@
 
 import logging
 
-import yaml
 
 from tripleo_common.actions import plan
 # TODO(cloudnull): Convert to a swiftutils in tripleo-common
 # from tripleo_common.utils import swift as swiftutils
 
 from tripleoclient import utils
+from tripleoclient import yaml_utils
 
 LOG = logging.getLogger(__name__)
 
@@ -26,9 +26,7 @@ LOG = logging.getLogger(__name__)
 def get_roles_data(roles_file, tht_root):
     abs_roles_file = utils.get_roles_file_path(
         roles_file, tht_root)
-    roles_data = None
-    with open(abs_roles_file, 'r') as fp:
-        roles_data = yaml.safe_load(fp)
+    roles_data = yaml_utils.load_file(abs_roles_file)
     return roles_data
 
 
@@ -82,7 +80,7 @@ def list_available_roles(clients, container='overcloud'):
     for obj in obj_client.get_container(container)[-1]:
         name = obj['name']
         if name.startswith('roles/') and name.endswith(('yml', 'yaml')):
-            role_data = yaml.safe_load(
+            role_data = yaml_utils.safe_load(
                 obj_client.get_object(container, name)[-1]
             )
             available_yaml_roles.append(role_data[0])
@@ -13,7 +13,6 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-from heatclient.common import event_utils
 from tripleo_common.actions import scale
 
 from tripleoclient import utils
@@ -75,11 +74,8 @@ def scale_down(log, clients, stack, nodes, timeout=None, verbosity=0,
         verbosity=verbosity,
         deployment_timeout=timeout
     )
-    events = event_utils.get_events(clients.orchestration,
-                                    stack_id=stack.stack_name,
-                                    event_args={'sort_dir': 'desc',
-                                                'limit': 1})
-    marker = events[0].id if events else None
+    marker = utils.get_stack_event_marker(clients.orchestration,
+                                          stack.stack_name)
 
     print('Running scale down')
     context = clients.tripleoclient.create_mistral_context()
@@ -0,0 +1,129 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import collections
+import copy
+import hashlib
+import os
+import threading
+
+import yaml
+
+
+# Use the libyaml bindings when available, they are an order of magnitude
+# faster than the pure python implementation.
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+SafeDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+
+class NoAliasDumper(SafeDumper):
+    """Safe dumper which never emits anchors and aliases."""
+
+    def ignore_aliases(self, data):
+        return True
+
+
+# Number of parsed documents kept by load_file.
+CACHE_ENTRIES = 128
+
+# path -> (mtime, size, inode, digest)
+_STAT_CACHE = dict()
+# digest -> parsed document
+_PARSE_CACHE = collections.OrderedDict()
+_LOCK = threading.Lock()
+
+
+def safe_load(stream):
+    """Parse a YAML document, like yaml.safe_load.
+
+    :param stream: YAML document or file object.
+    :type stream: String or File
+
+    :returns: Parsed document.
+    """
+
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def safe_dump(data, stream=None, aliases=True, **kwargs):
+    """Serialize an object to YAML, like yaml.safe_dump.
+
+    :param data: Object to serialize.
+    :type data: Object
+
+    :param stream: File object to write into. The YAML is returned as a
+                   string when not set.
+    :type stream: File
+
+    :param aliases: Whether anchors and aliases can be used for objects
+                    referenced more than once.
+    :type aliases: Boolean
+
+    :returns: String or None
+    """
+
+    dumper = SafeDumper if aliases else NoAliasDumper
+    return yaml.dump(data, stream, Dumper=dumper, **kwargs)
+
+
+def _digest(content):
+    return hashlib.sha1(content).hexdigest()
+
+
+def load_file(path):
+    """Parse a YAML file, reusing the result of a previous parse.
+
+    Documents are cached by content, a file whose modification time, size
+    and inode didn't change is not even read again. As the same files are
+    loaded by several unrelated steps of a command, a deep copy of the
+    cached document is returned so callers can modify it freely.
+
+    :param path: Path of the YAML file.
+    :type path: String
+
+    :returns: Parsed document.
+    """
+
+    path = os.path.realpath(path)
+    st = os.stat(path)
+    stat_key = (st.st_mtime_ns, st.st_size, st.st_ino)
+    with _LOCK:
+        cached = _STAT_CACHE.get(path)
+        if cached and cached[:3] == stat_key and \
+                cached[3] in _PARSE_CACHE:
+            _PARSE_CACHE.move_to_end(cached[3])
+            return copy.deepcopy(_PARSE_CACHE[cached[3]])
+
+    with open(path, 'rb') as f:
+        content = f.read()
+    digest = _digest(content)
+    with _LOCK:
+        _STAT_CACHE[path] = stat_key + (digest,)
+        data = _PARSE_CACHE.get(digest)
+    if data is None:
+        data = safe_load(content)
+        with _LOCK:
+            _PARSE_CACHE[digest] = data
+            while len(_PARSE_CACHE) > CACHE_ENTRIES:
+                _PARSE_CACHE.popitem(last=False)
+    return copy.deepcopy(data)
+
+
+def clear_cache():
+    """Drop all the documents cached by load_file."""
+
+    with _LOCK:
+        _STAT_CACHE.clear()
+        _PARSE_CACHE.clear()